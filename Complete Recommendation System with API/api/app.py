@@ -1,14 +1,18 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify, render_template_string
 import uuid
 import time
-import contextlib
+import json
+import queue
 from engine.orchestrator import RecOrchestrator
-from data.database import get_conn
+from engine.telemetry import REGISTRY
+from data.database import POOL, pooled_conn
 
 app = Flask(__name__)
 orch = RecOrchestrator()
 
-metrics = {"total_reqs": 0, "errors": 0, "start_time": time.time()}
+# counters/histograms live in the shared thread-safe registry, this just remembers boot time
+metrics = {"start_time": time.time()}
+telemetry = REGISTRY
 
 @app.before_request
 def pre_req():
@@ -18,7 +22,10 @@ def pre_req():
 @app.after_request
 def post_req(resp):
     dur = round((time.time() - request.start) * 1000, 2)
-    metrics["total_reqs"] += 1
+    # label by route pattern, not the raw path, so /recommend/<uid> stays one series
+    labels = {"route": request.url_rule.rule if request.url_rule else "unmatched", "method": request.method, "status": resp.status_code}
+    telemetry.inc("http_requests_total", labels)
+    telemetry.observe("http_request_duration_ms", dur, labels)
     resp.headers['X-Request-Id'] = request.id
     return resp
 
@@ -53,18 +60,47 @@ def health():
 @app.route('/metrics', methods=['GET'])
 def get_metrics():
     up = round(time.time() - metrics["start_time"], 2)
-    return jsonify({"uptime_sec": up, "total_requests": metrics["total_reqs"], "errors": metrics["errors"]}), 200
+    return jsonify({"uptime_sec": up, "total_requests": telemetry.total("http_requests_total"), "errors": telemetry.counter("errors_total"),
+                    "latency_ms": telemetry.summaries("http_request_duration_ms", by=("method", "route", "status")),
+                    "stages_ms": telemetry.summaries("rec_stage_duration_ms", by=("stage",)),
+                    "candidate_sources": {"ms": telemetry.summaries("candidate_source_duration_ms", by=("source",)),
+                                          "items": telemetry.counts("candidate_source_items_total", by=("source", "kind")),
+                                          "failures": telemetry.counts("candidate_source_failures_total", by=("source", "status"))},
+                    "cache": orch.cache.stats(), "coalescing": orch.flights.stats(),
+                    "refresh": {"in_progress": len(orch.refreshing), "scheduled": telemetry.counts("rec_refresh_total", by=("reason",)),
+                                "cancelled": telemetry.counter("rec_refresh_cancelled_total"), "failures": telemetry.counter("rec_refresh_failures_total")},
+                    "experiment": orch.experiment_stats(),
+                    "db_pool": POOL.stats(),
+                    "feedback_writer": orch.writer.stats() if orch.writer else None,
+                    "knowledge_graph": orch.kg.graph.stats() if orch.kg.graph else None}), 200
+
+@app.route('/metrics/prometheus', methods=['GET'])
+def get_metrics_prometheus():
+    return Response(telemetry.to_prometheus(), mimetype="text/plain; version=0.0.4")
+
+def parse_limit(v):
+    # positive int or None, limit=0 would otherwise rank (and cache) an empty list.
+    # query strings come in as "5", json bodies as 5, true / 2.5 are not limits
+    if isinstance(v, bool) or (isinstance(v, float) and not v.is_integer()): return None
+    try:
+        n = int(v)
+    except (TypeError, ValueError):
+        return None
+    return n if n >= 1 else None
 
 @app.route('/recommend/<uid>', methods=['GET'])
 def recommend(uid):
     try:
-        with contextlib.closing(get_conn()) as c:
+        with pooled_conn() as c:
             u = c.execute("SELECT id FROM users WHERE id=?", (uid,)).fetchone()
             if not u:
-                metrics["errors"] += 1
+                telemetry.inc("errors_total")
                 return jsonify({"err": "user not found"}), 404
 
-        limit = int(request.args.get('limit', 5))
+        limit = parse_limit(request.args.get('limit', 5))
+        if limit is None:
+            telemetry.inc("errors_total")
+            return jsonify({"err": "limit must be a positive integer"}), 400
         recs = orch.get_recs(uid, limit)
         
         return jsonify({
@@ -75,20 +111,48 @@ def recommend(uid):
             "recommendations": recs["data"]
         }), 200
     except Exception as e:
-        metrics["errors"] += 1
+        telemetry.inc("errors_total")
         return jsonify({"err": str(e)}), 500
 
+MAX_BATCH = 10_000
+
+@app.route('/recommend/batch', methods=['POST'])
+def recommend_batch():
+    data = request.get_json(silent=True)
+    uids = data.get('user_ids') if isinstance(data, dict) else None
+    if not isinstance(uids, list) or not uids:
+        telemetry.inc("errors_total")
+        return jsonify({"err": "missing user_ids"}), 400
+    if len(uids) > MAX_BATCH:
+        telemetry.inc("errors_total")
+        return jsonify({"err": f"max {MAX_BATCH} user_ids per batch"}), 400
+    
+    if not all(isinstance(u, str) and u.strip() for u in uids):
+        telemetry.inc("errors_total")
+        return jsonify({"err": "user_ids must be non-empty strings"}), 400
+    limit = parse_limit(data.get('limit', 5))
+    if limit is None:
+        telemetry.inc("errors_total")
+        return jsonify({"err": "limit must be a positive integer"}), 400
+    # one json object per line, streamed as each user is scored
+    lines = (json.dumps(r) + "\n" for r in orch.get_recs_batch(uids, limit))
+    return Response(lines, mimetype="application/x-ndjson")
+
 @app.route('/feedback', methods=['POST'])
 def feedback():
     data = request.json
     if not data or 'uid' not in data or 'cid' not in data or 'rating' not in data:
-        metrics["errors"] += 1
+        telemetry.inc("errors_total")
         return jsonify({"err": "missing payload"}), 400
     try:
         orch.add_feedback(data['uid'], data['cid'], float(data['rating']))
         return jsonify({"msg": "feedback logged", "req_id": request.id}), 201
+    except queue.Full:
+        # writer is behind, tell the client to back off instead of piling up
+        telemetry.inc("errors_total")
+        return jsonify({"err": "feedback queue full"}), 503
     except Exception:
-        metrics["errors"] += 1
+        telemetry.inc("errors_total")
         return jsonify({"err": "failed to save"}), 500
 
 if __name__ == '__main__':
@@ -1,9 +1,97 @@
 import sqlite3
+import threading
+import contextlib
+import os
 
-DB_FILE = "rec_sys.db"
+# REC_DB_FILE lets benchmarks / deployments point the app at another file without code changes
+DB_FILE = os.environ.get("REC_DB_FILE", "rec_sys.db")
 
-def get_conn():
+# WAL lets readers run while a writer commits, NORMAL sync is safe under WAL and skips most fsyncs
+PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -64 * 1024, # negative = KiB, so 64MB page cache
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000
+}
+
+def get_conn(check_same_thread=True):
     # standard sqlite connection, row_factory makes it behave like dicts
-    conn = sqlite3.connect(DB_FILE)
+    conn = sqlite3.connect(DB_FILE, check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row 
-    return conn
\ No newline at end of file
+    for k, v in PRAGMAS.items():
+        conn.execute(f"PRAGMA {k}={v}")
+    return conn
+
+class ConnPool:
+    # checkout / return pool of tuned connections. a thread takes an idle connection (or opens one)
+    # for the duration of a pooled_conn block and hands it back after; at most max_idle stay open
+    # between uses and the rest are closed, so connections follow concurrency, not thread churn.
+    # keyed by (db file, pid): a forked worker or a repointed DB_FILE never reuses the old ones
+    def __init__(self, max_idle=8):
+        self.max_idle = max_idle
+        self.lock = threading.Lock()
+        self.key = None
+        self.idle = []
+        self.opened = self.reused = self.closed = 0
+
+    def checkout(self):
+        key = (DB_FILE, os.getpid())
+        with self.lock:
+            if key != self.key:
+                # connections of a parent process belong to it, just let go of them
+                stale = self.idle if self.key and self.key[1] == key[1] else []
+                self.key, self.idle = key, []
+            else:
+                stale = []
+                if self.idle:
+                    self.reused += 1
+                    return key, self.idle.pop()
+            self.opened += 1
+        for c in stale: c.close()
+        # handed between threads by the pool, only ever used by one at a time
+        return key, get_conn(check_same_thread=False)
+
+    def checkin(self, key, conn):
+        if conn.in_transaction: conn.rollback()
+        with self.lock:
+            if key == self.key and len(self.idle) < self.max_idle:
+                self.idle.append(conn)
+                return
+            self.closed += 1
+        conn.close()
+
+    def stats(self):
+        with self.lock:
+            return {"idle": len(self.idle), "max_idle": self.max_idle, "opened": self.opened, "reused": self.reused, "closed": self.closed}
+
+POOL = ConnPool()
+_held = threading.local()
+
+@contextlib.contextmanager
+def pooled_conn():
+    # drop-in for contextlib.closing(get_conn()) backed by POOL. nested blocks in one thread share
+    # the connection they already hold, a failed write is rolled back before it goes back to the pool
+    held = getattr(_held, "conn", None)
+    if held is not None and held[0] == (DB_FILE, os.getpid()):
+        _held.depth += 1
+        try:
+            yield held[1]
+        except Exception:
+            held[1].rollback()
+            raise
+        finally:
+            _held.depth -= 1
+        return
+
+    key, c = POOL.checkout()
+    _held.conn, _held.depth = (key, c), 0
+    try:
+        yield c
+    except Exception:
+        c.rollback()
+        raise
+    finally:
+        _held.conn = None
+        POOL.checkin(key, c)
@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+# batches that still fail after every retry are appended here (one json object per batch) instead of
+# dropped, the api already answered 201 for them. scripts/replay_feedback.py writes them back
+DEAD_LETTER_FILE = os.environ.get("REC_DEAD_LETTER_FILE", "feedback_dead_letter.jsonl")
+
+class FeedbackWriter:
+    # bounded queue + one background thread that writes interactions in batches,
+    # one transaction (and one fsync) per batch instead of per request
+    def __init__(self, repo, max_queue=10_000, batch_size=500, flush_every=0.05, on_flush=None,
+                 retries=3, backoff=0.1, dead_letter=None):
+        self.repo = repo
+        self.batch_size = batch_size
+        self.flush_every = flush_every
+        # a failed batch (e.g. "database is locked" past busy_timeout) is retried after backoff, 2x backoff, ...
+        self.retries = retries
+        self.backoff = backoff
+        self.dead_letter = dead_letter or DEAD_LETTER_FILE
+        # called with the set of uids after their rows are committed (cache invalidation)
+        self.on_flush = on_flush
+        self.q = queue.Queue(maxsize=max_queue)
+        self.stats_lock = threading.Lock()
+        self.written = self.batches = self.failed = self.retried = self.dead_lettered = 0
+        self.closed = False
+        # puts that passed the closed check, close() waits for them so nothing is queued behind its sentinel
+        self.putting = 0
+        self.put_cond = threading.Condition()
+
+        self.thread = threading.Thread(target=self._run, name="feedback-writer", daemon=True)
+        self.thread.start()
+        # daemon thread so it never blocks shutdown, atexit drains whatever is still queued
+        atexit.register(self.close)
+
+    def submit(self, uid, cid, itype, rating, timeout=1.0):
+        # raises queue.Full if the writer cant keep up, callers should shed load
+        with self.put_cond:
+            if self.closed: raise RuntimeError("feedback writer is closed")
+            self.putting += 1
+        try:
+            self.q.put((uid, cid, itype, rating), timeout=timeout)
+        finally:
+            with self.put_cond:
+                self.putting -= 1
+                if not self.putting: self.put_cond.notify_all()
+
+    def _run(self):
+        while True:
+            item = self.q.get()
+            if item is None:
+                self.q.task_done()
+                return
+            batch = [item]
+
+            # keep pulling until the batch is full or the flush window closes
+            deadline = time.time() + self.flush_every
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.q.get(timeout=max(0, deadline - time.time()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._write(batch)
+            for _ in range(len(batch) + stop): self.q.task_done()
+            if stop: return
+
+    def _write(self, batch):
+        for attempt in range(self.retries + 1):
+            try:
+                self.repo.log_interactions(batch)
+                break
+            except Exception as e:
+                if attempt == self.retries:
+                    log.error("feedback batch of %d failed after %d retries, spilling to %s", len(batch), self.retries, self.dead_letter, exc_info=e)
+                    with self.stats_lock: self.failed += len(batch)
+                    self._spill(batch, e)
+                    return
+                log.warning("feedback batch of %d failed (%s), retry %d/%d", len(batch), e, attempt + 1, self.retries)
+                with self.stats_lock: self.retried += 1
+                time.sleep(self.backoff * 2 ** attempt)
+        with self.stats_lock:
+            self.written += len(batch)
+            self.batches += 1
+        if self.on_flush:
+            self.on_flush({r[0] for r in batch})
+
+    def _spill(self, batch, err):
+        try:
+            with open(self.dead_letter, "a") as f:
+                f.write(json.dumps({"ts": time.time(), "error": str(err), "rows": [list(r) for r in batch]}) + "\n")
+            with self.stats_lock: self.dead_lettered += len(batch)
+        except OSError:
+            # nowhere left to put them, at least the rows end up in the log
+            log.exception("could not write dead letter file, lost rows: %r", batch)
+
+    def flush(self):
+        # blocks until everything submitted so far is committed
+        self.q.join()
+
+    def close(self):
+        with self.put_cond:
+            if self.closed: return
+            self.closed = True
+            self.put_cond.wait_for(lambda: not self.putting)
+        self.q.put(None)
+        self.thread.join()
+        # the exit hook holds a reference to us, drop it so closed writers can be collected
+        atexit.unregister(self.close)
+
+    def stats(self):
+        with self.stats_lock:
+            return {"queued": self.q.qsize(), "written": self.written, "batches": self.batches, "failed": self.failed,
+                    "retried": self.retried, "dead_lettered": self.dead_lettered}
+
+def replay_dead_letters(repo, path=None):
+    # writes spilled batches back through log_interactions. whatever didnt go in (db still locked)
+    # is left in the file for the next run, so nothing is written twice
+    path = path or DEAD_LETTER_FILE
+    if not os.path.exists(path): return 0
+    with open(path) as f:
+        lines = [line for line in f if line.strip()]
+    done = rows = 0
+    try:
+        for line in lines:
+            batch = [tuple(r) for r in json.loads(line)["rows"]]
+            repo.log_interactions(batch)
+            done += 1
+            rows += len(batch)
+    finally:
+        if done == len(lines):
+            os.remove(path)
+        else:
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f: f.writelines(lines[done:])
+            os.replace(tmp, path)
+    return rows
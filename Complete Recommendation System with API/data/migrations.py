@@ -0,0 +1,116 @@
+# Ordered schema migrations, tracked with PRAGMA user_version.
+# Each step runs in its own transaction and must be idempotent (IF NOT EXISTS etc)
+# so two workers racing on a fresh db both end up at the same schema.
+# Never edit a released step, append a new one instead.
+
+MIGRATIONS = [
+    (1, "baseline schema", '''
+        CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, name TEXT, interests TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        CREATE TABLE IF NOT EXISTS content (id TEXT PRIMARY KEY, title TEXT, category TEXT, difficulty TEXT, popularity REAL);
+        CREATE TABLE IF NOT EXISTS skills (id TEXT PRIMARY KEY, name TEXT);
+        CREATE TABLE IF NOT EXISTS user_skills (user_id TEXT, skill_id TEXT, proficiency REAL);
+        CREATE TABLE IF NOT EXISTS content_skills (content_id TEXT, skill_id TEXT);
+        CREATE TABLE IF NOT EXISTS interactions (user_id TEXT, content_id TEXT, type TEXT, rating REAL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+    '''),
+    (2, "item co-occurrence table", '''
+        CREATE TABLE IF NOT EXISTS item_cooc (item_id TEXT, neighbor_id TEXT, count REAL, PRIMARY KEY (item_id, neighbor_id));
+    '''),
+    (3, "content version counter", '''
+        CREATE TABLE IF NOT EXISTS app_meta (key TEXT PRIMARY KEY, value INTEGER);
+        INSERT OR IGNORE INTO app_meta (key, value) VALUES ('content_version', 0);
+        
+        -- any write to content bumps the version so cached catalog snapshots know to reload
+        CREATE TRIGGER IF NOT EXISTS content_ver_ins AFTER INSERT ON content BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'content_version'; END;
+        CREATE TRIGGER IF NOT EXISTS content_ver_upd AFTER UPDATE ON content BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'content_version'; END;
+        CREATE TRIGGER IF NOT EXISTS content_ver_del AFTER DELETE ON content BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'content_version'; END;
+    '''),
+    (4, "covering indexes for hot lookups", '''
+        -- per-user history (get_user_hist, log_interaction) answered from the index alone
+        CREATE INDEX IF NOT EXISTS idx_interactions_user ON interactions (user_id, rating, content_id);
+        CREATE INDEX IF NOT EXISTS idx_content_popularity ON content (popularity DESC, id);
+        CREATE INDEX IF NOT EXISTS idx_user_skills_user ON user_skills (user_id, skill_id, proficiency);
+        CREATE INDEX IF NOT EXISTS idx_content_skills_content ON content_skills (content_id, skill_id);
+        CREATE INDEX IF NOT EXISTS idx_content_skills_skill ON content_skills (skill_id, content_id);
+        ANALYZE;
+    '''),
+    (5, "precomputed recommendations", '''
+        -- max_rowid = interactions high-water mark when the row was computed, anything newer makes it stale
+        CREATE TABLE IF NOT EXISTS precomputed_recs (user_id TEXT PRIMARY KEY, recs TEXT, ab_group TEXT, top_n INTEGER,
+                                                     version INTEGER, content_version INTEGER, max_rowid INTEGER, computed_at REAL);
+    '''),
+    (6, "skill version counter", '''
+        -- same idea as content_version: any write to a skill table tells the knowledge graph to rebuild
+        INSERT OR IGNORE INTO app_meta (key, value) VALUES ('skill_version', 0);
+        CREATE TRIGGER IF NOT EXISTS skills_ver_ins AFTER INSERT ON skills BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'skill_version'; END;
+        CREATE TRIGGER IF NOT EXISTS skills_ver_upd AFTER UPDATE ON skills BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'skill_version'; END;
+        CREATE TRIGGER IF NOT EXISTS skills_ver_del AFTER DELETE ON skills BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'skill_version'; END;
+        CREATE TRIGGER IF NOT EXISTS user_skills_ver_ins AFTER INSERT ON user_skills BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'skill_version'; END;
+        CREATE TRIGGER IF NOT EXISTS user_skills_ver_upd AFTER UPDATE ON user_skills BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'skill_version'; END;
+        CREATE TRIGGER IF NOT EXISTS user_skills_ver_del AFTER DELETE ON user_skills BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'skill_version'; END;
+        CREATE TRIGGER IF NOT EXISTS content_skills_ver_ins AFTER INSERT ON content_skills BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'skill_version'; END;
+        CREATE TRIGGER IF NOT EXISTS content_skills_ver_upd AFTER UPDATE ON content_skills BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'skill_version'; END;
+        CREATE TRIGGER IF NOT EXISTS content_skills_ver_del AFTER DELETE ON content_skills BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'skill_version'; END;
+    '''),
+    (7, "precompute freshness inputs", '''
+        -- precomputed_recs is a cache, recreating it is simpler than a non-idempotent ALTER TABLE.
+        -- skill_version = skill graph the row was ranked against, model_version = scoring config / als factors
+        DROP TABLE IF EXISTS precomputed_recs;
+        CREATE TABLE precomputed_recs (user_id TEXT PRIMARY KEY, recs TEXT, ab_group TEXT, top_n INTEGER, version INTEGER,
+                                       content_version INTEGER, skill_version INTEGER, model_version TEXT, max_rowid INTEGER, computed_at REAL);
+        -- a user's own interests feed straight into their recs, drop their row as soon as they change
+        CREATE TRIGGER IF NOT EXISTS precomputed_interests_upd AFTER UPDATE OF interests ON users BEGIN DELETE FROM precomputed_recs WHERE user_id = NEW.id; END;
+    '''),
+    (8, "category version counter", '''
+        -- narrower than content_version: only item adds / removes and category edits, the parts of the content
+        -- table the skill graph reads. popularity updates bump content_version but leave this alone
+        INSERT OR IGNORE INTO app_meta (key, value) VALUES ('category_version', 0);
+        CREATE TRIGGER IF NOT EXISTS category_ver_ins AFTER INSERT ON content BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'category_version'; END;
+        CREATE TRIGGER IF NOT EXISTS category_ver_upd AFTER UPDATE OF category ON content BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'category_version'; END;
+        CREATE TRIGGER IF NOT EXISTS category_ver_del AFTER DELETE ON content BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'category_version'; END;
+    '''),
+    (9, "catalog version + popularity delta", '''
+        -- catalog_version = every content column except popularity, what decides if a serving artifact is still
+        -- the catalog. popularity edits land in popularity_delta instead (rowid = sequence, one row per item),
+        -- so workers overlay the few changed values on the mmapped arrays rather than dropping them
+        INSERT OR IGNORE INTO app_meta (key, value) VALUES ('catalog_version', 0);
+        CREATE TABLE IF NOT EXISTS popularity_delta (item_id TEXT PRIMARY KEY, popularity REAL);
+        CREATE TRIGGER IF NOT EXISTS catalog_ver_ins AFTER INSERT ON content BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'catalog_version'; END;
+        CREATE TRIGGER IF NOT EXISTS catalog_ver_upd AFTER UPDATE OF id, title, category, difficulty ON content BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'catalog_version'; END;
+        CREATE TRIGGER IF NOT EXISTS catalog_ver_del AFTER DELETE ON content BEGIN UPDATE app_meta SET value = value + 1 WHERE key = 'catalog_version'; END;
+        -- replace moves the item to a new, higher rowid, so "rowid > last seen" is everything changed since
+        CREATE TRIGGER IF NOT EXISTS popularity_delta_upd AFTER UPDATE OF popularity ON content BEGIN
+            INSERT OR REPLACE INTO popularity_delta (item_id, popularity) VALUES (NEW.id, NEW.popularity); END;
+    '''),
+    (10, "interaction ids", '''
+        -- the id high-water marks (precompute, serving artifact, als) need ids that only ever grow. a plain rowid
+        -- can be handed out again after the newest rows are deleted, AUTOINCREMENT never reuses one.
+        -- ids keep the old rowids so marks already stored stay valid
+        CREATE TABLE IF NOT EXISTS interactions_v10 (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, content_id TEXT, type TEXT,
+                                                     rating REAL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+        INSERT INTO interactions_v10 (id, user_id, content_id, type, rating, created_at)
+            SELECT rowid, user_id, content_id, type, rating, created_at FROM interactions ORDER BY rowid;
+        DROP TABLE interactions;
+        ALTER TABLE interactions_v10 RENAME TO interactions;
+        CREATE INDEX IF NOT EXISTS idx_interactions_user ON interactions (user_id, rating, content_id);
+        ANALYZE interactions;
+    '''),
+]
+
+LATEST = MIGRATIONS[-1][0]
+
+def current_version(c):
+    return c.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate(c, target=LATEST):
+    # brings an existing db file up to target in place, returns the steps applied
+    applied = []
+    for ver, name, sql in MIGRATIONS:
+        if ver > target or ver <= current_version(c): continue
+        try:
+            # IMMEDIATE takes the write lock up front so concurrent migrators queue instead of deadlocking
+            c.executescript(f"BEGIN IMMEDIATE; {sql}; PRAGMA user_version = {ver}; COMMIT;")
+        except Exception:
+            if c.in_transaction: c.rollback()
+            raise
+        applied.append((ver, name))
+    return applied
@@ -1,39 +1,234 @@
-from data.database import get_conn
-import contextlib
+from data.database import pooled_conn
+from data.migrations import migrate
+import json
+import time
+
+COOC_TOP_N = 50
 
 class MainRepo:
     def __init__(self):
         self.init_db()
         
     def init_db(self):
-        with contextlib.closing(get_conn()) as c:
-            c.executescript('''
-                CREATE TABLE IF NOT EXISTS users (id TEXT PRIMARY KEY, name TEXT, interests TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
-                CREATE TABLE IF NOT EXISTS content (id TEXT PRIMARY KEY, title TEXT, category TEXT, difficulty TEXT, popularity REAL);
-                CREATE TABLE IF NOT EXISTS skills (id TEXT PRIMARY KEY, name TEXT);
-                CREATE TABLE IF NOT EXISTS user_skills (user_id TEXT, skill_id TEXT, proficiency REAL);
-                CREATE TABLE IF NOT EXISTS content_skills (content_id TEXT, skill_id TEXT);
-                CREATE TABLE IF NOT EXISTS interactions (user_id TEXT, content_id TEXT, type TEXT, rating REAL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
-            ''')
-            c.commit()
+        with pooled_conn() as c:
+            # schema lives in data/migrations.py, existing db files are upgraded in place
+            migrate(c)
         
-    def get_user_hist(self, uid):
-        with contextlib.closing(get_conn()) as c:
-            rows = c.execute("SELECT content_id FROM interactions WHERE user_id=? AND rating >= 3", (uid,)).fetchall()
+    def get_user_hist(self, uid, after_id=0):
+        # after_id > 0 = only rows newer than a snapshot (engine.artifact), still answered from the index
+        with pooled_conn() as c:
+            rows = c.execute("SELECT content_id FROM interactions WHERE user_id=? AND rating >= 3 AND id > ?", (uid, after_id)).fetchall()
             return [r['content_id'] for r in rows]
         
+    def get_user_hists(self, uids, after_id=0):
+        # bulk version of get_user_hist, users with no history are left out
+        res = {}
+        uids = list(uids)
+        with pooled_conn() as c:
+            for n in range(0, len(uids), 500):
+                chunk = uids[n:n + 500]
+                rows = c.execute(f"SELECT user_id, content_id FROM interactions WHERE user_id IN ({','.join('?' * len(chunk))}) AND rating >= 3 AND id > ?", chunk + [after_id]).fetchall()
+                for r in rows:
+                    res.setdefault(r['user_id'], []).append(r['content_id'])
+        return res
+
+    def get_user_interests(self, uids):
+        # {uid: raw interests string}, unknown users are left out so this doubles as an existence check
+        res = {}
+        uids = list(uids)
+        with pooled_conn() as c:
+            for n in range(0, len(uids), 500):
+                chunk = uids[n:n + 500]
+                for r in c.execute(f"SELECT id, interests FROM users WHERE id IN ({','.join('?' * len(chunk))})", chunk):
+                    res[r['id']] = r['interests']
+        return res
+        
+    def get_user_skills(self, uids):
+        # {uid: [(skill name, proficiency)]}, users without skills are left out
+        res = {}
+        uids = list(uids)
+        with pooled_conn() as c:
+            for n in range(0, len(uids), 500):
+                chunk = uids[n:n + 500]
+                for r in c.execute(f"""SELECT us.user_id, COALESCE(s.name, us.skill_id) AS skill, us.proficiency FROM user_skills us
+                                       LEFT JOIN skills s ON s.id = us.skill_id
+                                       WHERE us.user_id IN ({','.join('?' * len(chunk))}) ORDER BY us.user_id, skill""", chunk):
+                    res.setdefault(r['user_id'], []).append((r['skill'], r['proficiency']))
+        return res
+
+    def get_skill_graph_rows(self):
+        # inputs for engine.knowledge_graph: (content_id, category, skill) and (user_id, skill, proficiency)
+        with pooled_conn() as c:
+            content_rows = c.execute("""SELECT cs.content_id, c.category, COALESCE(s.name, cs.skill_id) FROM content_skills cs
+                                        LEFT JOIN content c ON c.id = cs.content_id
+                                        LEFT JOIN skills s ON s.id = cs.skill_id""").fetchall()
+            user_rows = c.execute("""SELECT us.user_id, COALESCE(s.name, us.skill_id), us.proficiency FROM user_skills us
+                                     LEFT JOIN skills s ON s.id = us.skill_id""").fetchall()
+            return [tuple(r) for r in content_rows], [tuple(r) for r in user_rows]
+
+    def get_skill_graph_version(self):
+        # (category_version, skill_version), the graph links skills to content categories so it depends on both,
+        # but not on the rest of the content table (popularity updates dont rebuild it)
+        with pooled_conn() as c:
+            rows = dict(c.execute("SELECT key, value FROM app_meta WHERE key IN ('category_version', 'skill_version')").fetchall())
+            return rows.get('category_version', 0), rows.get('skill_version', 0)
+
     def get_all_content(self):
-        with contextlib.closing(get_conn()) as c:
+        with pooled_conn() as c:
             rows = c.execute("SELECT * FROM content").fetchall()
             return {r['id']: dict(r) for r in rows}
 
     def get_content_tags(self):
-        with contextlib.closing(get_conn()) as c:
+        with pooled_conn() as c:
             rows = c.execute("SELECT id, category FROM content").fetchall()
             return {r['id']: [r['category']] for r in rows}
 
+    def get_content_version(self):
+        with pooled_conn() as c:
+            return c.execute("SELECT value FROM app_meta WHERE key='content_version'").fetchone()[0]
+
+    def get_catalog_version(self):
+        return self.get_meta('catalog_version', 0)
+
+    def get_popularity_rowid(self):
+        with pooled_conn() as c:
+            return c.execute("SELECT COALESCE(MAX(rowid), 0) FROM popularity_delta").fetchone()[0]
+
+    def get_popularity_since(self, rowid):
+        # {item_id: popularity} for items whose popularity changed after popularity_delta rowid
+        with pooled_conn() as c:
+            return {r['item_id']: r['popularity'] for r in c.execute("SELECT item_id, popularity FROM popularity_delta WHERE rowid > ?", (rowid,))}
+
+    def get_meta(self, key, default=None):
+        with pooled_conn() as c:
+            row = c.execute("SELECT value FROM app_meta WHERE key=?", (key,)).fetchone()
+            return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with pooled_conn() as c:
+            c.execute("INSERT OR REPLACE INTO app_meta (key, value) VALUES (?, ?)", (key, value))
+            c.commit()
+
+    def iter_interactions(self, min_rating=3, max_id=None):
+        # streams (user_id, content_id, rating) in insertion order for offline jobs without building one big list
+        with pooled_conn() as c:
+            yield from c.execute("SELECT user_id, content_id, rating FROM interactions WHERE rating >= ? AND id <= ? ORDER BY id",
+                                 (min_rating, max_id if max_id is not None else 2 ** 63 - 1))
+
+    def get_all_user_ids(self):
+        with pooled_conn() as c:
+            return [r['id'] for r in c.execute("SELECT id FROM users")]
+
+    def get_max_interaction_id(self):
+        with pooled_conn() as c:
+            return c.execute("SELECT COALESCE(MAX(id), 0) FROM interactions").fetchone()[0]
+
+    def get_users_changed_since(self, interaction_id, computed_before=0, model_version=None):
+        # users with new interactions since the last precompute run, users never precomputed and users whose
+        # row get_precomputed would reject: computed before computed_before, or for another skill graph / model
+        with pooled_conn() as c:
+            rows = c.execute("""SELECT DISTINCT user_id AS id FROM interactions WHERE id > ?
+                                UNION SELECT id FROM users WHERE id NOT IN (SELECT user_id FROM precomputed_recs)
+                                UNION SELECT user_id FROM precomputed_recs WHERE computed_at < ?
+                                    OR skill_version IS NOT (SELECT value FROM app_meta WHERE key = 'skill_version')
+                                    OR (? IS NOT NULL AND model_version IS NOT ?)""",
+                             (interaction_id, computed_before, model_version, model_version))
+            return [r['id'] for r in rows]
+
+    def get_skill_version(self):
+        return self.get_meta('skill_version', 0)
+
+    def save_precomputed(self, rows, version, content_version, max_rowid, top_n, skill_version=0, model_version=None):
+        # rows = [(uid, ab_group, recs)], one transaction per call
+        now = time.time()
+        with pooled_conn() as c:
+            c.executemany("""INSERT OR REPLACE INTO precomputed_recs (user_id, recs, ab_group, top_n, version, content_version,
+                             skill_version, model_version, max_rowid, computed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                          [(uid, json.dumps(recs), group, top_n, version, content_version, skill_version, model_version, max_rowid, now)
+                           for uid, group, recs in rows])
+            c.commit()
+
+    def get_precomputed(self, uid, max_age, model_version=None):
+        # only returns the row if nothing was logged for the user after it was computed, the skill graph is
+        # the one it was ranked against and (if given) the scoring config matches. interest edits delete
+        # the row outright (trigger in migration 7)
+        with pooled_conn() as c:
+            row = c.execute("""SELECT * FROM precomputed_recs p WHERE p.user_id=? AND p.computed_at >= ?
+                               AND p.skill_version = (SELECT value FROM app_meta WHERE key = 'skill_version')
+                               AND (? IS NULL OR p.model_version = ?)
+                               AND NOT EXISTS (SELECT 1 FROM interactions i WHERE i.user_id = p.user_id AND i.id > p.max_rowid)""",
+                            (uid, time.time() - max_age, model_version, model_version)).fetchone()
+            if not row: return None
+            res = dict(row)
+            res['recs'] = json.loads(res['recs'])
+            return res
+
     def log_interaction(self, uid, cid, itype, rating):
-        with contextlib.closing(get_conn()) as c:
-            c.execute("INSERT INTO interactions (user_id, content_id, type, rating) VALUES (?, ?, ?, ?)", 
-                     (uid, cid, itype, rating))
-            c.commit()
\ No newline at end of file
+        self.log_interactions([(uid, cid, itype, rating)])
+
+    def log_interactions(self, rows):
+        # rows = [(uid, cid, itype, rating)], everything (incl. co-occurrence) in one transaction
+        with pooled_conn() as c:
+            # co-occurrence only counts positive items, same cutoff as get_user_hist
+            uids = list({r[0] for r in rows if r[3] >= 3})
+            # ordered list for pairing + set for the membership test, a heavy user would make `in list` O(history) per row
+            liked = {u: [] for u in uids}
+            seen = {u: set() for u in uids}
+            for n in range(0, len(uids), 500):
+                chunk = uids[n:n + 500]
+                for r in c.execute(f"SELECT DISTINCT user_id, content_id FROM interactions WHERE user_id IN ({','.join('?' * len(chunk))}) AND rating >= 3", chunk):
+                    liked[r['user_id']].append(r['content_id'])
+                    seen[r['user_id']].add(r['content_id'])
+            
+            c.executemany("INSERT INTO interactions (user_id, content_id, type, rating) VALUES (?, ?, ?, ?)", rows)
+            
+            # replay in order so items liked earlier in the same batch pair up too
+            pairs, touched = [], {}
+            for uid, cid, _, rating in rows:
+                if rating >= 3 and cid not in seen[uid]:
+                    others = liked[uid]
+                    pairs += [(cid, o) for o in others] + [(o, cid) for o in others]
+                    touched.update(dict.fromkeys([cid] + others))
+                    others.append(cid)
+                    seen[uid].add(cid)
+            if pairs:
+                self._bump_cooc(c, pairs, list(touched))
+            c.commit()
+
+    def _bump_cooc(self, c, pairs, touched, top_n=COOC_TOP_N):
+        # incremental update: +1 on every new (item, neighbour) pair, then trim touched rows back to top-n.
+        # trimming drops tail counts so a periodic rebuild_cooc() keeps it exact
+        c.executemany("""INSERT INTO item_cooc (item_id, neighbor_id, count) VALUES (?, ?, 1)
+                         ON CONFLICT(item_id, neighbor_id) DO UPDATE SET count = count + 1""", pairs)
+        c.executemany("""DELETE FROM item_cooc WHERE item_id=? AND neighbor_id NOT IN
+                         (SELECT neighbor_id FROM item_cooc WHERE item_id=? ORDER BY count DESC LIMIT ?)""",
+                      [(i, i, top_n) for i in touched])
+
+    def rebuild_cooc(self, top_n=COOC_TOP_N):
+        # offline full build: self-join of positive histories, keep top-n neighbours per item
+        with pooled_conn() as c:
+            c.execute("DELETE FROM item_cooc")
+            c.execute("""
+                INSERT INTO item_cooc (item_id, neighbor_id, count)
+                SELECT item_id, neighbor_id, cnt FROM (
+                    SELECT a.content_id AS item_id, b.content_id AS neighbor_id, COUNT(*) AS cnt,
+                           ROW_NUMBER() OVER (PARTITION BY a.content_id ORDER BY COUNT(*) DESC, b.content_id) AS rn
+                    FROM (SELECT DISTINCT user_id, content_id FROM interactions WHERE rating >= 3) a
+                    JOIN (SELECT DISTINCT user_id, content_id FROM interactions WHERE rating >= 3) b
+                      ON a.user_id = b.user_id AND a.content_id != b.content_id
+                    GROUP BY a.content_id, b.content_id
+                ) WHERE rn <= ?""", (top_n,))
+            c.commit()
+            return c.execute("SELECT COUNT(*) FROM item_cooc").fetchone()[0]
+
+    def get_item_neighbors(self, items):
+        # cost depends only on how many items we ask about
+        res = {}
+        items = list(dict.fromkeys(items))
+        with pooled_conn() as c:
+            for n in range(0, len(items), 500):
+                chunk = items[n:n + 500]
+                rows = c.execute(f"SELECT item_id, neighbor_id, count FROM item_cooc WHERE item_id IN ({','.join('?' * len(chunk))}) ORDER BY count DESC, neighbor_id", chunk).fetchall()
+                for r in rows:
+                    res.setdefault(r['item_id'], []).append((r['neighbor_id'], r['count']))
+        return res
\ No newline at end of file
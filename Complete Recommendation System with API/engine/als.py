@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import numpy as np
+
+# implicit-feedback ALS (Hu, Koren & Volinsky 2008): every observed (user, item) is a positive with
+# confidence c = 1 + alpha * r, everything else a weak zero. each half-step solves all users (or items)
+# at once with a few conjugate gradient steps (Takacs et al. 2011) instead of one f x f solve per row,
+# so the heavy lifting is [n, f] @ [f, f] matmuls that BLAS spreads over its threads
+# (OPENBLAS_NUM_THREADS / OMP_NUM_THREADS control how many).
+
+def build_csr(rows, cols, vals, shape):
+    # (row, col, val) triples -> indptr/indices/data sorted by row, duplicates keep the max
+    rows, cols, vals = np.asarray(rows, np.int64), np.asarray(cols, np.int64), np.asarray(vals, np.float32)
+    order = np.lexsort((-vals, cols, rows))
+    rows, cols, vals = rows[order], cols[order], vals[order]
+    keep = np.r_[True, (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])]
+    rows, cols, vals = rows[keep], cols[keep], vals[keep]
+    indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=shape[0]), out=indptr[1:])
+    return indptr, cols, vals
+
+def _transpose(indptr, indices, data, n_cols):
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    order = np.argsort(indices, kind="stable")
+    t_indptr = np.zeros(n_cols + 1, dtype=np.int64)
+    np.cumsum(np.bincount(indices, minlength=n_cols), out=t_indptr[1:])
+    return t_indptr, rows[order], data[order]
+
+def _segment_sum(vals, indptr):
+    # per-row sums of a [nnz, f] array laid out in csr order, empty rows stay 0
+    out = np.zeros((len(indptr) - 1, vals.shape[1]), dtype=vals.dtype)
+    nz = np.flatnonzero(np.diff(indptr))
+    if nz.size: out[nz] = np.add.reduceat(vals, indptr[:-1][nz], axis=0)
+    return out
+
+def _solve(X, Y, indptr, indices, conf, reg, cg_steps):
+    # minimise sum_i c_ui (1 - x_u.y_i)^2 + reg |x_u|^2 for every row u, warm started from X.
+    # A_u = Y'Y + reg I + sum_i (c_ui - 1) y_i y_i'   b_u = sum_i c_ui y_i
+    YtY = Y.T @ Y + reg * np.eye(Y.shape[1], dtype=Y.dtype)
+    rows = np.repeat(np.arange(X.shape[0]), np.diff(indptr))
+    Yi = Y[indices]
+    w = (conf - 1)[:, None]
+
+    def A(P):
+        d = np.einsum("nf,nf->n", Yi, P[rows])[:, None]
+        return P @ YtY + _segment_sum(Yi * (w * d), indptr)
+
+    r = _segment_sum(Yi * conf[:, None], indptr) - A(X)
+    p = r.copy()
+    rs = np.einsum("uf,uf->u", r, r)
+    for _ in range(cg_steps):
+        Ap = A(p)
+        pAp = np.einsum("uf,uf->u", p, Ap)
+        a = np.divide(rs, pAp, out=np.zeros_like(rs), where=pAp > 0)[:, None]
+        X += a * p
+        r -= a * Ap
+        rs_new = np.einsum("uf,uf->u", r, r)
+        p = r + np.divide(rs_new, rs, out=np.zeros_like(rs), where=rs > 0)[:, None] * p
+        rs = rs_new
+    return X
+
+def train_als(indptr, indices, ratings, n_items, factors=32, reg=100.0, alpha=10.0, iters=10, cg_steps=3,
+              seed=0, log=None):
+    # user-major csr of ratings in, (user_factors, item_factors) float32 out
+    rng = np.random.default_rng(seed)
+    n_users = len(indptr) - 1
+    conf = (1 + alpha * ratings).astype(np.float32)
+    t_indptr, t_indices, t_conf = _transpose(indptr, indices, conf, n_items)
+
+    X = (rng.standard_normal((n_users, factors)) * 0.01).astype(np.float32)
+    Y = (rng.standard_normal((n_items, factors)) * 0.01).astype(np.float32)
+    for it in range(iters):
+        st = time.perf_counter()
+        X = _solve(X, Y, indptr, indices, conf, reg, cg_steps)
+        Y = _solve(Y, X, t_indptr, t_indices, t_conf, reg, cg_steps)
+        if log: log(it, time.perf_counter() - st)
+    return X, Y
+
+# where the trainer writes and the orchestrator looks, relative like data.database.DB_FILE
+ALS_DIR = os.path.join("models", "als")
+
+class ALSModel:
+    # factor matrices + id tables, saved as plain .npy so serving processes can mmap them read only
+    FILES = ("user_factors", "item_factors", "user_ids", "item_ids")
+
+    def __init__(self, user_factors, item_factors, user_ids, item_ids, meta=None, reg=100.0, alpha=10.0):
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.user_ids = user_ids
+        self.item_ids = item_ids
+        self.meta = meta or {}
+        self.reg = self.meta.get("reg", reg)
+        self.alpha = self.meta.get("alpha", alpha)
+        # ratings are divided by this before the confidence weighting, both in training and fold-in
+        self.rating_scale = self.meta.get("rating_scale", 5.0)
+        self.user_row = {u: n for n, u in enumerate(np.asarray(user_ids).tolist())}
+        self.items = np.asarray(item_ids).tolist()
+        self.item_row = {i: n for n, i in enumerate(self.items)}
+        self._yty = None
+
+    def save(self, path):
+        # each file lands under a temp name and is renamed, meta.json last, so a reader
+        # never sees a half written model (it may briefly see mixed versions, meta tells which)
+        os.makedirs(path, exist_ok=True)
+        for name in self.FILES:
+            tmp = os.path.join(path, f".{name}.{os.getpid()}.npy")
+            np.save(tmp, np.asarray(getattr(self, name)))
+            os.replace(tmp, os.path.join(path, f"{name}.npy"))
+        tmp = os.path.join(path, f".meta.{os.getpid()}.json")
+        with open(tmp, "w") as f: json.dump(self.meta, f, indent=2)
+        os.replace(tmp, os.path.join(path, "meta.json"))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        arrs = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None) for name in cls.FILES}
+        meta = {}
+        if os.path.exists(os.path.join(path, "meta.json")):
+            with open(os.path.join(path, "meta.json")) as f: meta = json.load(f)
+        return cls(meta=meta, **arrs)
+
+    def user_vector(self, uid, hist=()):
+        # trained users use their row, anyone else (signed up after training) is folded in from their history
+        row = self.user_row.get(uid)
+        if row is not None: return self.user_factors[row]
+        return self.fold_in(hist)
+
+    def fold_in(self, items, ratings=None):
+        # one exact least squares solve against the fixed item factors
+        rows = [self.item_row[i] for i in items if i in self.item_row]
+        if not rows: return None
+        Y = np.asarray(self.item_factors, dtype=np.float32)
+        if self._yty is None: self._yty = Y.T @ Y
+        Yu = Y[rows]
+        r = np.full(len(rows), self.rating_scale, dtype=np.float32) if ratings is None else np.asarray(ratings, np.float32)
+        c = 1 + self.alpha * r / self.rating_scale
+        A = self._yty + (Yu.T * (c - 1)) @ Yu + self.reg * np.eye(Y.shape[1], dtype=np.float32)
+        return np.linalg.solve(A, Yu.T @ c)
+
+    def recommend(self, uid, k=10, exclude=(), hist=()):
+        # dot product against every item, argpartition for the top k, only those k get sorted
+        vec = self.user_vector(uid, hist)
+        if vec is None: return []
+        scores = np.asarray(self.item_factors) @ vec
+        drop = list({self.item_row[i] for i in exclude if i in self.item_row})
+        if drop: scores[drop] = -np.inf
+        k = min(k, len(scores) - len(drop))
+        if k <= 0: return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((top, -scores[top]))]
+        return [(self.items[n], float(scores[n])) for n in top.tolist()]
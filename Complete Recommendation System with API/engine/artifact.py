@@ -0,0 +1,216 @@
+import os
+import json
+import time
+from collections.abc import Mapping, Sequence
+import numpy as np
+from engine.candidate_gen import CandidateGenerator
+from engine.knowledge_graph import KnowledgeGraph
+
+# read-only serving snapshot of the catalog, user histories and item neighbours as flat numpy arrays.
+# every worker np.load()s them with mmap_mode="r", so the pages live once in the os page cache and
+# are shared by all gunicorn workers instead of each worker building its own dicts.
+# ids are interned into sorted fixed width tables (lookup = searchsorted), everything else refers to
+# rows of those tables, variable length lists are csr (indptr + flat values).
+
+# where scripts/build_artifact.py writes and the orchestrator looks, relative like ALS_DIR
+ARTIFACT_DIR = os.path.join("models", "serving")
+FORMAT = 2
+
+def _csr(groups, n):
+    # lists of ints per row -> (indptr, flat int32 values)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum([len(g) for g in groups], out=indptr[1:])
+    flat = np.fromiter((v for g in groups for v in g), dtype=np.int32, count=int(indptr[-1]))
+    return indptr, flat
+
+def _strings(vals):
+    # variable length utf-8 strings -> (offsets, byte blob), for fields only read for a handful of rows
+    enc = [v.encode() for v in vals]
+    offsets = np.zeros(len(enc) + 1, dtype=np.int64)
+    np.cumsum([len(e) for e in enc], out=offsets[1:])
+    return offsets, np.frombuffer(b"".join(enc), dtype=np.uint8).copy()
+
+def _codes(vals):
+    # low cardinality strings -> (sorted table, codes), uint16 while the table fits so codes never wrap
+    table = sorted(set(vals))
+    pos = {v: n for n, v in enumerate(table)}
+    dtype = np.uint16 if len(table) <= np.iinfo(np.uint16).max + 1 else np.int32
+    return np.array(table, dtype=str), np.array([pos[v] for v in vals], dtype=dtype)
+
+class ServingArtifact:
+    FILES = ("item_ids", "user_ids", "title_offsets", "title_blob", "categories", "category", "difficulties",
+             "difficulty", "popularity", "popular", "tag_indptr", "tag_items", "hist_indptr", "hist_items",
+             "nbr_indptr", "nbr_items", "nbr_counts", "kg_names", "kg_indptr", "kg_indices", "kg_weights")
+
+    def __init__(self, arrays, meta):
+        for name in self.FILES: setattr(self, name, arrays[name])
+        self.meta = meta
+        self.content_version = meta.get("content_version")
+        # catalog is usable while this matches, popularity changes since popularity_rowid are overlaid
+        self.catalog_version = meta.get("catalog_version")
+        self.popularity_rowid = meta.get("popularity_rowid", 0)
+        self.max_rowid = meta.get("max_rowid", 0)
+        self.skill_graph_version = tuple(meta.get("skill_graph_version") or ())
+
+    @classmethod
+    def build(cls, repo):
+        st = time.time()
+        # read the high-water marks first, anything written during the build is newer and gets picked up live
+        max_rowid = repo.get_max_interaction_id()
+        content_version = repo.get_content_version()
+        catalog_version = repo.get_catalog_version()
+        popularity_rowid = repo.get_popularity_rowid()
+        content = repo.get_all_content()
+        tags = repo.get_content_tags()
+
+        item_ids = np.array(sorted(content), dtype=str)
+        row = {iid: n for n, iid in enumerate(item_ids.tolist())}
+        recs = [content[i] for i in item_ids.tolist()]
+        a = {"item_ids": item_ids}
+        a["title_offsets"], a["title_blob"] = _strings([r['title'] or "" for r in recs])
+        a["categories"], a["category"] = _codes([r['category'] or "" for r in recs])
+        a["difficulties"], a["difficulty"] = _codes([r['difficulty'] or "" for r in recs])
+        # float64 so scores match the db path to the last bit
+        a["popularity"] = np.array([r['popularity'] or 0.0 for r in recs], dtype=np.float64)
+        # same order CatalogStore produces (stable sort over table order), so both paths rank alike
+        a["popular"] = np.array([row[i] for i in sorted(content, key=lambda x: content[x]['popularity'], reverse=True)], dtype=np.int32)
+        # posting lists follow table order too, same as CandidateGenerator.build_tag_index
+        idx = CandidateGenerator.build_tag_index(tags)
+        cats = a["categories"].tolist()
+        a["tag_indptr"], a["tag_items"] = _csr([[row[i] for i in idx.get(c, [])] for c in cats], len(cats))
+
+        hists = {}
+        for uid, cid, rating in repo.iter_interactions(max_id=max_rowid):
+            if cid in row: hists.setdefault(uid, []).append((rating, cid))
+        # (rating, content_id) is the order the covering index hands rows back to get_user_hist
+        hists = {u: [row[c] for _, c in sorted(h)] for u, h in hists.items()}
+        user_ids = np.array(sorted(set(repo.get_all_user_ids()) | set(hists)), dtype=str)
+        a["user_ids"] = user_ids
+        a["hist_indptr"], a["hist_items"] = _csr([hists.get(u, ()) for u in user_ids.tolist()], len(user_ids))
+
+        nbrs = repo.get_item_neighbors(item_ids.tolist())
+        lists = [[(row[j], c) for j, c in nbrs.get(i, []) if j in row] for i in item_ids.tolist()]
+        a["nbr_indptr"], a["nbr_items"] = _csr([[j for j, _ in l] for l in lists], len(lists))
+        a["nbr_counts"] = np.fromiter((c for l in lists for _, c in l), dtype=np.float32, count=len(a["nbr_items"]))
+
+        # skill graph closure, the slowest thing a worker would otherwise rebuild at startup
+        kg_version = repo.get_skill_graph_version()
+        kg = KnowledgeGraph.build(*repo.get_skill_graph_rows(), version=kg_version)
+        a["kg_names"] = np.array(kg.names, dtype=str)
+        a["kg_indptr"], a["kg_indices"], a["kg_weights"] = kg.indptr, kg.indices, kg.weights
+
+        meta = {"format": FORMAT, "content_version": content_version, "catalog_version": catalog_version,
+                "popularity_rowid": popularity_rowid, "skill_graph_version": list(kg_version),
+                "max_rowid": max_rowid, "built_at": time.time(),
+                "build_sec": round(time.time() - st, 2), "items": len(item_ids), "users": len(user_ids),
+                "interactions": len(a["hist_items"]), "neighbors": len(a["nbr_items"])}
+        return cls(a, meta)
+
+    def save(self, path):
+        # same write-then-rename as ALSModel.save, meta.json last
+        os.makedirs(path, exist_ok=True)
+        for name in self.FILES:
+            tmp = os.path.join(path, f".{name}.{os.getpid()}.npy")
+            np.save(tmp, np.asarray(getattr(self, name)))
+            os.replace(tmp, os.path.join(path, f"{name}.npy"))
+        tmp = os.path.join(path, f".meta.{os.getpid()}.json")
+        with open(tmp, "w") as f: json.dump(self.meta, f, indent=2)
+        os.replace(tmp, os.path.join(path, "meta.json"))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(os.path.join(path, "meta.json")) as f: meta = json.load(f)
+        if meta.get("format") != FORMAT: raise ValueError(f"artifact format {meta.get('format')} != {FORMAT}, rebuild it")
+        return cls({n: np.load(os.path.join(path, f"{n}.npy"), mmap_mode="r" if mmap else None) for n in cls.FILES}, meta)
+
+    def nbytes(self):
+        return sum(getattr(self, n).nbytes for n in self.FILES)
+
+    @staticmethod
+    def _find(table, key):
+        n = int(np.searchsorted(table, key))
+        return n if n < len(table) and table[n] == key else -1
+
+    def item_row(self, iid):
+        return self._find(self.item_ids, iid)
+
+    def user_row(self, uid):
+        return self._find(self.user_ids, uid)
+
+    def item_record(self, n, popularity=None):
+        # the same dict shape as a content table row
+        a, b = self.title_offsets[n], self.title_offsets[n + 1]
+        pop = self.popularity if popularity is None else popularity
+        return {"id": str(self.item_ids[n]), "title": bytes(self.title_blob[a:b]).decode(),
+                "category": str(self.categories[self.category[n]]), "difficulty": str(self.difficulties[self.difficulty[n]]),
+                "popularity": float(pop[n])}
+
+    def user_hist(self, uid):
+        # positive history as of max_rowid, same rows and order as repo.get_user_hist
+        n = self.user_row(uid)
+        if n < 0: return []
+        return self.item_ids[self.hist_items[self.hist_indptr[n]:self.hist_indptr[n + 1]]].tolist()
+
+    def item_neighbors(self, items):
+        # same shape as repo.get_item_neighbors, as of when the artifact was built
+        res = {}
+        for i in dict.fromkeys(items):
+            n = self.item_row(i)
+            if n < 0: continue
+            a, b = self.nbr_indptr[n], self.nbr_indptr[n + 1]
+            if a == b: continue
+            res[i] = list(zip(self.item_ids[self.nbr_items[a:b]].tolist(), self.nbr_counts[a:b].tolist()))
+        return res
+
+    def knowledge_graph(self):
+        # a fresh KnowledgeGraph (own per-user cache) over the mmapped closure
+        return KnowledgeGraph(self.kg_names.tolist(), self.kg_indptr, self.kg_indices, self.kg_weights, version=self.skill_graph_version)
+
+    def popularity_overlay(self, changed):
+        # (popularity, popular) with {item_id: popularity} applied. private copies, only made when something
+        # changed; a stable re-sort of the build order keeps ties where the build put them
+        if not changed: return self.popularity, self.popular
+        pop = np.array(self.popularity)
+        for iid, v in changed.items():
+            n = self.item_row(iid)
+            if n >= 0: pop[n] = v or 0.0
+        order = np.asarray(self.popular)
+        return pop, order[np.argsort(-pop[order], kind="stable")].astype(np.int32)
+
+    def snapshot_views(self, changed=None):
+        # content / tags / tag_index / popular for a CatalogSnapshot, decoded per lookup instead of up front
+        pop, popular = self.popularity_overlay(changed)
+        return ContentView(self, pop), TagsView(self), TagIndexView(self), IdSeq(self.item_ids, popular)
+
+class ContentView(Mapping):
+    def __init__(self, art, popularity=None): self.art, self.popularity = art, popularity
+    def __getitem__(self, iid):
+        n = self.art.item_row(iid)
+        if n < 0: raise KeyError(iid)
+        return self.art.item_record(n, self.popularity)
+    def __contains__(self, iid): return self.art.item_row(iid) >= 0
+    def __iter__(self): return iter(self.art.item_ids.tolist())
+    def __len__(self): return len(self.art.item_ids)
+
+class TagsView(ContentView):
+    def __getitem__(self, iid):
+        n = self.art.item_row(iid)
+        if n < 0: raise KeyError(iid)
+        return [str(self.art.categories[self.art.category[n]])]
+
+class TagIndexView(Mapping):
+    def __init__(self, art): self.art = art
+    def __getitem__(self, tag):
+        n = ServingArtifact._find(self.art.categories, tag)
+        if n < 0: raise KeyError(tag)
+        return tuple(self.art.item_ids[self.art.tag_items[self.art.tag_indptr[n]:self.art.tag_indptr[n + 1]]].tolist())
+    def __iter__(self): return iter(self.art.categories.tolist())
+    def __len__(self): return len(self.art.categories)
+
+class IdSeq(Sequence):
+    # ids[rows] without materialising the whole list, slices come back as plain lists
+    def __init__(self, ids, rows): self.ids, self.rows = ids, rows
+    def __getitem__(self, k):
+        if isinstance(k, slice): return self.ids[self.rows[k]].tolist()
+        return str(self.ids[self.rows[k]])
+    def __len__(self): return len(self.rows)
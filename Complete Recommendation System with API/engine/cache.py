@@ -0,0 +1,179 @@
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+def approx_size(obj):
+    # rough deep size of the json-ish values we cache (lists of dicts of str/float)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approx_size(k) + approx_size(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(approx_size(v) for v in obj)
+    return size
+
+class RecCache:
+    # bounded LRU with per-entry TTL and a byte cap, one lock around everything.
+    # entries past ttl stay around for another `grace` seconds so callers can serve them stale
+    # while a refresh runs (stale-while-revalidate), after that they are gone
+    def __init__(self, max_entries=10_000, ttl=300, max_bytes=64 * 1024 * 1024, grace=0, refresh_ahead=0.8, hot_hits=3, gen_stripes=4096):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.grace = grace
+        # a fresh entry older than refresh_ahead * ttl with at least hot_hits hits is reported as "expiring"
+        self.refresh_ahead = refresh_ahead
+        self.hot_hits = hot_hits
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.data = OrderedDict() # key -> [ts, size, value, hits], oldest first
+        self.bytes = 0
+        # generation counters, bumped by delete(). a writer reads generation() before computing and passes it
+        # to set(), which drops the value if the key was deleted in between (computed from data that changed
+        # under it). striped by hash so memory stays fixed, a collision only costs a skipped write
+        self.gens = [0] * gen_stripes
+        self.hits = self.misses = self.evictions = self.expirations = self.stale_hits = self.stale_sets = 0
+
+    def _drop(self, key):
+        size = self.data.pop(key)[1]
+        self.bytes -= size
+
+    def lookup(self, key, now=None, stale=True):
+        # (value, state), state is "fresh", "expiring" (fresh, hot, close to ttl), "stale" (past ttl,
+        # inside the grace window, only if stale=True) or None on a miss
+        now = time.time() if now is None else now
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, None
+            age = now - entry[0]
+            if age >= self.ttl + self.grace:
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return None, None
+            if age >= self.ttl:
+                if not stale:
+                    self.misses += 1
+                    return None, None
+                self.data.move_to_end(key)
+                self.stale_hits += 1
+                return entry[2], "stale"
+            self.data.move_to_end(key)
+            self.hits += 1
+            entry[3] += 1
+            hot = entry[3] >= self.hot_hits and age >= self.ttl * self.refresh_ahead
+            return entry[2], "expiring" if hot else "fresh"
+
+    def get(self, key, now=None):
+        # fresh values only
+        return self.lookup(key, now, stale=False)[0]
+
+    def peek(self, key, now=None):
+        # fresh value or None without counting a hit / miss or touching the lru order,
+        # for bulk readers (get_recs_batch) that shouldnt skew the online hit rate
+        now = time.time() if now is None else now
+        with self.lock:
+            entry = self.data.get(key)
+            return entry[2] if entry is not None and now - entry[0] < self.ttl else None
+
+    def generation(self, key):
+        with self.lock:
+            return self.gens[hash(key) % len(self.gens)]
+
+    def set(self, key, value, now=None, gen=None):
+        now = time.time() if now is None else now
+        size = approx_size(value)
+        with self.lock:
+            if gen is not None and self.gens[hash(key) % len(self.gens)] != gen:
+                self.stale_sets += 1
+                return False
+            if key in self.data: self._drop(key)
+            # a single value bigger than the whole budget is just not cached
+            if size > self.max_bytes: return False
+            self.data[key] = [now, size, value, 0]
+            self.bytes += size
+
+            while len(self.data) > self.max_entries or self.bytes > self.max_bytes:
+                self._drop(next(iter(self.data)))
+                self.evictions += 1
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            self.gens[hash(key) % len(self.gens)] += 1
+            if key in self.data: self._drop(key)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits, "misses": self.misses, "stale_hits": self.stale_hits, "stale_sets": self.stale_sets,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions, "expirations": self.expirations,
+                "size": len(self.data), "bytes": self.bytes,
+                "max_entries": self.max_entries, "max_bytes": self.max_bytes
+            }
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = self.error = None
+        self.waiters = 0
+
+class SingleFlight:
+    # collapses concurrent calls for the same key into one: the first caller runs fn, everyone
+    # arriving while it runs waits for and shares that result (or exception). stops a stampede of
+    # identical recomputes when a hot key expires or is invalidated
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flights = {}
+        self.leaders = self.shared = self.timeouts = 0
+
+    def do(self, key, fn, timeout=None):
+        # returns (result, shared). a waiter that gives up after timeout runs fn itself,
+        # so a stuck leader slows callers down but never fails them
+        with self.lock:
+            f = self.flights.get(key)
+            if f is None:
+                f = self.flights[key] = _Flight()
+                self.leaders += 1
+                leader = True
+            else:
+                f.waiters += 1
+                leader = False
+
+        if leader:
+            try:
+                f.result = fn()
+            except BaseException as e:
+                f.error = e
+                raise
+            finally:
+                with self.lock:
+                    if self.flights.get(key) is f: del self.flights[key]
+                f.done.set()
+            return f.result, False
+
+        if not f.done.wait(timeout):
+            with self.lock: self.timeouts += 1
+            return fn(), False
+        with self.lock: self.shared += 1
+        if f.error is not None: raise f.error
+        return f.result, True
+
+    def forget(self, key):
+        # callers from now on start a fresh flight, whoever is already waiting still gets the old one
+        with self.lock:
+            self.flights.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            return {"in_flight": len(self.flights), "leaders": self.leaders, "shared": self.shared, "timeouts": self.timeouts}
@@ -1,50 +1,189 @@
+import os
+import math
+import time
+import heapq
 import itertools
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Callable
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from collections import Counter, defaultdict
+
+log = logging.getLogger(__name__)
+
+@dataclass
+class CandidateSource:
+    name: str
+    fetch: Callable # (uid, n) -> [iid, ...] best first
+    quota: float = 0.5 # share of the limit this source may fill
+    weight: float = 1.0 # share of the merged list, 0 = only pads once the weighted sources run dry
+    timeout: float = 0.1 # seconds, a slower source is dropped from this request
+
+# one pool per process shared by every generator (they are built per request), rebuilt after a fork.
+# sized for the default 3 sources x ~16 concurrent requests. a request only fans out if every one of its
+# sources gets a free worker right away, otherwise it runs them inline (queue wait would eat the deadlines)
+SOURCE_WORKERS = int(os.environ.get("REC_SOURCE_WORKERS", 48))
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_pool_size = _pool_busy = 0
+
+def source_pool(workers=None):
+    global _pool, _pool_pid, _pool_size, _pool_busy
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            _pool_size = workers or SOURCE_WORKERS
+            _pool = ThreadPoolExecutor(max_workers=_pool_size, thread_name_prefix="cand-src")
+            _pool_pid = os.getpid()
+            _pool_busy = 0
+        return _pool
+
+def _reserve(n):
+    # claims n workers, held until each task finishes (a timed out source still occupies its thread)
+    global _pool_busy
+    with _pool_lock:
+        if _pool_busy + n > _pool_size: return False
+        _pool_busy += n
+        return True
+
+def _release(_fut=None):
+    global _pool_busy
+    with _pool_lock: _pool_busy -= 1
 
 class CandidateGenerator:
-    def __init__(self, user_hist, item_data, pop_items):
+    def __init__(self, user_hist, item_data, pop_items, tag_index=None, item_neighbors=None, als=None,
+                 parallel=True, merge="weighted", telemetry=None, max_item_users=500, max_neighbors=200):
         # basic dictionaries for dummy data
         self.users = user_hist
         self.items = item_data
         self.popular = pop_items
 
+        # inverted index item -> users, built once so collab only visits overlapping users
+        self.item_users = defaultdict(set)
+        for u, hist in self.users.items():
+            for i in hist:
+                self.item_users[i].add(u)
+
+        # tag -> items, can be shared across generators since the catalog rarely changes
+        self.tag_items = tag_index if tag_index is not None else self.build_tag_index(self.items)
+        
+        # collab fan-out caps: hub items only contribute a sample of their fans, and only the
+        # strongest neighbours get their histories scanned, so a request never walks O(users)
+        self.max_item_users = max_item_users
+        self.max_neighbors = max_neighbors
+
+        # precomputed item -> [(neighbour, weight)] from the co-occurrence table
+        self.neighbors = item_neighbors or {}
+
+        # offline matrix factorization model (engine.als.ALSModel), optional
+        self.als = als
+
+        # name -> CandidateSource, in registration order (also the tie-break order when merging)
+        self.sources = {}
+        self.parallel = parallel
+        self.merge = merge
+        self.telemetry = telemetry
+        self.last_stats = {}
+        self.register_defaults()
+
+    def register_defaults(self):
+        # prefer the learned model, then the precomputed neighbour table, then the live overlap scan
+        if self.als is not None:
+            self.register_source("als", self.als_candidates)
+        elif self.neighbors:
+            self.register_source("neighbors", self.neighbor_candidates)
+        else:
+            self.register_source("collaborative", self.collaborative_candidates)
+        self.register_source("content", self.content_based_candidates)
+        self.register_source("popular", lambda uid, n: self.popularity_candidates(n), quota=1.0, weight=0.0)
+
+    def register_source(self, name, fetch, quota=0.5, weight=1.0, timeout=0.1):
+        # re-registering a name replaces it in place
+        self.sources[name] = CandidateSource(name, fetch, quota, weight, timeout)
+
+    def unregister_source(self, name):
+        self.sources.pop(name, None)
+
+    @staticmethod
+    def build_tag_index(item_data):
+        idx = defaultdict(list)
+        for item, tags in item_data.items():
+            for t in dict.fromkeys(tags):
+                idx[t].append(item)
+        return dict(idx)
+
+    def add_interaction(self, uid, iid):
+        # keep history + posting lists in sync without a rebuild
+        if uid in self.item_users[iid]: return
+        self.item_users[iid].add(uid)
+        self.users.setdefault(uid, []).append(iid)
+
     def collaborative_candidates(self, uid, limit=20):
-        def gen_collab():
-            if uid not in self.users: return
-            my_items = set(self.users[uid])
-            
-            for other_u, their_items in self.users.items():
-                if other_u == uid: continue
-                # if we share at least 1 item
-                if my_items & set(their_items):
-                    for item in their_items:
-                        if item not in my_items:
-                            yield item
+        if uid not in self.users: return []
+        my_items = set(self.users[uid])
+        
+        # neighbours = users sharing at least 1 item, weighted by how many they share.
+        # posting lists past max_item_users (popularity is power law) are truncated to a sample
+        overlap = Counter()
+        for i in my_items:
+            fans = self.item_users.get(i, ())
+            if len(fans) > self.max_item_users:
+                fans = itertools.islice(fans, self.max_item_users)
+            for other_u in fans:
+                if other_u != uid:
+                    overlap[other_u] += 1
+        
+        if len(overlap) > self.max_neighbors:
+            overlap = dict(heapq.nlargest(self.max_neighbors, overlap.items(), key=lambda kv: kv[1]))
         
-        # filter out duplicates on the fly
-        seen = set()
-        res = []
-        for i in gen_collab():
-            if i not in seen:
-                seen.add(i)
-                res.append(i)
-                if len(res) >= limit: break
-        return res
+        scores = Counter()
+        for other_u, w in overlap.items():
+            for item in self.users[other_u]:
+                if item not in my_items:
+                    scores[item] += w
+        
+        # nlargest is stable so ties keep first-seen order
+        return [i for i, _ in heapq.nlargest(limit, scores.items(), key=lambda kv: kv[1])]
+
+    def neighbor_candidates(self, uid, limit=20):
+        # item-item lookup, only touches the neighbour lists of the user's own items
+        if uid not in self.users: return []
+        my_items = set(self.users[uid])
+        
+        scores = Counter()
+        for i in self.users[uid]:
+            for nbr, w in self.neighbors.get(i, ()):
+                if nbr not in my_items:
+                    scores[nbr] += w
+        
+        return [i for i, _ in heapq.nlargest(limit, scores.items(), key=lambda kv: kv[1])]
+
+    def als_candidates(self, uid, limit=20):
+        # learned factors: dot product with every item, argpartition top-k inside the model.
+        # users newer than the model get folded in from their history on the fly
+        if self.als is None or uid not in self.users: return []
+        hist = self.users[uid]
+        return [i for i, _ in self.als.recommend(uid, limit, exclude=hist, hist=hist)]
 
     def content_based_candidates(self, uid, limit=20):
-        def gen_content():
-            if uid not in self.users: return
-            my_items = self.users[uid]
-            
-            # get all tags user has interacted with
-            my_tags = set()
-            for i in my_items:
-                my_tags.update(self.items.get(i, []))
-            
-            for item, tags in self.items.items():
-                if item not in my_items and (my_tags & set(tags)):
-                    yield item
+        if uid not in self.users: return []
+        my_items = set(self.users[uid])
+        
+        # get all tags user has interacted with (dict keeps it ordered)
+        my_tags = {}
+        for i in self.users[uid]:
+            my_tags.update(dict.fromkeys(self.items.get(i, [])))
+        
+        # only walk the posting lists of our tags, score = no. of shared tags
+        scores = Counter()
+        for t in my_tags:
+            for item in self.tag_items.get(t, ()):
+                if item not in my_items:
+                    scores[item] += 1
         
-        return list(itertools.islice(gen_content(), limit))
+        # ties keep first-seen order (our tags in order, posting lists in catalog order)
+        return [i for i, _ in heapq.nlargest(limit, scores.items(), key=lambda kv: kv[1])]
 
     def popularity_candidates(self, limit=20):
         return self.popular[:limit]
@@ -53,17 +192,105 @@ class CandidateGenerator:
         # handle cold start for brand new users
         if uid not in self.users or not self.users[uid]:
             return self.popularity_candidates(limit)
-        
-        collab = self.collaborative_candidates(uid, limit//2)
-        content = self.content_based_candidates(uid, limit//2)
-        
-        combined = list(set(collab + content))
-        
-        # pad with popular items if we dont have enough
-        if len(combined) < limit:
-            for p in self.popularity_candidates(limit):
-                if p not in combined:
-                    combined.append(p)
-                    if len(combined) >= limit: break
-                    
-        return combined[:limit]
\ No newline at end of file
+
+        results = self.fetch_sources(uid, limit)
+        return self.merge_sources(results, limit)
+
+    def fetch_sources(self, uid, limit):
+        # [(source, items)] in registration order, each capped at its quota.
+        # a source that errors or misses its deadline contributes nothing (its thread finishes in the background).
+        # deadlines run from when the source starts, not from when it was queued
+        srcs = list(self.sources.values())
+        want = {s.name: max(1, math.ceil(s.quota * limit)) for s in srcs}
+        self.last_stats = {}
+
+        if self.parallel and len(srcs) > 1:
+            pool = source_pool()
+            if _reserve(len(srcs)):
+                futs = []
+                for s in srcs:
+                    started = [threading.Event(), None]
+                    fut = pool.submit(self._started, started, s, uid, want[s.name])
+                    fut.add_done_callback(_release)
+                    futs.append((s, fut, started))
+                return [(s, self._collect(s, fut, started, want[s.name])) for s, fut, started in futs]
+            if self.telemetry: self.telemetry.inc("candidate_sources_inline_total")
+
+        out = []
+        for s in srcs:
+            try:
+                items, ms = self._timed(s, uid, want[s.name])
+                out.append((s, self._record(s, "ok", ms, items[:want[s.name]])))
+            except Exception:
+                log.exception("candidate source %s failed", s.name)
+                out.append((s, self._record(s, "error", 0.0, [])))
+        return out
+
+    def _collect(self, s, fut, started, n):
+        # workers were reserved so the task starts right away, the start wait is only a safety net
+        try:
+            if not started[0].wait(s.timeout): raise FutureTimeout
+            items, ms = fut.result(timeout=max(0.0, started[1] + s.timeout - time.perf_counter()))
+            return self._record(s, "ok", ms, items[:n])
+        except FutureTimeout:
+            fut.cancel()
+            return self._record(s, "timeout", s.timeout * 1000, [])
+        except Exception:
+            log.exception("candidate source %s failed", s.name)
+            return self._record(s, "error", (time.perf_counter() - started[1]) * 1000, [])
+
+    @classmethod
+    def _started(cls, started, src, uid, n):
+        started[1] = time.perf_counter()
+        started[0].set()
+        return cls._timed(src, uid, n)
+
+    @staticmethod
+    def _timed(src, uid, n):
+        st = time.perf_counter()
+        items = src.fetch(uid, n)
+        return items, (time.perf_counter() - st) * 1000
+
+    def _record(self, src, status, ms, items):
+        self.last_stats[src.name] = {"status": status, "ms": round(ms, 3), "returned": len(items), "used": 0}
+        if self.telemetry:
+            self.telemetry.observe("candidate_source_duration_ms", ms, {"source": src.name})
+            self.telemetry.inc("candidate_source_items_total", {"source": src.name, "kind": "returned"}, len(items))
+            if status != "ok": self.telemetry.inc("candidate_source_failures_total", {"source": src.name, "status": status})
+        return items
+
+    def merge_sources(self, results, limit):
+        # ordered + deduplicated. weighted sources are interleaved by smooth weighted round robin
+        # (every source gets credit = its weight each turn, the richest one gives its next unseen item
+        # and pays the total back), "round_robin" treats all weights as equal. weight-0 sources only pad.
+        seen, out = set(), []
+        used = Counter()
+        weight = (lambda s: 1.0) if self.merge == "round_robin" else (lambda s: s.weight)
+        active = [[s, iter(items), 0.0] for s, items in results if s.weight > 0 and items]
+
+        while active and len(out) < limit:
+            total = sum(weight(a[0]) for a in active)
+            for a in active: a[2] += weight(a[0])
+            pick = max(active, key=lambda a: a[2]) # first max wins, so ties go to the earlier source
+            pick[2] -= total
+            item = next((i for i in pick[1] if i not in seen), None)
+            if item is None:
+                active.remove(pick)
+                continue
+            seen.add(item)
+            out.append(item)
+            used[pick[0].name] += 1
+
+        for s, items in results:
+            if s.weight > 0 or len(out) >= limit: continue
+            for i in items:
+                if i not in seen:
+                    seen.add(i)
+                    out.append(i)
+                    used[s.name] += 1
+                    if len(out) >= limit: break
+
+        for name, n in used.items():
+            if name in self.last_stats: self.last_stats[name]["used"] = n
+            if self.telemetry: self.telemetry.inc("candidate_source_items_total", {"source": name, "kind": "used"}, n)
+        return out
@@ -0,0 +1,70 @@
+import time
+import threading
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+from types import MappingProxyType
+from engine.candidate_gen import CandidateGenerator
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    # read-only view of the content table, shared by every request until content changes.
+    # plain dicts behind MappingProxyType, or lazy views over a mmapped engine.artifact
+    version: int
+    content: Mapping
+    tags: Mapping
+    tag_index: Mapping
+    popular: Sequence
+    loaded_at: float
+
+class CatalogStore:
+    def __init__(self, repo, check_every=1.0, artifact=None):
+        self.repo = repo
+        # engine.artifact.ServingArtifact, used while its catalog_version (everything but popularity) is the
+        # current one. popularity edits since the build are overlaid from the popularity_delta table
+        self.artifact = artifact
+        # how often (sec) we ask the db for the content version, so requests in between cost nothing
+        self.check_every = check_every
+        self.lock = threading.Lock()
+        self.snap = None
+        self.last_check = 0.0
+        self.reloads = 0
+
+    def load(self, version):
+        if self.artifact is not None and self.artifact.catalog_version == self.repo.get_catalog_version():
+            changed = self.repo.get_popularity_since(self.artifact.popularity_rowid)
+            content, tags, tag_index, popular = self.artifact.snapshot_views(changed)
+            return CatalogSnapshot(version=version, content=content, tags=tags, tag_index=tag_index, popular=popular, loaded_at=time.time())
+        all_c = self.repo.get_all_content()
+        tags = self.repo.get_content_tags()
+        idx = CandidateGenerator.build_tag_index(tags)
+        pop = sorted(all_c.keys(), key=lambda x: all_c[x]['popularity'], reverse=True)
+        return CatalogSnapshot(
+            version=version,
+            content=MappingProxyType(all_c),
+            tags=MappingProxyType(tags),
+            tag_index=MappingProxyType({t: tuple(v) for t, v in idx.items()}),
+            popular=tuple(pop),
+            loaded_at=time.time()
+        )
+
+    def get(self):
+        now = time.time()
+        snap = self.snap
+        if snap is not None and now - self.last_check < self.check_every:
+            return snap
+        
+        with self.lock:
+            # another thread may have refreshed while we waited
+            if self.snap is not None and now - self.last_check < self.check_every:
+                return self.snap
+            # read the version before loading so a write during load triggers another reload next time
+            ver = self.repo.get_content_version()
+            if self.snap is None or ver != self.snap.version:
+                self.snap = self.load(ver)
+                self.reloads += 1
+            self.last_check = now
+            return self.snap
+
+    def invalidate(self):
+        # force a version check on the next get()
+        self.last_check = 0.0
@@ -1,4 +1,14 @@
 import math
+import numpy as np
+from functools import lru_cache
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+
+METRICS = ("p_at_k", "r_at_k", "ndcg", "map", "mrr")
+
+@lru_cache(maxsize=None)
+def _idcg(n):
+    return sum(1.0 / math.log2(i + 2) for i in range(n))
 
 class RecommendationEvaluator:
     
@@ -23,21 +33,42 @@ class RecommendationEvaluator:
         if not recs or not rel_items: return 0.0
         
         # dcg math shortcut
+        rel = set(rel_items)
         dcg = 0.0
         for i, r in enumerate(recs[:k]):
-            if r in rel_items:
+            if r in rel:
                 dcg += 1.0 / math.log2(i + 2) 
                 
-        # idcg (ideal scenario where all relevant are at the top)
-        idcg = 0.0
-        ideal_hits = min(len(rel_items), k)
-        for i in range(ideal_hits):
-            idcg += 1.0 / math.log2(i + 2)
+        # idcg (ideal scenario where all relevant are at the top), only depends on the count so its memoized
+        idcg = _idcg(min(len(rel_items), k))
             
         return dcg / idcg if idcg > 0 else 0.0
 
+    def map_at_k(self, recs, rel_items, k=10):
+        # average precision, a repeated rec only counts the first time
+        if not recs or not rel_items: return 0.0
+
+        rel = set(rel_items)
+        seen = set()
+        hits, total = 0, 0.0
+        for i, r in enumerate(recs[:k]):
+            if r in rel and r not in seen:
+                hits += 1
+                total += hits / (i + 1)
+            seen.add(r)
+
+        return total / min(len(rel), k)
+
+    def mrr_at_k(self, recs, rel_items, k=10):
+        if not recs or not rel_items: return 0.0
+
+        rel = set(rel_items)
+        for i, r in enumerate(recs[:k]):
+            if r in rel: return 1.0 / (i + 1)
+        return 0.0
+
     def evaluate_all(self, recs_dict, truth_dict, k=10):
-        res = {"p_at_k": 0.0, "r_at_k": 0.0, "ndcg": 0.0}
+        res = {m: 0.0 for m in METRICS}
         valid_u = 0
         
         for uid, recs in recs_dict.items():
@@ -49,6 +80,8 @@ class RecommendationEvaluator:
             res["p_at_k"] += self.precision_at_k(recs, rel, k)
             res["r_at_k"] += self.recall_at_k(recs, rel, k)
             res["ndcg"] += self.ndcg_at_k(recs, rel, k)
+            res["map"] += self.map_at_k(recs, rel, k)
+            res["mrr"] += self.mrr_at_k(recs, rel, k)
             
             valid_u += 1
             
@@ -59,4 +92,101 @@ class RecommendationEvaluator:
         for m in res:
             res[m] = round(res[m] / valid_u, 4)
             
-        return res
\ No newline at end of file
+        return res
+
+    def evaluate_batch(self, recs_dict, truth_dict, k=10, workers=None, chunk=100_000):
+        # same numbers as evaluate_all, but every metric is computed for all users at once on int arrays.
+        # past `chunk` users the work is split across a process pool and the per-metric sums combined
+        uids = [u for u in recs_dict if truth_dict.get(u)]
+        if not uids:
+            return {"error": "no valid users to eval"}
+
+        parts = [([recs_dict[u] for u in uids[i:i + chunk]], [truth_dict[u] for u in uids[i:i + chunk]])
+                 for i in range(0, len(uids), chunk)]
+        if len(parts) == 1 or workers == 1:
+            sums = [_batch_sums(r, t, k) for r, t in parts]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as ex:
+                sums = list(ex.map(_batch_sums, *zip(*parts), [k] * len(parts)))
+
+        return {m: round(math.fsum(s[m] for s in sums) / len(uids), 4) for m in METRICS}
+
+    def per_user_batch(self, recs_list, truth_list, k=10):
+        # {metric: array} with one value per user, row i <-> recs_list[i]
+        return _batch_metrics(recs_list, truth_list, k)
+
+def _flat(lists, k=None):
+    # flattened ids + row index, the loops stay in C (chain/map) rather than per user python
+    lens = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+    if k is None:
+        flat = list(chain.from_iterable(lists))
+    else:
+        lens = np.minimum(lens, k)
+        flat = list(chain.from_iterable(x[:k] for x in lists))
+    return flat, np.repeat(np.arange(len(lists), dtype=np.int64), lens), lens
+
+def _encode(recs_list, truth_list, k):
+    # intern item ids to ints and lay the top-k recs out as a padded [users, k] matrix (-1 = empty).
+    # (row, item) pairs are packed into one int64 key so membership is one sorted lookup
+    n = len(recs_list)
+    recs, rec_rows, lens = _flat(recs_list, k)
+    rel, rel_rows, _ = _flat(truth_list)
+    ids = {r: i for i, r in enumerate(dict.fromkeys(chain(recs, rel)))}
+    code = lambda xs: np.fromiter(map(ids.__getitem__, xs), dtype=np.int64, count=len(xs))
+
+    mat = np.full((n, k), -1, dtype=np.int64)
+    starts = np.cumsum(lens) - lens
+    mat[rec_rows, np.arange(len(recs)) - np.repeat(starts, lens)] = code(recs)
+
+    n_items = max(len(ids), 1)
+    # sort + adjacent diff, np.unique on int64 takes a much slower hashing path
+    rel_keys = np.sort(rel_rows * n_items + code(rel))
+    rel_keys = rel_keys[np.r_[True, rel_keys[1:] != rel_keys[:-1]]] if rel_keys.size else rel_keys
+    rel_uniq = np.bincount(rel_keys // n_items, minlength=n)
+    return mat, n_items, rel_keys, rel_uniq
+
+def _batch_metrics(recs_list, truth_list, k):
+    n = len(recs_list)
+    mat, n_items, rel_keys, rel_uniq = _encode(recs_list, truth_list, k)
+    n_recs = np.array([len(r) for r in recs_list], dtype=np.int64)
+    n_rel = np.array([len(t) for t in truth_list], dtype=np.int64)
+
+    valid = mat >= 0
+    keys = np.arange(n, dtype=np.int64)[:, None] * n_items + mat
+    # rel_keys is sorted and unique, so membership is a binary search (np.isin would re-unique both sides)
+    at = np.minimum(np.searchsorted(rel_keys, keys), max(rel_keys.size - 1, 0))
+    hit = valid & (rel_keys[at] == keys) if rel_keys.size else np.zeros_like(valid)
+
+    # first occurrence of each (user, item), precision/recall/map use set semantics, ndcg doesnt.
+    # only repeats within a row matter and rows are k wide, so compare each column with the ones before it
+    first = valid.copy()
+    for j in range(1, k):
+        first[:, j] &= (mat[:, :j] != mat[:, j:j + 1]).all(axis=1)
+    uhit = hit & first
+
+    ok = (n_recs > 0) & (n_rel > 0)
+    pos = np.arange(1, k + 1, dtype=np.float64)
+    disc = 1.0 / np.log2(pos + 1)
+    idcg = np.array([_idcg(i) for i in range(k + 1)])[np.minimum(n_rel, k)]
+
+    hits = uhit.sum(axis=1)
+    cum = np.cumsum(uhit, axis=1)
+    any_hit = hit.any(axis=1)
+    first_pos = hit.argmax(axis=1)
+
+    def where(cond, num, den):
+        out = np.zeros(n)
+        np.divide(num, den, out=out, where=cond & (den > 0))
+        return out
+
+    return {
+        "p_at_k": where(ok, hits, np.minimum(k, n_recs)),
+        "r_at_k": where(n_rel > 0, hits, n_rel),
+        "ndcg": where(ok, (hit * disc).sum(axis=1), idcg),
+        "map": where(ok, (uhit * cum / pos).sum(axis=1), np.minimum(rel_uniq, k)),
+        "mrr": where(ok & any_hit, 1.0, first_pos + 1.0),
+    }
+
+def _batch_sums(recs_list, truth_list, k):
+    # fsum is exact, so the total doesnt depend on how users were chunked
+    return {m: math.fsum(v) for m, v in _batch_metrics(recs_list, truth_list, k).items()}
@@ -0,0 +1,69 @@
+import os
+import json
+import hashlib
+from dataclasses import dataclass, field
+
+# a/b assignment from a config instead of python's hash(), which is salted per process
+# (PYTHONHASHSEED) so every gunicorn worker and every restart bucketed users differently.
+# bucket = blake2b(salt:uid) mod 10000, variants own consecutive ranges sized by their share.
+# changing the salt reshuffles everyone, changing shares only moves users at the boundaries.
+
+# optional override, relative like ALS_DIR / ARTIFACT_DIR, else DEFAULT_EXPERIMENT
+EXPERIMENT_FILE = os.environ.get("REC_EXPERIMENT_FILE", "experiment.json")
+BUCKETS = 10_000
+
+DEFAULT_EXPERIMENT = {
+    "name": "scoring_weights",
+    "salt": "scoring_weights_v1",
+    "variants": [
+        # interest-heavy vs popularity-heavy, signal name -> weight, applied in this order
+        {"name": "A", "share": 0.5, "weights": {"kg_interest": 1.0, "popular": 0.2}},
+        {"name": "B", "share": 0.5, "weights": {"kg_interest": 0.5, "popular": 0.8}},
+    ],
+}
+
+@dataclass(frozen=True)
+class Variant:
+    name: str
+    share: float
+    weights: dict = field(default_factory=dict)
+
+class Experiment:
+    def __init__(self, name, salt, variants):
+        self.name = name
+        self.salt = salt
+        self.variants = [v if isinstance(v, Variant) else Variant(**v) for v in variants]
+        if not self.variants: raise ValueError("experiment needs at least one variant")
+        if len({v.name for v in self.variants}) != len(self.variants): raise ValueError("variant names must be unique")
+        if abs(sum(v.share for v in self.variants) - 1.0) > 1e-6: raise ValueError("variant shares must add up to 1")
+        # upper bucket bound per variant, last one always closes at BUCKETS so rounding cant leave a gap
+        bounds, acc = [], 0.0
+        for v in self.variants:
+            acc += v.share
+            bounds.append(round(acc * BUCKETS))
+        bounds[-1] = BUCKETS
+        self.bounds = bounds
+
+    @classmethod
+    def from_dict(cls, cfg):
+        return cls(cfg["name"], cfg.get("salt", cfg["name"]), cfg["variants"])
+
+    @classmethod
+    def load(cls, path=None):
+        path = path or EXPERIMENT_FILE
+        if os.path.exists(path):
+            with open(path) as f: return cls.from_dict(json.load(f))
+        return cls.from_dict(DEFAULT_EXPERIMENT)
+
+    def bucket(self, uid):
+        h = hashlib.blake2b(f"{self.salt}:{uid}".encode(), digest_size=8).digest()
+        return int.from_bytes(h, "big") % BUCKETS
+
+    def assign(self, uid):
+        b = self.bucket(uid)
+        for v, hi in zip(self.variants, self.bounds):
+            if b < hi: return v.name
+        return self.variants[-1].name
+
+    def __iter__(self):
+        return iter(self.variants)
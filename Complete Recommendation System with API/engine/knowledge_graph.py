@@ -0,0 +1,277 @@
+import time
+import logging
+import threading
+import numpy as np
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+# skill graph built from what the db already knows: skills that show up on the same content item
+# (plus that item's category) or are held by the same user are related. edge weight is cosine-style
+# co-occurrence, C(a, b) / sqrt(N(a) N(b)), so it sits in (0, 1] and hub skills dont swamp everything.
+# multi-hop weights multiply along the path with an extra decay per hop after the first, and the best
+# path wins. the closure is computed once per graph version, so a request only ever reads a few
+# bounded rows of it.
+
+# the hand-written one hop relations the graph replaced. used while the skill tables have no edges at all
+# (e.g. the shipped db), so interests like "ai" still reach ml / data / vision
+STATIC_RELATIONS = {
+    "ai": ["ml", "data", "vision"],
+    "web": ["js", "frontend", "backend"],
+    "devops": ["backend", "hardware"]
+}
+
+def norm(term):
+    return term.strip().lower()
+
+def _sorted_keys(keys, *cols):
+    # sort by int64 key, returns (unique keys, start offsets, cols in the same order)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return keys[starts], starts, [c[order] for c in cols]
+
+def _top_per_row(rows, cols, vals, k):
+    # best k (row, col) per row by value, ties broken by col so builds are deterministic
+    order = np.lexsort((cols, -vals, rows))
+    rows, cols, vals = rows[order], cols[order], vals[order]
+    starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if rows.size else np.zeros(0, np.int64)
+    rank = np.arange(rows.size) - np.repeat(starts, np.diff(np.r_[starts, rows.size]))
+    keep = rank < k
+    return rows[keep], cols[keep], vals[keep]
+
+def _to_csr(rows, cols, vals, n):
+    order = np.lexsort((-vals, rows))
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+    return indptr, cols[order].astype(np.int32), vals[order].astype(np.float32)
+
+def cooc_edges(groups, nodes, weights, n, max_degree=32, min_weight=0.05):
+    # groups/nodes/weights = one row per (group, member). pairs inside a group count w_a * w_b.
+    # groups are small (an item's tags, a user's skills), so pairs are built by comparing
+    # each row with the one k places after it in group order, for k up to the largest group
+    order = np.lexsort((nodes, groups))
+    g, v, w = groups[order], nodes[order].astype(np.int64), weights[order].astype(np.float64)
+    deg = np.bincount(v, weights=w, minlength=n)
+    a, b, c = [], [], []
+    k = 1
+    while k < g.size and (g[k:] == g[:-k]).any():
+        same = np.flatnonzero((g[k:] == g[:-k]) & (v[k:] != v[:-k]))
+        a.append(v[same]); b.append(v[same + k]); c.append(w[same] * w[same + k])
+        k += 1
+    if not a:
+        return _to_csr(np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0), n)
+    a, b, c = np.concatenate(a), np.concatenate(b), np.concatenate(c)
+    # both directions, then sum duplicates
+    src, dst, cnt = np.r_[a, b], np.r_[b, a], np.r_[c, c]
+    keys, starts, (cnt,) = _sorted_keys(src * n + dst, cnt)
+    cnt = np.add.reduceat(cnt, starts)
+    src, dst = keys // n, keys % n
+    wt = cnt / np.sqrt(deg[src] * deg[dst])
+    keep = wt >= min_weight
+    return _to_csr(*_top_per_row(src[keep], dst[keep], wt[keep], max_degree), n)
+
+def _edge_pos(indptr, deg, mids):
+    # positions in indices/weights of every out edge of every node in mids, in order
+    d = deg[mids]
+    return np.repeat(indptr[mids] - np.cumsum(np.r_[0, d[:-1]]), d) + np.arange(d.sum()), d
+
+def closure(indptr, indices, weights, decay=0.5, max_hops=3, top_k=50, min_weight=0.05, block=2048):
+    # best path weight from every node to everything within max_hops, top_k per node, as csr.
+    # done for a block of sources at a time: each hop extends only the paths that improved on the
+    # last hop by one edge, then keeps the max per (source, target)
+    n = len(indptr) - 1
+    deg = np.diff(indptr)
+    out_r, out_c, out_v = [], [], []
+    for lo in range(0, n, block):
+        src = np.arange(lo, min(lo + block, n))
+        pos, d = _edge_pos(indptr, deg, src)
+        rows, cols, vals = np.repeat(src, d), indices[pos], weights[pos]
+        fr, fc, fv = rows, cols, vals
+        for _ in range(max_hops - 1):
+            if not fr.size: break
+            # extend every frontier path (s -> m) by every edge (m -> t)
+            pos, d = _edge_pos(indptr, deg, fc)
+            er = np.repeat(fr, d)
+            ec, ev = indices[pos], np.repeat(fv, d) * weights[pos] * decay
+            keep = (ev >= min_weight) & (ec != er)
+            er, ec, ev = er[keep], ec[keep], ev[keep]
+            # merge with what we already have, max per (s, t), remember which entries are new
+            allr, allc, allv = np.r_[rows, er], np.r_[cols, ec], np.r_[vals, ev]
+            new = np.r_[np.zeros(rows.size, bool), np.ones(er.size, bool)]
+            order = np.lexsort((new, -allv, allc, allr))
+            allr, allc, allv, new = allr[order], allc[order], allv[order], new[order]
+            first = np.r_[True, (allr[1:] != allr[:-1]) | (allc[1:] != allc[:-1])]
+            allr, allc, allv, new = allr[first], allc[first], allv[first], new[first]
+            rows, cols, vals = allr, allc, allv
+            fr, fc, fv = allr[new], allc[new], allv[new]
+        r, c, v = _top_per_row(rows, cols.astype(np.int64), vals, top_k)
+        out_r.append(r); out_c.append(c); out_v.append(v)
+    if not out_r:
+        return _to_csr(np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0), n)
+    return _to_csr(np.concatenate(out_r), np.concatenate(out_c), np.concatenate(out_v), n)
+
+class KnowledgeGraph:
+    # interned node names + the precomputed closure, plus a per-user cache of expanded interests.
+    # the cache belongs to this graph, so a rebuilt graph starts with an empty one
+    def __init__(self, names, indptr, indices, weights, version=None, max_users=100_000):
+        self.names = list(names)
+        self.node = {t: n for n, t in enumerate(self.names)}
+        self.indptr, self.indices, self.weights = indptr, indices, weights
+        self.version = version
+        self.max_users = max_users
+        self.lock = threading.Lock()
+        self.users = OrderedDict() # uid -> (raw interests, skills, expanded), oldest first
+        self.hits = self.misses = 0
+
+    @classmethod
+    def build(cls, content_rows, user_rows, version=None, decay=0.5, max_hops=3, top_k=50, max_degree=32, min_weight=0.05):
+        # content_rows = (content_id, category, skill), user_rows = (user_id, skill, proficiency)
+        node = {}
+        def intern(t): return node.setdefault(norm(t), len(node))
+        g, v, w = [], [], []
+        items = {}
+        for cid, cat, skill in content_rows:
+            gid = items.get(cid)
+            if gid is None:
+                gid = items[cid] = len(items)
+                if cat: g.append(gid); v.append(intern(cat)); w.append(1.0)
+            g.append(gid); v.append(intern(skill)); w.append(1.0)
+        users = {}
+        for uid, skill, prof in user_rows:
+            gid = users.setdefault(uid, len(items) + len(users))
+            g.append(gid); v.append(intern(skill)); w.append(prof if prof else 1.0)
+        n = len(node)
+        edges = cooc_edges(np.array(g, np.int64), np.array(v, np.int64), np.array(w, np.float64), n, max_degree, min_weight)
+        if not edges[1].size: return cls.static(version=version)
+        names = sorted(node, key=node.get)
+        return cls(names, *closure(*edges, decay=decay, max_hops=max_hops, top_k=top_k, min_weight=min_weight), version=version)
+
+    @classmethod
+    def static(cls, relations=STATIC_RELATIONS, version=None):
+        # closure straight from {term: [related]}, one hop at full weight like the old hard-coded map
+        node = {}
+        def intern(t): return node.setdefault(norm(t), len(node))
+        rows, cols = [], []
+        for t, rel in relations.items():
+            for r in rel:
+                rows.append(intern(t)); cols.append(intern(r))
+        rows, cols = np.array(rows, np.int64), np.array(cols, np.int64)
+        return cls(sorted(node, key=node.get), *_to_csr(rows, cols, np.ones(rows.size), len(node)), version=version)
+
+    def __len__(self):
+        return len(self.names)
+
+    def related(self, term):
+        # [(name, weight)] strongest first, straight out of the closure
+        n = self.node.get(norm(term))
+        if n is None: return []
+        lo, hi = self.indptr[n], self.indptr[n + 1]
+        return [(self.names[c], float(w)) for c, w in zip(self.indices[lo:hi].tolist(), self.weights[lo:hi].tolist())]
+
+    def expand(self, base):
+        # base = {term: weight}, result = {term: weight}, base terms keep their own weight,
+        # everything else gets the best base weight * closure weight
+        res = {}
+        for t, bw in base.items():
+            t = norm(t)
+            if not t: continue
+            res[t] = max(res.get(t, 0.0), bw)
+            n = self.node.get(t)
+            if n is None: continue
+            lo, hi = self.indptr[n], self.indptr[n + 1]
+            for c, w in zip(self.indices[lo:hi].tolist(), self.weights[lo:hi].tolist()):
+                name = self.names[c]
+                if bw * w > res.get(name, 0.0): res[name] = bw * w
+        return res
+
+    def user_interests(self, uid, raw, skills=()):
+        # raw = the users.interests string, skills = [(skill, proficiency)] from user_skills.
+        # cached until either of them changes for this user
+        skills = tuple(skills)
+        with self.lock:
+            hit = self.users.get(uid)
+            if hit is not None and hit[0] == raw and hit[1] == skills:
+                self.users.move_to_end(uid)
+                self.hits += 1
+                return hit[2]
+            self.misses += 1
+        base = {t: 1.0 for t in (raw.split(",") if raw else [])}
+        for s, p in skills:
+            base[s] = max(base.get(s, 0.0), p if p else 1.0)
+        res = self.expand(base)
+        with self.lock:
+            self.users[uid] = (raw, skills, res)
+            self.users.move_to_end(uid)
+            while len(self.users) > self.max_users: self.users.popitem(last=False)
+        return res
+
+    def forget(self, uid):
+        with self.lock:
+            self.users.pop(uid, None)
+
+    def stats(self):
+        with self.lock:
+            return {"nodes": len(self.names), "edges": int(self.indices.size), "version": self.version,
+                    "cached_users": len(self.users), "hits": self.hits, "misses": self.misses}
+
+class KnowledgeGraphStore:
+    # same shape as CatalogStore: a cheap fingerprint check at most every check_every seconds,
+    # rebuild only when the skill tables (or content categories) changed. only the very first build
+    # blocks, later ones run in a background thread while readers keep the current graph, then swap in
+    def __init__(self, repo, check_every=5.0, artifact=None, **opts):
+        self.repo = repo
+        # engine.artifact.ServingArtifact with a prebuilt closure, used while its version is the current one
+        self.artifact = artifact
+        self.check_every = check_every
+        self.opts = opts
+        self.lock = threading.Lock()
+        self.graph = None
+        self.last_check = 0.0
+        self.reloads = self.failures = 0
+        self.builder = None
+
+    def load(self, version):
+        if self.artifact is not None and self.artifact.skill_graph_version == tuple(version):
+            return self.artifact.knowledge_graph()
+        content_rows, user_rows = self.repo.get_skill_graph_rows()
+        return KnowledgeGraph.build(content_rows, user_rows, version=version, **self.opts)
+
+    def get(self):
+        now = time.time()
+        graph = self.graph
+        if graph is not None and now - self.last_check < self.check_every:
+            return graph
+        with self.lock:
+            if self.graph is not None and now - self.last_check < self.check_every:
+                return self.graph
+            self.last_check = now
+            ver = self.repo.get_skill_graph_version()
+            if self.graph is None:
+                self.graph = self.load(ver)
+                self.reloads += 1
+            elif ver != self.graph.version and self.builder is None:
+                self.builder = threading.Thread(target=self._rebuild, args=(ver,), name="kg-rebuild", daemon=True)
+                self.builder.start()
+            return self.graph
+
+    def _rebuild(self, ver):
+        try:
+            graph = self.load(ver)
+            with self.lock:
+                self.graph = graph
+                self.reloads += 1
+        except Exception:
+            log.exception("knowledge graph rebuild for version %s failed", ver)
+            with self.lock: self.failures += 1
+        finally:
+            # ver was read before the build, anything written since shows up as a newer version on the next check
+            with self.lock: self.builder = None
+
+    def wait(self, timeout=None):
+        # blocks until a running background rebuild is done (tests, warmup scripts)
+        builder = self.builder
+        if builder is not None: builder.join(timeout)
+
+    def invalidate(self):
+        self.last_check = 0.0
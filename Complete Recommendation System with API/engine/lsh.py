@@ -0,0 +1,67 @@
+import zlib
+import heapq
+import numpy as np
+from collections import defaultdict
+
+MERSENNE = np.uint64((1 << 61) - 1)
+
+class MinHashLSH:
+    # approximate jaccard neighbours: minhash signatures split into bands, each band hashed to a bucket.
+    # two sets collide in a band with prob j^rows, so more rows = precision, more bands = recall
+    def __init__(self, bands=16, rows=4, seed=1):
+        self.bands = bands
+        self.rows = rows
+        rng = np.random.RandomState(seed)
+        n = bands * rows
+        self.a = rng.randint(1, 1 << 31, size=n, dtype=np.int64).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 31, size=n, dtype=np.int64).astype(np.uint64)
+
+        self.sigs = {}
+        self.buckets = [defaultdict(set) for _ in range(bands)]
+
+    def signature(self, items):
+        # crc32 instead of hash() so signatures are stable across processes
+        if not items: return np.full(self.bands * self.rows, np.iinfo(np.uint64).max, dtype=np.uint64)
+        h = np.array([zlib.crc32(str(i).encode()) for i in items], dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            perm = (h[:, None] * self.a[None, :] + self.b[None, :]) % MERSENNE
+        return perm.min(axis=0)
+
+    def _band_keys(self, sig):
+        return [sig[b * self.rows:(b + 1) * self.rows].tobytes() for b in range(self.bands)]
+
+    def add(self, key, items):
+        # an empty set has no minimum, its all-max signature would collide with every other empty set
+        # at estimated jaccard 1.0 (exact jaccard is 0), so it is never indexed
+        if key in self.sigs: self.remove(key)
+        if not items: return
+        sig = self.signature(items)
+        self.sigs[key] = sig
+        for b, bk in enumerate(self._band_keys(sig)):
+            self.buckets[b][bk].add(key)
+
+    def remove(self, key):
+        sig = self.sigs.pop(key, None)
+        if sig is None: return
+        for b, bk in enumerate(self._band_keys(sig)):
+            bucket = self.buckets[b][bk]
+            bucket.discard(key)
+            if not bucket: del self.buckets[b][bk]
+
+    def candidates(self, items):
+        sig = self.signature(items)
+        found = set()
+        if not items: return sig, found
+        for b, bk in enumerate(self._band_keys(sig)):
+            found.update(self.buckets[b].get(bk, ()))
+        return sig, found
+
+    def query(self, items, k=10, exclude=None):
+        # only keys sharing a bucket are scored, ranked by estimated jaccard (sig agreement)
+        sig, found = self.candidates(items)
+        found.discard(exclude)
+        scored = ((key, float(np.mean(self.sigs[key] == sig))) for key in found)
+        return heapq.nlargest(k, scored, key=lambda kv: kv[1])
+
+    def __len__(self):
+        return len(self.sigs)
@@ -1,82 +1,288 @@
+import os
+import json
 import time
-from data.database import get_conn
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from data.repositories import MainRepo
 from engine.candidate_gen import CandidateGenerator
 from engine.scorer import RecommendationScorer
-import contextlib
+from engine.catalog import CatalogStore
+from engine.knowledge_graph import KnowledgeGraphStore
+from engine.cache import RecCache, SingleFlight
+from data.feedback_writer import FeedbackWriter
+from engine.telemetry import REGISTRY, StageTimer
+from engine.als import ALS_DIR, ALSModel
+from engine.artifact import ARTIFACT_DIR, ServingArtifact
+from engine.experiments import Experiment
+import numpy as np
+
+log = logging.getLogger(__name__)
+
+# batch signals: one call per signal for the whole candidate list, catalog + per-user data come in via ctx
+def match_score(u, iids, ctx):
+    # direct interest 1.2, related via the KG somewhere between 0.1 and 1.2 by graph weight
+    ints, all_c = ctx['interests'], ctx['content']
+    return 0.1 + 1.1 * np.array([ints.get(all_c.get(i, {}).get('category', ''), 0.0) for i in iids])
+
+def pop_score(u, iids, ctx):
+    all_c = ctx['content']
+    return np.array([all_c.get(i, {}).get('popularity', 0.0) for i in iids], dtype=np.float64)
+
+# names an experiment config can put weights on
+SIGNALS = {"kg_interest": match_score, "popular": pop_score}
 
 class RecOrchestrator:
-    def __init__(self):
+    def __init__(self, async_writes=True):
         self.repo = MainRepo()
-        self.cache = {}
         self.cache_ttl = 300 
-        
-        # Simple Knowledge Graph for skill relationships
-        self.kg = {
-            "ai": ["ml", "data", "vision"],
-            "web": ["js", "frontend", "backend"],
-            "devops": ["backend", "hardware"]
-        }
+        # every miss ranks (and caches) at least this many, so the entry answers any smaller limit later
+        self.cache_top_n = 20
+        # past the ttl an entry is still served (cached: "stale") for this long while it is refreshed in the background
+        self.cache_grace = 600
+        # bounded + thread-safe, flask runs threaded
+        self.cache = RecCache(max_entries=10_000, ttl=self.cache_ttl, grace=self.cache_grace)
+        # background recomputes for stale / about to expire hot entries, at most one queued per uid
+        self.refresh_workers = 2
+        self.refresher = None
+        self.refreshing = set()
+        self.refresh_lock = threading.Lock()
+        # concurrent misses for one uid share a single computation, waiters give up after coalesce_timeout sec
+        self.flights = SingleFlight()
+        self.coalesce_timeout = 2.0
+        # catalog / histories / neighbours from scripts/build_artifact.py, mmapped read only so every
+        # gunicorn worker shares one copy. rows newer than the build still come from the db
+        self.artifact = ServingArtifact.load(ARTIFACT_DIR) if os.path.exists(os.path.join(ARTIFACT_DIR, "meta.json")) else None
+        self.catalog = CatalogStore(self.repo, artifact=self.artifact)
+        self.precompute_max_age = 24 * 3600
+        self.telemetry = REGISTRY
+        # drop the cache again once the row is committed, a request between submit and flush may have re-cached old recs
+        self.writer = FeedbackWriter(self.repo, on_flush=self.invalidate) if async_writes else None
+        # factors from scripts/train_als.py, mmapped so workers share the pages. retrain + restart to refresh
+        self.als = ALSModel.load(ALS_DIR) if os.path.exists(os.path.join(ALS_DIR, "meta.json")) else None
+        # weighted skill graph from the skills / user_skills / content_skills tables, multi-hop closure
+        # precomputed per graph version, expanded interests cached per user
+        self.kg = KnowledgeGraphStore(self.repo, artifact=self.artifact)
+        # A/B Testing: stable buckets from the experiment config (engine/experiments.py), one scoring
+        # pipeline per variant compiled here and shared by every request
+        self.experiment = Experiment.load()
+        self.pipelines = {v.name: self.build_scorer(v) for v in self.experiment}
+        self.model_version = self.get_model_version()
 
-    def get_recs(self, uid, limit=5):
-        now = time.time()
-        if uid in self.cache:
-            ts, recs = self.cache[uid]
-            if now - ts < self.cache_ttl:
-                return {"data": recs, "cached": True, "ab_group": self.get_ab_group(uid)}
-
-        u_hist = {uid: self.repo.get_user_hist(uid)}
-        all_c = self.repo.get_all_content()
-        tags = self.repo.get_content_tags()
-        
-        pop_items = sorted(all_c.keys(), key=lambda x: all_c[x]['popularity'], reverse=True)[:10]
+    def build_scorer(self, variant):
+        scorer = RecommendationScorer()
+        for name, w in variant.weights.items():
+            if name not in SIGNALS: raise ValueError(f"variant {variant.name}: unknown signal {name!r}")
+            scorer.add_batch_scorer(name, SIGNALS[name], w)
+        return scorer
 
-        gen = CandidateGenerator(u_hist, tags, pop_items)
-        cands = gen.hybrid_candidates(uid, limit=20)
+    def get_model_version(self):
+        # fingerprint of everything besides the data that decides what a user gets (variant weights, als
+        # factors), stamped on precomputed rows so a new config or retrained model doesnt serve old ones
+        cfg = {"experiment": [self.experiment.salt] + [[v.name, v.share, v.weights] for v in self.experiment],
+               "als": self.als.meta if self.als else None}
+        return hashlib.blake2b(json.dumps(cfg, sort_keys=True, default=str).encode(), digest_size=8).hexdigest()
 
-        with contextlib.closing(get_conn()) as c:
-            u_row = c.execute("SELECT interests FROM users WHERE id=?", (uid,)).fetchone()
-            base_int = u_row['interests'].split(',') if u_row and u_row['interests'] else []
-            
-            # Expand interests using Knowledge Graph
-            exp_int = set(base_int)
-            for i in base_int:
-                if i in self.kg:
-                    exp_int.update(self.kg[i])
+    def cache_key(self, uid, variant=None):
+        # variant is part of the key so a reassigned user never gets the other variants list
+        return (variant or self.get_ab_group(uid), uid)
 
-        scorer = RecommendationScorer()
+    def user_hist(self, uid):
+        if self.artifact is None: return self.repo.get_user_hist(uid)
+        return self.artifact.user_hist(uid) + self.repo.get_user_hist(uid, after_id=self.artifact.max_rowid)
 
-        # A/B Testing logic
-        ab_group = self.get_ab_group(uid)
+    def user_hists(self, uids):
+        if self.artifact is None: return self.repo.get_user_hists(uids)
+        new = self.repo.get_user_hists(uids, after_id=self.artifact.max_rowid)
+        res = {u: self.artifact.user_hist(u) + new.get(u, []) for u in uids}
+        return {u: h for u, h in res.items() if h}
 
-        def match_score(u, i, ctx):
-            cat = all_c.get(i, {}).get('category', '')
-            return 1.2 if cat in exp_int else 0.1 # Boosted by KG
+    def item_neighbors(self, items):
+        # the artifact copy is as of its build, live co-occurrence bumps show up after the next build
+        if self.artifact is None: return self.repo.get_item_neighbors(items)
+        return self.artifact.item_neighbors(items)
 
-        def pop_score(u, i, ctx):
-            return all_c.get(i, {}).get('popularity', 0.0)
+    def expand_interests(self, uid, raw, skills=()):
+        # {term: weight}, recomputed only when the users interests / skills or the graph change
+        return self.kg.get().user_interests(uid, raw, skills)
 
-        # Group A gets interest-heavy recs, Group B gets popularity-heavy recs
-        if ab_group == "A":
-            scorer.add_scorer("kg_interest", match_score, 1.0)
-            scorer.add_scorer("popular", pop_score, 0.2)
-        else:
-            scorer.add_scorer("kg_interest", match_score, 0.5)
-            scorer.add_scorer("popular", pop_score, 0.8)
+    def rank_user(self, uid, hist, interests, snap, nbrs, scorer, limit=5, timer=None, skills=()):
+        timer = timer or StageTimer()
+        with timer.stage("candidates"):
+            if nbrs is None and self.als is None: nbrs = self.item_neighbors(hist)
+            u_hist = {uid: hist}
+            gen = CandidateGenerator(u_hist, snap.tags, list(snap.popular[:10]), tag_index=snap.tag_index, item_neighbors=nbrs, als=self.als, telemetry=self.telemetry)
+            cands = gen.hybrid_candidates(uid, limit=20)
+
+        with timer.stage("interests"):
+            exp_int = self.expand_interests(uid, interests, skills)
+
+        with timer.stage("scoring"):
+            ranked = scorer.rank_batch(uid, cands, limit=limit, ctx={"interests": exp_int, "content": snap.content})
+            return [{"id": r['item'], "title": snap.content[r['item']]['title'], "score": round(r['score'], 2), "reason": r['reason']} for r in ranked]
+
+    def get_recs(self, uid, limit=5):
+        st = time.perf_counter()
+        variant = self.get_ab_group(uid)
+        res = self._get_recs(uid, variant, limit)
+        # per-variant latency + how each request was answered, /metrics turns these into hit rates
+        labels = {"variant": variant}
+        self.telemetry.observe("rec_variant_duration_ms", (time.perf_counter() - st) * 1000, labels)
+        self.telemetry.inc("rec_variant_requests_total", dict(labels, cached={True: "hit", False: "miss"}.get(res["cached"], res["cached"])))
+        return res
 
-        ranked = scorer.rank_candidates(uid, cands, limit=limit)
+    def _get_recs(self, uid, variant, limit):
+        key = self.cache_key(uid, variant)
+        # entries are (top_n they were ranked for, recs), one ranked for fewer than limit counts as a miss
+        entry, state = self.cache.lookup(key)
+        if entry is not None and entry[0] >= limit:
+            top_n, recs = entry
+            # stale or hot + close to expiry: answer from cache now, recompute off the request path
+            if state != "fresh": self.schedule_refresh(uid, variant, top_n, state)
+            return {"data": recs[:limit], "cached": "stale" if state == "stale" else True, "ab_group": variant}
+
+        res, shared = self.flights.do(key, lambda: self.compute_recs(uid, limit, variant), self.coalesce_timeout)
+        if shared:
+            # the leader may have been asked for a bigger top-n than we were, never a smaller one than limit
+            if res["top_n"] < limit: res = self.compute_recs(uid, limit, variant)
+            else:
+                self.telemetry.inc("rec_coalesced_total")
+                res = dict(res, cached="coalesced")
+        return {"data": res["data"][:limit], "cached": res["cached"], "ab_group": res["ab_group"]}
+
+    def schedule_refresh(self, uid, variant, limit, reason):
+        key = self.cache_key(uid, variant)
+        # feedback after this point (cache.delete bumps the generation) cancels the refresh, or drops its result
+        gen = self.cache.generation(key)
+        with self.refresh_lock:
+            if key in self.refreshing: return False
+            self.refreshing.add(key)
+            # created on first use so a forked worker gets its own threads
+            if self.refresher is None:
+                self.refresher = ThreadPoolExecutor(max_workers=self.refresh_workers, thread_name_prefix="rec-refresh")
+        self.telemetry.inc("rec_refresh_total", {"reason": reason})
+        self.refresher.submit(self._refresh, key, limit, gen)
+        return True
+
+    def _refresh(self, key, limit, gen=None):
+        variant, uid = key
+        try:
+            if gen is not None and self.cache.generation(key) != gen:
+                # invalidated while queued, the next request recomputes from the new history anyway
+                self.telemetry.inc("rec_refresh_cancelled_total")
+                return
+            # through the same single-flight as the request path, so a refresh and a miss never both compute
+            self.flights.do(key, lambda: self.compute_recs(uid, limit, variant, gen))
+        except Exception:
+            log.exception("background refresh for %s failed", uid)
+            self.telemetry.inc("rec_refresh_failures_total")
+        finally:
+            with self.refresh_lock:
+                self.refreshing.discard(key)
+
+    def compute_recs(self, uid, limit=5, variant=None, gen=None):
+        # the miss path, get_recs makes sure only one of these runs per uid at a time.
+        # returns the full top-n it ranked (and cached), callers cut it down to their limit
+        top_n = max(limit, self.cache_top_n)
+        variant = variant or self.get_ab_group(uid)
+        key = self.cache_key(uid, variant)
+        # read before any user data: if feedback invalidates the key while we compute, the result is from
+        # the old history and cache.set drops it instead of caching it as fresh
+        # (a background refresh passes the generation it was scheduled under)
+        gen = self.cache.generation(key) if gen is None else gen
+        timer = StageTimer()
+        # shared snapshot, only reloaded when the content table changes
+        with timer.stage("catalog"):
+            snap = self.catalog.get()
+        
+        # offline job output (scripts/precompute_recs.py), used while the user and catalog are unchanged
+        with timer.stage("precomputed"):
+            pre = self.repo.get_precomputed(uid, self.precompute_max_age, self.model_version)
+        # (rows from before a change to the experiment config belong to another variant, skip those)
+        if pre and pre['content_version'] == snap.version and pre['ab_group'] == variant and pre['top_n'] >= limit:
+            timer.record(self.telemetry)
+            self.cache.set(key, (pre['top_n'], pre['recs']), gen=gen)
+            return {"data": pre['recs'], "top_n": pre['top_n'], "cached": "precomputed", "ab_group": variant}
+
+        with timer.stage("history"):
+            hist = self.user_hist(uid)
+        with timer.stage("interests"):
+            interests = self.repo.get_user_interests([uid]).get(uid)
+            skills = self.repo.get_user_skills([uid]).get(uid, ())
+
+        res = self.rank_user(uid, hist, interests, snap, None, self.pipelines[variant], top_n, timer, skills)
+        timer.record(self.telemetry)
+        self.cache.set(key, (top_n, res), gen=gen)
         
-        res = [{"id": r['item'], "title": all_c[r['item']]['title'], "score": round(r['score'], 2), "reason": r['reason']} for r in ranked]
-        self.cache[uid] = (now, res)
+        return {"data": res, "top_n": top_n, "cached": False, "ab_group": variant}
+
+    def get_recs_batch(self, uids, limit=5, chunk=500):
+        # generator for bulk jobs: one catalog snapshot for the whole batch, the prebuilt variant pipelines,
+        # and users/histories/neighbours loaded per chunk instead of per user.
+        # peeks at the cache but doesnt fill it (or count in its stats) so a big job cant evict the hot online users
+        snap = self.catalog.get()
         
-        return {"data": res, "cached": False, "ab_group": ab_group}
+        for n in range(0, len(uids), chunk):
+            part = uids[n:n + chunk]
+            groups = {u: self.get_ab_group(u) for u in part}
+            hits = {u: self.cache.peek(self.cache_key(u, groups[u])) for u in part}
+            # same rule as get_recs: an entry ranked for fewer than limit is no hit
+            hits = {u: e[1] if e is not None and e[0] >= limit else None for u, e in hits.items()}
+            todo = [u for u in part if hits[u] is None]
+            
+            users = self.repo.get_user_interests(todo)
+            hists = self.user_hists([u for u in todo if u in users])
+            skills = self.repo.get_user_skills([u for u in todo if u in users])
+            nbrs = self.item_neighbors({i for h in hists.values() for i in h}) if self.als is None else {}
+            
+            for uid in part:
+                ab_group = groups[uid]
+                if hits[uid] is not None:
+                    yield {"user_id": uid, "ab_group": ab_group, "cached": True, "recommendations": hits[uid][:limit]}
+                elif uid not in users:
+                    yield {"user_id": uid, "err": "user not found"}
+                else:
+                    res = self.rank_user(uid, hists.get(uid, []), users[uid], snap, nbrs, self.pipelines[ab_group], limit, skills=skills.get(uid, ()))
+                    yield {"user_id": uid, "ab_group": ab_group, "cached": False, "recommendations": res}
 
     def get_ab_group(self, uid):
-        # basic hash to split users into A or B
-        return "A" if hash(uid) % 2 == 0 else "B"
+        # same answer in every worker and across restarts, see engine/experiments.py
+        return self.experiment.assign(uid)
+
+    def experiment_stats(self):
+        # per variant: request count, how requests were answered, in-memory cache hit rate (fresh + stale), latency
+        lat = self.telemetry.summaries("rec_variant_duration_ms", by=("variant",))
+        res = {}
+        for v in self.experiment:
+            by = {k: self.telemetry.counter("rec_variant_requests_total", {"variant": v.name, "cached": k})
+                  for k in ("hit", "stale", "miss", "coalesced", "precomputed")}
+            total = sum(by.values())
+            res[v.name] = {"share": v.share, "weights": v.weights, "requests": total, "answered": by,
+                           "cache_hit_rate": round((by["hit"] + by["stale"]) / total, 4) if total else 0.0,
+                           "latency_ms": lat.get(v.name)}
+        return {"name": self.experiment.name, "salt": self.experiment.salt, "variants": res}
+
+    def invalidate(self, uids):
+        # drop cached recs (and any computation already running from the old history) for these users
+        for uid in uids:
+            key = self.cache_key(uid)
+            self.cache.delete(key)
+            self.flights.forget(key)
+            # a refresh still queued for the key is a no-op now (generation moved), let a new one be scheduled
+            with self.refresh_lock: self.refreshing.discard(key)
 
     def add_feedback(self, uid, cid, rating):
         # Real-time personalization (clears cache so next req is instant new rec)
-        self.repo.log_interaction(uid, cid, "rating", rating)
-        if uid in self.cache: del self.cache[uid] 
-        return True
\ No newline at end of file
+        # the write itself is batched in the background, log_interactions also bumps the co-occurrence table
+        if self.writer:
+            self.writer.submit(uid, cid, "rating", rating)
+        else:
+            self.repo.log_interaction(uid, cid, "rating", rating)
+        self.invalidate([uid])
+        return True
+
+    def close(self):
+        # flushes + stops the feedback writer and the refresh pool, for scripts / tests that build several of these
+        if self.writer: self.writer.close()
+        if self.refresher: self.refresher.shutdown(wait=True)
@@ -1,13 +1,33 @@
 import heapq
+import numpy as np
+
+def as_batch(func):
+    # adapter: per-item func (uid, iid, ctx) -> batch func (uid, iids, ctx) returning an array
+    def batch(uid, iids, ctx):
+        return np.fromiter((func(uid, i, ctx) for i in iids), dtype=np.float64, count=len(iids))
+    return batch
+
+def as_item(func):
+    # and the other way round so calculate_score still sees batch-only signals
+    def item(uid, iid, ctx):
+        return float(func(uid, [iid], ctx)[0])
+    return item
 
 class RecommendationScorer:
     def __init__(self):
         # Simple strategy pattern to hold scoring funcs
         self.scorers = {} 
+        self.batch_scorers = {}
 
     def add_scorer(self, name, func, weight=1.0):
         # func should take (uid, iid, ctx) and return 0-1
         self.scorers[name] = (func, weight)
+        self.batch_scorers[name] = (as_batch(func), weight)
+
+    def add_batch_scorer(self, name, func, weight=1.0):
+        # func should take (uid, iids, ctx) and return an array of scores, one per iid
+        self.batch_scorers[name] = (func, weight)
+        self.scorers[name] = (as_item(func), weight)
 
     def calculate_score(self, uid, iid, ctx=None):
         if not self.scorers:
@@ -45,4 +65,41 @@ class RecommendationScorer:
             neg_s, iid, exp = heapq.heappop(h)
             res.append({"item": iid, "score": -neg_s, "reason": exp})
             
-        return res
\ No newline at end of file
+        return res
+
+    def explain(self, signals):
+        # signals = {name: score} for a single item, same format as calculate_score
+        reasons = [f"{name}:{round(s, 2)}" for name, s in signals.items() if s > 0]
+        exp = " + ".join(reasons) if reasons else "baseline"
+        return f"scored by [ {exp} ]"
+
+    def score_batch(self, uid, candidates, ctx=None):
+        # one call per signal over the whole candidate array, weighted sum in numpy
+        names = list(self.batch_scorers)
+        mat = np.zeros((len(names), len(candidates)))
+        w = np.zeros(len(names))
+        for n, name in enumerate(names):
+            func, w[n] = self.batch_scorers[name]
+            mat[n] = func(uid, candidates, ctx)
+        final = w @ mat / w.sum() if w.sum() > 0 else np.zeros(len(candidates))
+        return final, names, mat
+
+    def rank_batch(self, uid, candidates, limit=10, ctx=None):
+        # same output as rank_candidates but vectorized; reasons only built for returned items
+        candidates = list(candidates)
+        if not candidates or limit <= 0: return []
+        if not self.batch_scorers:
+            return [{"item": i, "score": 0.0, "reason": "no scorers found"} for i in sorted(candidates)[:limit]]
+        
+        final, names, mat = self.score_batch(uid, candidates, ctx)
+        
+        # argpartition finds the k-th best, then keep everything tied with it so ordering matches the heap
+        if limit < len(candidates):
+            kth = final[np.argpartition(-final, limit - 1)[limit - 1]]
+            top = np.flatnonzero(final >= kth)
+        else:
+            top = np.arange(len(candidates))
+        top = sorted(top, key=lambda n: (-final[n], candidates[n]))[:limit]
+        
+        return [{"item": candidates[n], "score": float(final[n]),
+                 "reason": self.explain({name: mat[s, n] for s, name in enumerate(names)})} for n in top]
\ No newline at end of file
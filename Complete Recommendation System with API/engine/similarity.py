@@ -1,4 +1,5 @@
 import math
+import numpy as np
 
 # Decorator to handle zero division / empty data edge cases cleanly
 def safe_compute(func):
@@ -47,4 +48,116 @@ class SimilarityCalculator:
         num = p_sum - (sum1 * sum2 / n)
         den = math.sqrt((sum1_sq - sum1**2 / n) * (sum2_sq - sum2**2 / n))
         
-        return num / den
\ No newline at end of file
+        return num / den
+
+    # --- batch versions: one vector vs a whole CSRMatrix, or every row vs every row in blocks.
+    # results line up with mat.keys and match the scalar methods above
+
+    def build_matrix(self, rows):
+        return CSRMatrix(rows)
+
+    def cosine_many(self, vec, mat):
+        q, _ = mat.densify(vec)
+        q_norm = math.sqrt(sum(v**2 for v in vec.values()))
+        return _safe_div(mat.matvec(q), mat.norms * q_norm)
+
+    def jaccard_many(self, items, mat):
+        _, qb = mat.densify(items)
+        inter = mat.matvec(qb, np.ones_like(mat.data))
+        return _safe_div(inter, len(items) + mat.nnz - inter)
+
+    def pearson_many(self, vec, mat):
+        qv, qb = mat.densify(vec)
+        ones = np.ones_like(mat.data)
+        return _pearson(mat.matvec(qb, ones), mat.matvec(qv, ones), mat.matvec(qb),
+                        mat.matvec(qv**2, ones), mat.matvec(qb, mat.data**2), mat.matvec(qv))
+
+    def pairwise(self, mat, metric="cosine", block=256):
+        # yields (start, scores) where scores[j, r] = sim(row start+j, row r)
+        ones, vals, sq = np.ones_like(mat.data), mat.data, mat.data**2
+        for start in range(0, mat.shape[0], block):
+            stop = min(start + block, mat.shape[0])
+            dot = lambda q_w, x_w: mat.block_dot(start, stop, q_w, x_w)
+            
+            if metric == "cosine":
+                yield start, _safe_div(dot(vals, vals), mat.norms[start:stop, None] * mat.norms[None, :])
+            elif metric == "jaccard":
+                inter = dot(ones, ones)
+                yield start, _safe_div(inter, mat.nnz[start:stop, None] + mat.nnz[None, :] - inter)
+            elif metric == "pearson":
+                yield start, _pearson(dot(ones, ones), dot(vals, ones), dot(ones, vals),
+                                      dot(sq, ones), dot(ones, sq), dot(vals, vals))
+            else:
+                raise ValueError(f"unknown metric: {metric}")
+
+class CSRMatrix:
+    # minimal compressed-sparse-row store: one row per user/item, one col per feature.
+    # magnitudes and row sizes are cached once so batch calls dont recompute them
+    def __init__(self, rows):
+        self.keys = list(rows)
+        self.row_of = {k: n for n, k in enumerate(self.keys)}
+        self.col_of = {}
+        
+        indptr, indices, data = [0], [], []
+        for k in self.keys:
+            vec = rows[k]
+            # sets are treated as binary vectors
+            items = vec.items() if isinstance(vec, dict) else ((c, 1.0) for c in vec)
+            for c, v in items:
+                indices.append(self.col_of.setdefault(c, len(self.col_of)))
+                data.append(v)
+            indptr.append(len(indices))
+        
+        self.indptr = np.array(indptr, dtype=np.int64)
+        self.indices = np.array(indices, dtype=np.int64)
+        self.data = np.array(data, dtype=np.float64)
+        self.shape = (len(self.keys), len(self.col_of))
+        
+        self.row_ids = np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+        self.nnz = np.diff(self.indptr).astype(np.float64)
+        self.norms = np.sqrt(np.bincount(self.row_ids, weights=self.data**2, minlength=self.shape[0]))
+
+    def densify(self, vec):
+        # map a query dict/set onto our columns, unknown features are dropped
+        vals, mask = np.zeros(self.shape[1]), np.zeros(self.shape[1])
+        items = vec.items() if isinstance(vec, dict) else ((c, 1.0) for c in vec)
+        for c, v in items:
+            if c in self.col_of:
+                vals[self.col_of[c]] = v
+                mask[self.col_of[c]] = 1.0
+        return vals, mask
+
+    def matvec(self, q, weights=None):
+        w = self.data if weights is None else weights
+        return np.bincount(self.row_ids, weights=w * q[self.indices], minlength=self.shape[0])
+
+    def _build_csc(self):
+        # column-major copy (feature -> rows), only needed for many-vs-many
+        self.t_order = np.argsort(self.indices, kind='stable')
+        self.t_rows = self.row_ids[self.t_order]
+        self.t_indptr = np.concatenate(([0], np.cumsum(np.bincount(self.indices, minlength=self.shape[1]))))
+
+    def block_dot(self, start, stop, q_w, x_w):
+        # out[j, r] = sum_c q_w[row start+j, c] * x_w[row r, c], walking only shared columns
+        if not hasattr(self, 't_order'): self._build_csc()
+        lo, hi = self.indptr[start], self.indptr[stop]
+        cols = self.indices[lo:hi]
+        deg = self.t_indptr[cols + 1] - self.t_indptr[cols]
+        
+        # expand every block entry into the posting list of its column
+        tot = int(deg.sum())
+        pos = np.arange(tot) - np.repeat(np.cumsum(deg) - deg, deg) + np.repeat(self.t_indptr[cols], deg)
+        j = np.repeat(self.row_ids[lo:hi] - start, deg)
+        w = np.repeat(q_w[lo:hi], deg) * x_w[self.t_order][pos]
+        
+        n, b = self.shape[0], stop - start
+        return np.bincount(j * n + self.t_rows[pos], weights=w, minlength=b * n).reshape(b, n)
+
+
+def _safe_div(num, den):
+    return np.divide(num, den, out=np.zeros_like(num, dtype=np.float64), where=den != 0)
+
+def _pearson(n, s1, s2, s1_sq, s2_sq, p_sum):
+    num = p_sum - _safe_div(s1 * s2, n)
+    var = (s1_sq - _safe_div(s1**2, n)) * (s2_sq - _safe_div(s2**2, n))
+    return _safe_div(num, np.sqrt(np.clip(var, 0, None)))
\ No newline at end of file
@@ -0,0 +1,122 @@
+import time
+import threading
+import contextlib
+
+# latency buckets in ms, upper bounds (prometheus "le"), +Inf is implicit
+BUCKETS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class Histogram:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, v):
+        n = 0
+        while n < len(self.buckets) and v > self.buckets[n]: n += 1
+        self.counts[n] += 1
+        self.sum += v
+        self.count += 1
+        self.max = max(self.max, v)
+
+    def quantile(self, q):
+        # linear interpolation inside the bucket, same estimate prometheus' histogram_quantile gives
+        if not self.count: return 0.0
+        rank = q * self.count
+        seen = 0
+        for n, c in enumerate(self.counts):
+            if seen + c >= rank and c:
+                lo = self.buckets[n - 1] if n > 0 else 0.0
+                hi = self.buckets[n] if n < len(self.buckets) else self.max
+                return round(lo + (hi - lo) * (rank - seen) / c, 3)
+            seen += c
+        return self.max
+
+    def summary(self):
+        return {"count": self.count, "avg": round(self.sum / self.count, 3) if self.count else 0.0,
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95), "p99": self.quantile(0.99), "max": round(self.max, 3)}
+
+class Telemetry:
+    # counters + histograms keyed by (name, labels), one lock so flask's threads can share it
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.hists = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def inc(self, name, labels=None, n=1):
+        k = self._key(name, labels)
+        with self.lock:
+            self.counters[k] = self.counters.get(k, 0) + n
+
+    def observe(self, name, ms, labels=None):
+        k = self._key(name, labels)
+        with self.lock:
+            if k not in self.hists: self.hists[k] = Histogram()
+            self.hists[k].observe(ms)
+
+    def counter(self, name, labels=None):
+        with self.lock:
+            return self.counters.get(self._key(name, labels), 0)
+
+    def total(self, name):
+        # counter summed over all its label sets
+        with self.lock:
+            return sum(v for (n, _), v in self.counters.items() if n == name)
+
+    def counts(self, name, by):
+        # {label value: count} for one counter family, same keys as summaries()
+        with self.lock:
+            return {" ".join(str(dict(l)[b]) for b in by): v for (n, l), v in sorted(self.counters.items()) if n == name}
+
+    def summaries(self, name, by):
+        # {label value: summary} for one histogram family, e.g. by="stage"
+        with self.lock:
+            return {" ".join(str(dict(l)[b]) for b in by): h.summary() for (n, l), h in sorted(self.hists.items()) if n == name}
+
+    def to_prometheus(self):
+        def fmt(labels, extra=()):
+            items = list(labels) + list(extra)
+            return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}" if items else ""
+
+        lines = []
+        with self.lock:
+            for name in sorted({n for n, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                lines += [f"{name}{fmt(l)} {v}" for (n, l), v in sorted(self.counters.items()) if n == name]
+            for name in sorted({n for n, _ in self.hists}):
+                lines.append(f"# TYPE {name} histogram")
+                for (n, l), h in sorted(self.hists.items()):
+                    if n != name: continue
+                    cum = 0
+                    for b, c in zip(list(h.buckets) + ["+Inf"], h.counts):
+                        cum += c
+                        lines.append(f"{name}_bucket{fmt(l, [('le', b)])} {cum}")
+                    lines.append(f"{name}_sum{fmt(l)} {round(h.sum, 3)}")
+                    lines.append(f"{name}_count{fmt(l)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+class StageTimer:
+    # accumulates per-stage ms for one request, recorded once at the end so a stage hit twice counts once
+    def __init__(self):
+        self.ms = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        st = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.ms[name] = self.ms.get(name, 0.0) + (time.perf_counter() - st) * 1000
+
+    def record(self, telemetry, name="rec_stage_duration_ms"):
+        for stage, ms in self.ms.items():
+            telemetry.observe(name, ms, {"stage": stage})
+
+# process-wide registry shared by the api and the orchestrator
+REGISTRY = Telemetry()
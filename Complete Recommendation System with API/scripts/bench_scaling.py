@@ -0,0 +1,149 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import gc
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+import numpy as np
+from collections import defaultdict
+from engine.candidate_gen import CandidateGenerator
+from engine.similarity import SimilarityCalculator
+from engine.scorer import RecommendationScorer
+from engine.evaluator import RecommendationEvaluator
+from data.database import pooled_conn
+from scripts import gen_synthetic
+
+BASELINE = os.path.join(os.path.dirname(__file__), "bench_baseline.json")
+N_QUERY = 100 # users sampled for the per-user benches, same at every size so ms stay comparable
+
+def load_data():
+    # everything the benches need, read once from the fixture db (not timed)
+    hist, ratings = defaultdict(list), defaultdict(dict)
+    with pooled_conn() as c:
+        for uid, cid, r in c.execute("SELECT user_id, content_id, rating FROM interactions ORDER BY id"):
+            ratings[uid][cid] = r
+            if r >= 3: hist[uid].append(cid)
+        tags = {r[0]: [r[1]] for r in c.execute("SELECT id, category FROM content")}
+        for cid, skill in c.execute("SELECT content_id, skill_id FROM content_skills"):
+            tags.setdefault(cid, []).append(skill)
+        pop = [r[0] for r in c.execute("SELECT id FROM content ORDER BY popularity DESC, id")]
+    return dict(hist), dict(ratings), tags, pop
+
+def make_benches(hist, ratings, tags, pop):
+    # name -> zero arg callable, each one is what gets timed / memory traced
+    rng = random.Random(3)
+    query = rng.sample(sorted(hist), min(N_QUERY, len(hist)))
+    pop_of = {iid: 1.0 - n / len(pop) for n, iid in enumerate(pop)}
+    # sequential sources: this measures what each source costs, not the per-source deadline
+    gen = CandidateGenerator(hist, tags, pop[:50], parallel=False)
+    cands = {u: gen.hybrid_candidates(u, limit=200) for u in query}
+
+    scorer = RecommendationScorer()
+    scorer.add_batch_scorer("popular", lambda u, iids, ctx: np.array([pop_of.get(i, 0.0) for i in iids]), 0.5)
+    scorer.add_batch_scorer("category", lambda u, iids, ctx: np.array([float(tags.get(i, [None])[0] in ctx) for i in iids]), 1.0)
+    cats = {u: {tags[i][0] for i in hist[u] if i in tags} for u in query}
+
+    sim = SimilarityCalculator()
+    mat = sim.build_matrix(ratings)
+
+    # leave-last-out split, recs = popular items the user hasnt touched
+    ev = RecommendationEvaluator()
+    truth = {u: h[-1:] for u, h in hist.items()}
+    recs = {u: [i for i in pop[:20] if i not in h][:10] for u, h in hist.items()}
+
+    return {
+        "candidate_gen.build": lambda: CandidateGenerator(hist, tags, pop[:50]),
+        "candidate_gen.hybrid": lambda: [gen.hybrid_candidates(u) for u in query],
+        "scorer.rank_batch": lambda: [scorer.rank_batch(u, cands[u], 10, cats[u]) for u in query],
+        "similarity.build_matrix": lambda: sim.build_matrix(ratings),
+        "similarity.cosine_many": lambda: [sim.cosine_many(ratings[u], mat) for u in query],
+        "evaluator.evaluate_all": lambda: ev.evaluate_all(recs, truth, k=10),
+        "evaluator.evaluate_batch": lambda: ev.evaluate_batch(recs, truth, k=10, workers=1),
+    }
+
+def measure(fn, repeat=3, mem=True):
+    # best-of-n wall time, then one extra run under tracemalloc for the peak (tracing slows the run down)
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        st = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - st) * 1000)
+    res = {"ms": round(min(times), 3)}
+    if mem:
+        gc.collect()
+        tracemalloc.start()
+        fn()
+        res["peak_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+        tracemalloc.stop()
+    return res
+
+def run(sizes=("1k", "100k", "1m"), repeat=3, mem=True, only=None):
+    results = {}
+    for size in sizes:
+        with gen_synthetic.fixture(size):
+            data = load_data()
+        benches = make_benches(*data)
+        print(f"--- {size} interactions ({len(data[0])} users with history) ---")
+        results[size] = {}
+        for name, fn in benches.items():
+            if only and not any(o in name for o in only): continue
+            r = measure(fn, repeat if size != "1m" else 1, mem)
+            results[size][name] = r
+            print(f"{name:<26} {r['ms']:>10.2f}ms" + (f" {r['peak_kb'] / 1024:>9.1f}MB peak" if mem else ""))
+    return results
+
+def compare(results, baseline, threshold=0.3, mem_threshold=0.2, min_ms=5.0, min_kb=512):
+    # regressions = slower/bigger than baseline by more than the threshold, with absolute floors
+    # so a 0.4ms -> 0.6ms wobble on a tiny bench doesnt fail the run
+    bad = []
+    for size, benches in results.items():
+        for name, r in benches.items():
+            base = baseline.get(size, {}).get(name)
+            if not base: continue
+            if r["ms"] > base["ms"] * (1 + threshold) and r["ms"] - base["ms"] > min_ms:
+                bad.append(f"{size} {name}: {base['ms']}ms -> {r['ms']}ms (+{r['ms'] / base['ms'] - 1:.0%})")
+            if "peak_kb" in r and "peak_kb" in base and r["peak_kb"] > base["peak_kb"] * (1 + mem_threshold) \
+                    and r["peak_kb"] - base["peak_kb"] > min_kb:
+                bad.append(f"{size} {name}: {base['peak_kb']}KB -> {r['peak_kb']}KB peak (+{r['peak_kb'] / base['peak_kb'] - 1:.0%})")
+    return bad
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="engine scaling benchmarks, checked against a json baseline")
+    ap.add_argument("--sizes", nargs="+", default=["1k", "100k", "1m"], choices=list(gen_synthetic.SIZES))
+    ap.add_argument("--only", nargs="+", help="substring filter on bench names")
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--update", action="store_true", help="write these results as the new baseline")
+    ap.add_argument("--threshold", type=float, default=0.3, help="allowed wall time regression (0.3 = 30%%)")
+    ap.add_argument("--mem-threshold", type=float, default=0.2, help="allowed peak memory regression")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--no-mem", action="store_true", help="skip the tracemalloc pass")
+    a = ap.parse_args()
+
+    results = run(a.sizes, a.repeat, not a.no_mem, a.only)
+    if a.update:
+        old = {}
+        if os.path.exists(a.baseline):
+            with open(a.baseline) as f: old = json.load(f)
+        merged = old.get("results", {})
+        for size, benches in results.items(): merged.setdefault(size, {}).update(benches)
+        meta = {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(), "cpus": os.cpu_count()}
+        with open(a.baseline, "w") as f:
+            json.dump({"meta": meta, "results": merged}, f, indent=2, sort_keys=True)
+        print(f"\n[+] baseline written to {a.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(a.baseline):
+        sys.exit(f"no baseline at {a.baseline}, run with --update first")
+    with open(a.baseline) as f:
+        baseline = json.load(f)["results"]
+    bad = compare(results, baseline, a.threshold, a.mem_threshold)
+    if bad:
+        print("\n[!] regressions:\n  " + "\n  ".join(bad))
+        sys.exit(1)
+    print("\n[+] no regressions against baseline")
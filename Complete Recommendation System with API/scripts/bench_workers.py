@@ -0,0 +1,126 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import json
+import time
+import socket
+import shutil
+import argparse
+import tempfile
+import subprocess
+import data.database as database
+from data.repositories import MainRepo
+from engine.artifact import ARTIFACT_DIR, ServingArtifact
+from scripts import gen_synthetic
+from scripts.load_test import LoadTest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# gunicorn config for the bench: each worker loads the catalog + skill graph before it reports ready,
+# so startup covers everything a worker does before its first real request
+CONF = """
+import os
+
+bind = "127.0.0.1:{port}"
+workers = {workers}
+timeout = 300
+loglevel = "warning"
+
+def post_worker_init(worker):
+    from api.app import orch
+    orch.catalog.get()
+    orch.kg.get()
+    open(os.path.join({ready!r}, str(os.getpid())), "w").close()
+"""
+
+def proc_mem(pid):
+    # kB from smaps_rollup: rss, pss (shared pages split between the processes mapping them), uss (private)
+    res = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            k, _, v = line.partition(":")
+            if k in ("Rss", "Pss", "Private_Clean", "Private_Dirty"): res[k] = int(v.split()[0])
+    return {"rss": res["Rss"], "pss": res["Pss"], "uss": res["Private_Clean"] + res["Private_Dirty"]}
+
+def mem_summary(master, workers):
+    per = [proc_mem(p) for p in workers]
+    mb = lambda kb: round(kb / 1024, 1)
+    return {"total_pss_mb": mb(proc_mem(master)["pss"] + sum(m["pss"] for m in per)),
+            "worker_rss_mb": mb(sum(m["rss"] for m in per) / len(per)),
+            "worker_pss_mb": mb(sum(m["pss"] for m in per) / len(per)),
+            "worker_uss_mb": mb(sum(m["uss"] for m in per) / len(per))}
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def run_one(db, workers, artifact_dir=None, traffic=10.0, users=None, items=None):
+    # one gunicorn master in a scratch cwd (models/ there decides whether the artifact is used)
+    cwd = tempfile.mkdtemp(prefix="bench_workers_")
+    ready = os.path.join(cwd, "ready")
+    os.makedirs(ready)
+    if artifact_dir:
+        shutil.copytree(artifact_dir, os.path.join(cwd, ARTIFACT_DIR))
+    port = free_port()
+    conf = os.path.join(cwd, "gunicorn.conf.py")
+    with open(conf, "w") as f: f.write(CONF.format(port=port, workers=workers, ready=ready))
+    env = dict(os.environ, PYTHONPATH=ROOT, REC_DB_FILE=db)
+
+    st = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", conf, "api.app:app"], cwd=cwd, env=env)
+    try:
+        while len(os.listdir(ready)) < workers:
+            if proc.poll() is not None: raise RuntimeError(f"gunicorn exited with {proc.returncode}")
+            if time.perf_counter() - st > 600: raise TimeoutError("workers didnt come up")
+            time.sleep(0.05)
+        startup = time.perf_counter() - st
+        pids = [int(p) for p in os.listdir(ready)]
+        res = {"workers": workers, "artifact": bool(artifact_dir), "startup_sec": round(startup, 2), "idle": mem_summary(proc.pid, pids)}
+        if traffic:
+            lt = LoadTest(f"http://127.0.0.1:{port}", users, items, feedback_ratio=0.0)
+            t0 = time.perf_counter()
+            lt.closed_loop(min(workers, 8), traffic)
+            rep = lt.report(time.perf_counter() - t0)
+            res["after_traffic"] = mem_summary(proc.pid, pids)
+            res["traffic"] = {"requests": rep["requests"], "errors": rep["errors"], "p50_ms": rep["all"]["p50"], "p99_ms": rep["all"]["p99"]}
+        return res
+    finally:
+        proc.terminate()
+        proc.wait()
+        shutil.rmtree(cwd, ignore_errors=True)
+
+def run(size="1m", workers=(1, 4, 16), traffic=10.0):
+    with gen_synthetic.fixture(size, cooc=True):
+        db = database.DB_FILE
+        repo = MainRepo()
+        users, items = sorted(repo.get_all_user_ids()), sorted(repo.get_all_content())
+        art_dir = tempfile.mkdtemp(prefix="bench_artifact_")
+        st = time.perf_counter()
+        art = ServingArtifact.build(repo)
+        art.save(art_dir)
+        print(f"artifact: {art.nbytes() / 2 ** 20:.1f}MB built in {time.perf_counter() - st:.1f}s")
+    results = []
+    try:
+        for n in workers:
+            for a in (None, art_dir):
+                r = run_one(db, n, a, traffic, users, items)
+                results.append(r)
+                print(f"{n:>3} workers {'artifact' if a else 'db dicts':<9} startup {r['startup_sec']:>6.2f}s  "
+                      f"total pss {r['idle']['total_pss_mb']:>7.1f}MB idle"
+                      + (f" / {r['after_traffic']['total_pss_mb']:>7.1f}MB after traffic  per-worker uss {r['after_traffic']['worker_uss_mb']:>6.1f}MB" if traffic else ""))
+    finally:
+        shutil.rmtree(art_dir, ignore_errors=True)
+    return results
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="gunicorn worker startup + memory, with and without the mmapped serving artifact (linux only)")
+    ap.add_argument("--size", default="1m", choices=list(gen_synthetic.SIZES))
+    ap.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    ap.add_argument("--traffic", type=float, default=10.0, help="seconds of /recommend traffic before the second reading, 0 = skip")
+    ap.add_argument("--json", help="also write the raw results here")
+    a = ap.parse_args()
+    res = run(a.size, a.workers, a.traffic)
+    if a.json:
+        with open(a.json, "w") as f: json.dump(res, f, indent=2)
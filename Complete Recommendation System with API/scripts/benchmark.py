@@ -0,0 +1,260 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import time
+import random
+import tempfile
+import sqlite3
+import contextlib
+import numpy as np
+from engine.candidate_gen import CandidateGenerator
+from engine.similarity import SimilarityCalculator
+from engine.lsh import MinHashLSH
+from engine.scorer import RecommendationScorer
+import data.database as database
+from data.repositories import MainRepo
+
+@contextlib.contextmanager
+def temp_db():
+    # point the data layer at a throwaway db file for the duration of a bench
+    old_db = database.DB_FILE
+    database.DB_FILE = os.path.join(tempfile.mkdtemp(), "bench.db")
+    try:
+        yield MainRepo()
+    finally:
+        database.DB_FILE = old_db
+
+def time_it(fn, reps=200):
+    st = time.perf_counter()
+    for _ in range(reps): fn()
+    return (time.perf_counter() - st) / reps * 1000
+
+def bench_collaborative(sizes=("100k", "1m"), n_query=200):
+    # power-law fixture, not make_hist: uniform histories never hit the hub items that dominate real traffic
+    print("--- Collaborative candidates on the synthetic fixture (ms/call) ---")
+    from scripts import gen_synthetic
+    res = {}
+    for size in sizes:
+        hist = {}
+        with gen_synthetic.fixture(size), database.pooled_conn() as c:
+            for uid, cid in c.execute("SELECT user_id, content_id FROM interactions WHERE rating >= 3 ORDER BY id"):
+                hist.setdefault(uid, []).append(cid)
+        uids = random.Random(5).sample(sorted(hist), min(n_query, len(hist)))
+        capped = CandidateGenerator(hist, {}, [])
+        uncapped = CandidateGenerator(hist, {}, [], max_item_users=len(hist), max_neighbors=len(hist))
+        res[size] = {name: time_it(lambda: [g.collaborative_candidates(u) for u in uids], reps=1) / len(uids)
+                     for name, g in (("capped", capped), ("uncapped", uncapped))}
+        print(f"{size:>5}: capped {res[size]['capped']:.3f}ms  uncapped {res[size]['uncapped']:.3f}ms")
+    return res
+
+def bench_content(sizes=(1_000, 10_000, 100_000), items_per_tag=20):
+    print("--- Content candidates (ms/call) ---")
+    res = {}
+    for n in sizes:
+        # tags scale with the catalog so each tag keeps a similar posting list
+        rng = random.Random(7)
+        n_tags = max(1, n // items_per_tag)
+        tags = {f"i{i}": [f"t{rng.randrange(n_tags)}", f"t{rng.randrange(n_tags)}"] for i in range(n)}
+        gen = CandidateGenerator({"u0": [f"i{i}" for i in range(5)]}, tags, [])
+        res[n] = time_it(lambda: gen.content_based_candidates("u0"))
+        print(f"items={n:>8}: {res[n]:.3f}ms")
+    return res
+
+def bench_similarity(n_users=5_000, items_per_user=20):
+    print("--- Similarity: scalar loop vs batch (one-vs-many, ms) ---")
+    sim = SimilarityCalculator()
+    rng = random.Random(1)
+    vecs = {f"u{u}": {f"i{rng.randrange(n_users)}": float(rng.randint(1, 5)) for _ in range(items_per_user)} for u in range(n_users)}
+    mat = sim.build_matrix(vecs)
+    q = vecs["u0"]
+    res = {}
+    for name, scalar, batch in (("cosine", sim.cosine_similarity, sim.cosine_many),
+                                ("pearson", sim.pearson_correlation, sim.pearson_many)):
+        loop_ms = time_it(lambda: [scalar(q, v) for v in vecs.values()], reps=3)
+        batch_ms = time_it(lambda: batch(q, mat), reps=20)
+        res[name] = (loop_ms, batch_ms)
+        print(f"{name:>8}: loop={loop_ms:.2f}ms batch={batch_ms:.2f}ms")
+    st = time.perf_counter()
+    for _ in sim.pairwise(mat, "cosine"): pass
+    print(f"all-pairs cosine ({n_users}x{n_users}): {time.perf_counter() - st:.2f}s")
+    return res
+
+def bench_lsh(n_sets=20_000, k=10, configs=((32, 2), (16, 4), (8, 8))):
+    print("--- MinHash-LSH recall@k vs exact jaccard ---")
+    sim = SimilarityCalculator()
+    rng = random.Random(5)
+    # clusters of overlapping sets so there are real neighbours to find
+    bases = [set(rng.sample(range(50_000), 30)) for _ in range(n_sets // 20)]
+    sets = {}
+    for n in range(n_sets):
+        s = set(bases[n % len(bases)])
+        for _ in range(rng.randint(0, 8)):
+            s.discard(rng.choice(tuple(s))); s.add(rng.randrange(50_000))
+        sets[n] = s
+    mat = sim.build_matrix(sets)
+    queries = rng.sample(range(n_sets), 100)
+    
+    st = time.perf_counter()
+    exact = {}
+    for q in queries:
+        scores = sim.jaccard_many(sets[q], mat)
+        scores[mat.row_of[q]] = -1
+        exact[q] = {mat.keys[i] for i in np.argsort(-scores)[:k]}
+    exact_ms = (time.perf_counter() - st) / len(queries) * 1000
+    print(f"exact (batch scan): {exact_ms:.2f}ms/query")
+    
+    res = {}
+    for bands, rows in configs:
+        lsh = MinHashLSH(bands=bands, rows=rows)
+        for key, s in sets.items(): lsh.add(key, s)
+        st = time.perf_counter()
+        hits = sum(len(exact[q] & {key for key, _ in lsh.query(sets[q], k, exclude=q)}) for q in queries)
+        ms = (time.perf_counter() - st) / len(queries) * 1000
+        res[(bands, rows)] = (hits / (k * len(queries)), ms)
+        print(f"bands={bands:>2} rows={rows}: recall@{k}={res[(bands, rows)][0]:.3f} {ms:.2f}ms/query")
+    return res
+
+def bench_scorer(sizes=(100, 1_000, 10_000), limit=10):
+    print("--- Scorer: heap rank_candidates vs rank_batch (ms) ---")
+    res = {}
+    for n in sizes:
+        cands = [f"i{i}" for i in range(n)]
+        pop = np.random.RandomState(2).rand(n)
+        pop_of = dict(zip(cands, pop))
+        scorer = RecommendationScorer()
+        scorer.add_scorer("popular", lambda u, i, ctx: pop_of[i], 0.5)
+        scorer.add_batch_scorer("popular_b", lambda u, iids, ctx: pop, 0.5)
+        heap_ms = time_it(lambda: scorer.rank_candidates("u0", cands, limit), reps=5)
+        batch_ms = time_it(lambda: scorer.rank_batch("u0", cands, limit), reps=5)
+        res[n] = (heap_ms, batch_ms)
+        print(f"cands={n:>6}: heap={heap_ms:.2f}ms batch={batch_ms:.2f}ms")
+    return res
+
+def bench_cooc(n_users=20_000, items_per_user=10, n_items=5_000, n_updates=2_000):
+    print("--- Item co-occurrence: rebuild + incremental update throughput ---")
+    with temp_db() as repo:
+        rng = random.Random(9)
+        rows = [(f"u{u}", f"i{min(int(rng.paretovariate(1.2)), n_items)}", "view", 5.0)
+                for u in range(n_users) for _ in range(items_per_user)]
+        c = database.get_conn()
+        c.executemany("INSERT INTO interactions (user_id, content_id, type, rating) VALUES (?, ?, ?, ?)", rows)
+        c.commit()
+        c.close()
+        
+        st = time.perf_counter()
+        repo.rebuild_cooc()
+        dur = time.perf_counter() - st
+        print(f"rebuild: {len(rows)} interactions in {dur:.2f}s ({len(rows) / dur:,.0f} interactions/s)")
+        
+        st = time.perf_counter()
+        for n in range(n_updates):
+            repo.log_interaction(f"u{rng.randrange(n_users)}", f"i{rng.randrange(n_items)}", "rating", 5.0)
+        upd = n_updates / (time.perf_counter() - st)
+        print(f"incremental: {upd:,.0f} log_interaction calls/s")
+        return {"rebuild_s": dur, "updates_per_s": upd}
+
+def bench_db_conn(reps=2_000):
+    print("--- DB: fresh connection per call vs pooled connection (ms/query) ---")
+    with temp_db():
+        c = database.get_conn()
+        c.executemany("INSERT INTO users (id, name, interests) VALUES (?, ?, ?)", [(f"u{n}", "x", "ai") for n in range(10_000)])
+        c.commit()
+        c.close()
+        q = "SELECT id FROM users WHERE id=?"
+        
+        def before():
+            # what every repo call used to do: untuned connect, query, close
+            conn = sqlite3.connect(database.DB_FILE)
+            conn.row_factory = sqlite3.Row
+            conn.execute(q, ("u42",)).fetchone()
+            conn.close()
+        
+        def after():
+            with database.pooled_conn() as conn:
+                conn.execute(q, ("u42",)).fetchone()
+        
+        res = {"before": time_it(before, reps), "after": time_it(after, reps)}
+        print(f"before: {res['before']:.4f}ms  after: {res['after']:.4f}ms")
+        return res
+
+def bench_batch_recs(n_users=5_000, n_items=2_000, items_per_user=8):
+    print("--- Recommendations: per-user get_recs vs get_recs_batch (users/s) ---")
+    from engine.orchestrator import RecOrchestrator
+    with temp_db() as repo:
+        rng = random.Random(4)
+        cats = ["ai", "web", "data", "devops", "security", "backend"]
+        c = database.get_conn()
+        c.executemany("INSERT INTO users (id, name, interests) VALUES (?, ?, ?)", [(f"u{n}", "x", rng.choice(cats)) for n in range(n_users)])
+        c.executemany("INSERT INTO content (id, title, category, difficulty, popularity) VALUES (?, ?, ?, ?, ?)",
+                      [(f"c{n}", f"t{n}", rng.choice(cats), "beginner", rng.random()) for n in range(n_items)])
+        c.executemany("INSERT INTO interactions (user_id, content_id, type, rating) VALUES (?, ?, ?, ?)",
+                      [(f"u{u}", f"c{min(int(rng.paretovariate(1.2)), n_items - 1)}", "view", 5.0) for u in range(n_users) for _ in range(items_per_user)])
+        c.commit()
+        c.close()
+        repo.rebuild_cooc()
+        uids = [f"u{n}" for n in range(n_users)]
+        
+        orch = RecOrchestrator(async_writes=False)
+        st = time.perf_counter()
+        for u in uids:
+            orch.get_recs(u)
+        single = n_users / (time.perf_counter() - st)
+        
+        orch = RecOrchestrator(async_writes=False)
+        st = time.perf_counter()
+        for _ in orch.get_recs_batch(uids): pass
+        batch = n_users / (time.perf_counter() - st)
+        print(f"get_recs loop: {single:,.0f} users/s  batch: {batch:,.0f} users/s")
+        return {"single_users_per_s": single, "batch_users_per_s": batch}
+
+def bench_als(size="1m", factors=32, iters=10, reg=300.0):
+    # reg was tuned by hand per size (100 is best at 100k, 300 at 1m), it grows with the catalog
+    print(f"--- ALS: train on the {size} synthetic fixture, candidate latency, leave-last-out hit rate@20 ---")
+    from scripts import gen_synthetic, train_als
+    from engine.als import ALSModel
+    with gen_synthetic.fixture(size):
+        hist, last = {}, {}
+        with database.pooled_conn() as c:
+            for uid, cid in c.execute("SELECT user_id, content_id FROM interactions WHERE rating >= 3 ORDER BY id"):
+                if uid in last: hist.setdefault(uid, []).append(last[uid])
+                last[uid] = cid
+        # hold out each user's last positive, train on the rest through a throwaway db
+        with temp_db():
+            c = database.get_conn()
+            c.executemany("INSERT INTO interactions (user_id, content_id, type, rating) VALUES (?, ?, 'view', 5.0)",
+                          ((u, i) for u, h in hist.items() for i in h))
+            c.commit()
+            c.close()
+            out = os.path.join(tempfile.mkdtemp(), "als")
+            st = time.perf_counter()
+            train_als.train(out, factors=factors, reg=reg, iters=iters, verbose=False)
+            train_s = time.perf_counter() - st
+        model = ALSModel.load(out)
+        pop = [r[0] for r in _top_items(hist, 200)]
+    
+    users = random.Random(6).sample(sorted(hist), 2_000)
+    gen = CandidateGenerator(hist, {}, pop, als=model)
+    st = time.perf_counter()
+    als_hits = sum(last[u] in gen.als_candidates(u, 20) for u in users)
+    ms = (time.perf_counter() - st) / len(users) * 1000
+    pop_hits = sum(last[u] in [i for i in pop if i not in set(hist[u])][:20] for u in users)
+    print(f"train: {model.meta['nnz']:,} interactions, {factors} factors x {iters} iters in {train_s:.1f}s "
+          f"({model.meta['train_seconds'] / iters:.2f}s/iter)")
+    print(f"als_candidates: {ms:.2f}ms/call  hit@20: als={als_hits / len(users):.3f} popularity={pop_hits / len(users):.3f}")
+    return {"train_s": train_s, "ms_per_call": ms, "als_hit": als_hits / len(users), "pop_hit": pop_hits / len(users)}
+
+def _top_items(hist, n):
+    from collections import Counter
+    return Counter(i for h in hist.values() for i in h).most_common(n)
+
+if __name__ == "__main__":
+    bench_collaborative()
+    bench_content()
+    bench_similarity()
+    bench_lsh()
+    bench_scorer()
+    bench_cooc()
+    bench_db_conn()
+    bench_batch_recs()
+    bench_als()
@@ -0,0 +1,24 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import time
+import argparse
+from data.repositories import MainRepo
+from engine.artifact import ARTIFACT_DIR, ServingArtifact
+
+def build(out=ARTIFACT_DIR, verbose=True):
+    # offline snapshot for the serving workers, run after build_cooc and restart gunicorn to pick it up
+    st = time.time()
+    art = ServingArtifact.build(MainRepo())
+    art.save(out)
+    if verbose:
+        m = art.meta
+        print(f"[+] {m['items']:,} items, {m['users']:,} users, {m['interactions']:,} history rows, {m['neighbors']:,} neighbours "
+              f"({art.nbytes() / 2 ** 20:.1f}MB) written to {out} in {time.time() - st:.2f}s")
+    return art
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="write the mmap-able serving artifact (catalog, histories, neighbours)")
+    ap.add_argument("--out", default=ARTIFACT_DIR)
+    build(ap.parse_args().out)
@@ -0,0 +1,16 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import time
+from data.repositories import MainRepo, COOC_TOP_N
+
+def build(top_n=COOC_TOP_N):
+    # full offline rebuild of item_cooc, run nightly to undo drift from incremental trimming
+    repo = MainRepo()
+    st = time.time()
+    rows = repo.rebuild_cooc(top_n)
+    print(f"[+] item_cooc rebuilt: {rows} rows (top {top_n} per item) in {time.time() - st:.2f}s")
+
+if __name__ == "__main__":
+    build(int(sys.argv[1]) if len(sys.argv) > 1 else COOC_TOP_N)
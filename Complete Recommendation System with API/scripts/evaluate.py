@@ -2,15 +2,15 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
-import time
-import threading
+import argparse
 import urllib.request
+from scripts import load_test
 from engine.evaluator import RecommendationEvaluator
 from engine.orchestrator import RecOrchestrator
 
 def run_metrics():
     print("--- 1. Offline Metrics ---")
-    orch = RecOrchestrator()
+    orch = RecOrchestrator(async_writes=False)
     ev = RecommendationEvaluator()
     
     truth = {"u1": ["c9", "c16", "c1"], "u2": ["c2", "c7", "c15"], "u3": ["c3", "c13", "c20"]}
@@ -20,37 +20,38 @@ def run_metrics():
         preds[u] = [r["id"] for r in recs]
         
     res = ev.evaluate_all(preds, truth, k=5)
-    print(f"P@5: {res.get('p_at_k',0)}, R@5: {res.get('r_at_k',0)}, NDCG@5: {res.get('ndcg',0)}")
+    print(f"P@5: {res.get('p_at_k',0)}, R@5: {res.get('r_at_k',0)}, NDCG@5: {res.get('ndcg',0)}, MAP@5: {res.get('map',0)}, MRR@5: {res.get('mrr',0)}")
     return res
 
-def run_load_test():
-    print("\n--- 2. Load Test (10 concurrent users) ---")
-    url = "http://127.0.0.1:5000/recommend/u1"
-    
-    try: urllib.request.urlopen(url)
+def run_load_test(mode="closed", concurrency=10, rps=50, duration=10, feedback_ratio=0.1):
+    label = f"{concurrency} workers, closed-loop" if mode == "closed" else f"{rps} rps, open-loop"
+    print(f"\n--- 2. Load Test ({label}, {duration}s, zipf users, {feedback_ratio:.0%} feedback) ---")
+    # warm up so the first request's imports/connection dont land in the numbers
+    try: urllib.request.urlopen("http://127.0.0.1:5000/health")
     except: pass
 
-    times = []
-    def fetch():
-        st = time.time()
-        try:
-            urllib.request.urlopen(url)
-            times.append(time.time() - st)
-        except Exception as e: print("req failed:", e)
-            
-    threads = [threading.Thread(target=fetch) for _ in range(10)]
-    for t in threads: t.start()
-    for t in threads: t.join()
-    
-    avg_ms = (sum(times) / len(times)) * 1000 if times else 0
-    print(f"Avg Response Time: {avg_ms:.2f}ms")
-    return avg_ms
+    res = load_test.run(mode=mode, concurrency=concurrency, rps=rps, duration=duration, feedback_ratio=feedback_ratio)
+    a = res["all"]
+    print(f"p50: {a['p50']}ms, p90: {a['p90']}ms, p99: {a['p99']}ms, max: {a['max']}ms")
+    print(f"throughput: {res['throughput_rps']} req/s, error rate: {res['error_rate']:.2%}")
+    return res
 
 if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--mode", choices=["closed", "open"], default="closed")
+    ap.add_argument("--concurrency", type=int, default=10)
+    ap.add_argument("--rps", type=float, default=50)
+    ap.add_argument("--duration", type=float, default=10)
+    ap.add_argument("--feedback-ratio", type=float, default=0.1)
+    a = ap.parse_args()
+
     m = run_metrics()
-    t = run_load_test()
-    
-    status = 'PASS' if t < 200 else 'FAIL'
+    t = run_load_test(a.mode, a.concurrency, a.rps, a.duration, a.feedback_ratio)
+
+    status = 'PASS' if t["all"]["p99"] < 200 and t["error_rate"] < 0.01 else 'FAIL'
+    load = f"{t['concurrency']} concurrent workers (closed-loop)" if t["mode"] == "closed" else f"{t['target_rps']} req/s target (open-loop, poisson arrivals)"
+    rows = "\n".join(f"| {op} | {s['count']} | {s['p50']} | {s['p90']} | {s['p99']} | {s['max']} |"
+                     for op, s in [("all", t["all"]), ("recommend", t["recommend"]), ("feedback", t["feedback"])])
     md = f"""# System Evaluation Report
 
 ## 1. Accuracy Metrics (k=5)
@@ -59,12 +60,20 @@ if __name__ == "__main__":
 | Precision@5 | {m.get('p_at_k', 0)} |
 | Recall@5 | {m.get('r_at_k', 0)} |
 | NDCG@5 | {m.get('ndcg', 0)} |
+| MAP@5 | {m.get('map', 0)} |
+| MRR@5 | {m.get('mrr', 0)} |
 
 ## 2. Performance Metrics
-* **Concurrent Users:** 10
-* **Avg Response Time:** {t:.2f} ms
-* **Status:** {status} (Target < 200ms)
+* **Load:** {load}, {t['duration_sec']}s
+* **Traffic:** zipf(s={t['zipf_s']}) over {t['users']} users, {t['feedback_ratio']:.0%} POST /feedback
+* **Throughput:** {t['throughput_rps']} req/s
+* **Error Rate:** {t['error_rate']:.2%} ({t['errors']}/{t['requests']})
+* **Status:** {status} (Target p99 < 200ms, errors < 1%)
+
+| Route | Requests | p50 (ms) | p90 (ms) | p99 (ms) | max (ms) |
+|---|---|---|---|---|---|
+{rows}
 """
     with open("evaluation_report.md", "w") as f:
         f.write(md)
-    print("\n[+] evaluation_report.md generated successfully!")
\ No newline at end of file
+    print("\n[+] evaluation_report.md generated successfully!")
@@ -0,0 +1,244 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import time
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+import data.database as database
+from data.migrations import migrate
+from data.repositories import MainRepo
+
+# category -> (share of the catalog, tags). shares are lopsided on purpose, like a real catalog
+CATEGORIES = {
+    "ai": (0.18, ["ml", "deep learning", "nlp", "transformers", "pytorch"]),
+    "web": (0.16, ["js", "react", "css", "vue", "html"]),
+    "data": (0.14, ["python", "pandas", "sql", "etl", "statistics"]),
+    "backend": (0.12, ["apis", "python", "go", "databases", "microservices"]),
+    "devops": (0.1, ["docker", "kubernetes", "ci/cd", "terraform", "linux"]),
+    "frontend": (0.08, ["css", "typescript", "accessibility", "design"]),
+    "security": (0.07, ["networking", "malware", "crypto", "pentesting"]),
+    "mlops": (0.05, ["pipelines", "monitoring", "feature stores", "ml"]),
+    "vision": (0.04, ["opencv", "cnn", "deep learning"]),
+    "hardware": (0.03, ["gpu", "pc", "embedded"]),
+    "mobile": (0.03, ["android", "ios", "flutter"]),
+}
+DIFFICULTY = (["beginner", "intermediate", "advanced"], [0.5, 0.35, 0.15])
+TYPES = (["view", "like", "complete", "bookmark"], [0.6, 0.2, 0.12, 0.08])
+RATINGS = ([1.0, 2.0, 3.0, 4.0, 5.0], [0.05, 0.08, 0.2, 0.35, 0.32])
+# share of traffic per hour of day (utc), quiet overnight, peaks late morning and evening
+HOURLY = np.array([1, 0.6, 0.4, 0.3, 0.3, 0.5, 1, 2, 3.5, 4.5, 5, 5, 4.5, 4.5, 4.5, 4.5, 4.5, 5, 5.5, 6, 6, 5, 3.5, 2])
+
+# named sizes shared by the perf tests / benchmarks
+SIZES = {
+    "1k": dict(users=200, items=100, interactions=1_000),
+    "100k": dict(users=10_000, items=2_000, interactions=100_000),
+    "1m": dict(users=100_000, items=20_000, interactions=1_000_000),
+}
+
+def _choice(rng, opts, n):
+    vals, p = opts
+    return np.array(vals)[rng.choice(len(vals), size=n, p=p)]
+
+def _zipf_weights(n, alpha, rng):
+    # rank r gets 1/r^alpha, ranks are shuffled so popularity isnt tied to id order
+    w = 1.0 / np.arange(1, n + 1) ** alpha
+    return (w / w.sum())[rng.permutation(n)]
+
+def _stamp(secs):
+    return np.char.replace(np.datetime_as_string(secs.astype("datetime64[s]")), "T", " ")
+
+def make_dataset(users=10_000, items=2_000, interactions=100_000, seed=42, alpha=1.1, days=365,
+                 end="2025-01-01", affinity=0.7):
+    # pure numpy, nothing touches the db here. every draw comes off one seeded generator,
+    # so the same args always give the same rows
+    rng = np.random.default_rng(seed)
+    cats = list(CATEGORIES)
+    shares = np.array([CATEGORIES[c][0] for c in cats])
+    shares /= shares.sum()
+
+    # catalog
+    item_cat = rng.choice(len(cats), size=items, p=shares)
+    item_pop = _zipf_weights(items, alpha, rng)
+    item_ids = np.array([f"c{i}" for i in range(1, items + 1)])
+    content = list(zip(item_ids.tolist(), [f"{cats[c]} lesson {i}" for i, c in enumerate(item_cat.tolist(), 1)],
+                       [cats[c] for c in item_cat.tolist()], _choice(rng, DIFFICULTY, items).tolist(),
+                       np.round(item_pop / item_pop.max(), 4).tolist()))
+
+    skills = sorted({t for c in cats for t in CATEGORIES[c][1]})
+    skill_ids = {t: f"s{i}" for i, t in enumerate(skills, 1)}
+    content_skills = []
+    for iid, c in zip(item_ids.tolist(), item_cat.tolist()):
+        tags = CATEGORIES[cats[c]][1]
+        for t in rng.choice(tags, size=min(len(tags), 1 + rng.poisson(1)), replace=False).tolist():
+            content_skills.append((iid, skill_ids[t]))
+
+    # users lean towards 1-3 categories, biased the same way as the catalog.
+    # weighted sampling without replacement for every user at once (gumbel top-k)
+    user_ids = np.array([f"u{i}" for i in range(1, users + 1)])
+    n_int = np.minimum(1 + rng.poisson(0.6, size=users), 3)
+    cat_mat = np.argsort(-(np.log(shares) + rng.gumbel(size=(users, len(cats)))), axis=1)[:, :3]
+    end_s = np.datetime64(end, "s").astype(np.int64)
+    start_s = end_s - days * 86400
+    # signups skew recent, the way a growing product looks
+    joined = start_s + (np.sqrt(rng.random(users)) * (end_s - start_s - 86400)).astype(np.int64)
+
+    joined_at = _stamp(joined).tolist()
+    user_rows, user_skills = [], []
+    for u, (uid, cs, k) in enumerate(zip(user_ids.tolist(), cat_mat.tolist(), n_int.tolist())):
+        tags = [cats[c] for c in cs[:k]] + [CATEGORIES[cats[cs[0]]][1][0]]
+        user_rows.append((uid, f"user{u + 1}", ",".join(dict.fromkeys(tags)), joined_at[u]))
+        user_skills += [(uid, skill_ids[t]) for c in cs[:k] for t in CATEGORIES[cats[c]][1][:2]]
+    prof = np.round(rng.uniform(0.2, 1.0, size=len(user_skills)), 2).tolist()
+    user_skills = [(u, s, p) for (u, s), p in zip(user_skills, prof)]
+
+    # activity is heavy tailed too: most users do a handful of things, a few do hundreds
+    activity = rng.lognormal(0, 1.2, size=users)
+    activity /= activity.sum()
+    by_cat = [np.flatnonzero(item_cat == c) for c in range(len(cats))]
+    by_cat_cum = [np.cumsum(item_pop[ix]) / item_pop[ix].sum() if ix.size else ix for ix in by_cat]
+    pop_cum = np.cumsum(item_pop)
+    pop_cum /= pop_cum[-1]
+
+    # draw in rounds, dropping repeated (user, item) pairs, until there are enough distinct ones
+    seen = np.zeros(0, dtype=np.int64)
+    uu, ii = [], []
+    need = interactions
+    while need > 0:
+        n = int(need * 1.2) + 16
+        u = rng.choice(users, size=n, p=activity)
+        it = np.minimum(np.searchsorted(pop_cum, rng.random(n)), items - 1)
+        # most picks come from one of the users own categories, by popularity within it
+        own = rng.random(n) < affinity
+        sub = np.flatnonzero(own)
+        pick = cat_mat[u[sub], (rng.random(sub.size) * n_int[u[sub]]).astype(np.int64)]
+        for c in range(len(cats)):
+            m = pick == c
+            if not m.any() or not by_cat[c].size: continue
+            r = np.minimum(np.searchsorted(by_cat_cum[c], rng.random(int(m.sum()))), by_cat[c].size - 1)
+            it[sub[m]] = by_cat[c][r]
+
+        # first occurrence of each pair via a stable sort (np.unique on int64 takes a slow hashing path),
+        # then drop pairs from earlier rounds with a binary search into the sorted `seen`
+        key = u.astype(np.int64) * items + it
+        order = np.argsort(key, kind="stable")
+        ks = key[order]
+        first = np.sort(order[np.r_[True, ks[1:] != ks[:-1]]])
+        at = np.minimum(np.searchsorted(seen, key[first]), max(seen.size - 1, 0))
+        old = seen[at] == key[first] if seen.size else np.zeros(first.size, dtype=bool)
+        fresh = first[~old][:need]
+        seen = np.sort(np.concatenate([seen, key[fresh]]))
+        uu.append(u[fresh])
+        ii.append(it[fresh])
+        need -= fresh.size
+        if n > 50 * interactions + 1000: break # catalog too small to hold that many distinct pairs
+
+    u = np.concatenate(uu)
+    it = np.concatenate(ii)
+    # timestamps after the users signup, hour of day follows the daily curve
+    day = joined[u] // 86400 + (rng.random(u.size) * ((end_s - joined[u]) // 86400)).astype(np.int64)
+    hour = rng.choice(24, size=u.size, p=HOURLY / HOURLY.sum())
+    ts = day * 86400 + hour * 3600 + rng.integers(0, 3600, size=u.size)
+    # insert in time order so id order matches created_at, like a real log
+    order = np.argsort(ts, kind="stable")
+    u, it, ts = u[order], it[order], ts[order]
+    inter = zip(user_ids[u].tolist(), item_ids[it].tolist(), _choice(rng, TYPES, u.size).tolist(),
+                _choice(rng, RATINGS, u.size).tolist(), _stamp(ts).tolist())
+
+    return {
+        "users": user_rows, "content": content,
+        "skills": [(sid, t) for t, sid in skill_ids.items()],
+        "user_skills": user_skills, "content_skills": content_skills,
+        "interactions": inter, "n_interactions": int(u.size),
+    }
+
+# bulk load pragmas, on top of database.PRAGMAS. safe here because a crash just means regenerating
+LOAD_PRAGMAS = {"synchronous": "OFF", "cache_size": -512 * 1024}
+
+def load(ds, cooc=True):
+    # wipes and refills database.DB_FILE in one transaction
+    c = database.get_conn()
+    try:
+        migrate(c)
+        for k, v in LOAD_PRAGMAS.items():
+            c.execute(f"PRAGMA {k}={v}")
+        c.execute("BEGIN")
+        for t in ("users", "content", "skills", "user_skills", "content_skills", "interactions", "item_cooc", "precomputed_recs", "popularity_delta"):
+            c.execute(f"DELETE FROM {t}")
+        # building the secondary indexes once at the end beats updating them a row at a time
+        indexes = c.execute("SELECT name, sql FROM sqlite_master WHERE type='index' AND sql IS NOT NULL AND tbl_name IN "
+                            "('interactions', 'user_skills', 'content_skills')").fetchall()
+        for name, _ in indexes: c.execute(f"DROP INDEX {name}")
+        # same for the version triggers, one bump at the end instead of one per row
+        triggers = c.execute("SELECT name, sql FROM sqlite_master WHERE type='trigger' AND tbl_name IN "
+                             "('content', 'skills', 'user_skills', 'content_skills')").fetchall()
+        for name, _ in triggers: c.execute(f"DROP TRIGGER {name}")
+        c.executemany("INSERT INTO users (id, name, interests, created_at) VALUES (?, ?, ?, ?)", ds["users"])
+        c.executemany("INSERT INTO content (id, title, category, difficulty, popularity) VALUES (?, ?, ?, ?, ?)", ds["content"])
+        c.executemany("INSERT INTO skills (id, name) VALUES (?, ?)", ds["skills"])
+        c.executemany("INSERT INTO user_skills (user_id, skill_id, proficiency) VALUES (?, ?, ?)", ds["user_skills"])
+        c.executemany("INSERT INTO content_skills (content_id, skill_id) VALUES (?, ?)", ds["content_skills"])
+        c.executemany("INSERT INTO interactions (user_id, content_id, type, rating, created_at) VALUES (?, ?, ?, ?, ?)", ds["interactions"])
+        for _, sql in indexes + triggers: c.execute(sql)
+        c.execute("UPDATE app_meta SET value = value + 1 WHERE key IN ('content_version', 'category_version', 'catalog_version', 'skill_version')")
+        c.commit()
+        c.execute("ANALYZE")
+    except Exception:
+        if c.in_transaction: c.rollback()
+        raise
+    finally:
+        c.close()
+    if cooc: MainRepo().rebuild_cooc()
+
+def generate(users=10_000, items=2_000, interactions=100_000, seed=42, cooc=True, **kw):
+    st = time.perf_counter()
+    ds = make_dataset(users, items, interactions, seed, **kw)
+    load(ds, cooc)
+    return {"users": len(ds["users"]), "items": len(ds["content"]), "interactions": ds["n_interactions"],
+            "seconds": round(time.perf_counter() - st, 2)}
+
+@contextlib.contextmanager
+def fixture(size="1k", seed=42, cache_dir=None, cooc=False):
+    # points the data layer at a generated db for the duration, built once per (size, seed) and reused.
+    # callers must treat it as read only since later runs share the file
+    params = SIZES[size] if isinstance(size, str) else size
+    cache_dir = cache_dir or os.path.join(tempfile.gettempdir(), "rec_sys_fixtures")
+    os.makedirs(cache_dir, exist_ok=True)
+    name = "synthetic_{users}u_{items}i_{interactions}x_s{seed}{c}.db".format(seed=seed, c="_cooc" if cooc else "", **params)
+    path = os.path.join(cache_dir, name)
+
+    old_db = database.DB_FILE
+    database.DB_FILE = path
+    try:
+        if not os.path.exists(path):
+            # build under a temp name and rename, so an interrupted run never leaves a half-filled fixture
+            database.DB_FILE = path + f".{os.getpid()}.tmp"
+            generate(seed=seed, cooc=cooc, **params)
+            c = database.get_conn()
+            c.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            c.close()
+            os.replace(database.DB_FILE, path)
+            for ext in ("-wal", "-shm"):
+                with contextlib.suppress(FileNotFoundError): os.remove(database.DB_FILE + ext)
+            database.DB_FILE = path
+        yield path
+    finally:
+        database.DB_FILE = old_db
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="fill the db with a synthetic dataset (wipes existing rows)")
+    ap.add_argument("--size", choices=list(SIZES), help="preset, overrides the counts below")
+    ap.add_argument("--users", type=int, default=10_000)
+    ap.add_argument("--items", type=int, default=2_000)
+    ap.add_argument("--interactions", type=int, default=100_000)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--alpha", type=float, default=1.1, help="item popularity power-law exponent")
+    ap.add_argument("--db", default=database.DB_FILE)
+    ap.add_argument("--no-cooc", action="store_true", help="skip the item co-occurrence rebuild")
+    a = ap.parse_args()
+
+    database.DB_FILE = a.db
+    params = SIZES[a.size] if a.size else dict(users=a.users, items=a.items, interactions=a.interactions)
+    print(generate(seed=a.seed, alpha=a.alpha, cooc=not a.no_cooc, **params))
@@ -0,0 +1,123 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import json
+import time
+import random
+import argparse
+import threading
+import itertools
+import urllib.request
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor
+
+def zipf_sampler(keys, s=1.1, seed=0):
+    # rank r gets weight 1/r^s so a few hot users take most of the traffic, like real logs
+    rng = random.Random(seed)
+    cum = list(itertools.accumulate(1.0 / (r ** s) for r in range(1, len(keys) + 1)))
+    return lambda: rng.choices(keys, cum_weights=cum)[0]
+
+def percentile(sorted_vals, q):
+    if not sorted_vals: return 0.0
+    return sorted_vals[min(len(sorted_vals) - 1, int(q * len(sorted_vals)))]
+
+class LoadTest:
+    def __init__(self, base_url, users, items, feedback_ratio=0.1, zipf_s=1.1, timeout=5, seed=0):
+        self.base = base_url.rstrip("/")
+        self.next_user = zipf_sampler(users, zipf_s, seed)
+        self.items = items
+        self.feedback_ratio = feedback_ratio
+        self.timeout = timeout
+        self.rng = random.Random(seed + 1)
+        self.lock = threading.Lock()
+        self.lat = {"recommend": [], "feedback": []}
+        self.errors = 0
+
+    def _pick(self):
+        with self.lock:
+            uid = self.next_user()
+            if self.rng.random() < self.feedback_ratio:
+                body = json.dumps({"uid": uid, "cid": self.rng.choice(self.items), "rating": self.rng.choice([3.0, 4.0, 5.0])}).encode()
+                return "feedback", urllib.request.Request(f"{self.base}/feedback", data=body, headers={"Content-Type": "application/json"})
+            return "recommend", urllib.request.Request(f"{self.base}/recommend/{uid}")
+
+    def _send(self, scheduled=None):
+        # open-loop latency is measured from when the request *should* have gone out,
+        # so a backed-up client doesnt hide server slowness (coordinated omission)
+        op, req = self._pick()
+        st = scheduled if scheduled is not None else time.perf_counter()
+        ok = True
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as r:
+                r.read()
+        except (urllib.error.URLError, OSError):
+            ok = False
+        ms = (time.perf_counter() - st) * 1000
+        with self.lock:
+            self.lat[op].append(ms)
+            if not ok: self.errors += 1
+
+    def closed_loop(self, concurrency, duration):
+        # N workers, each sends the next request as soon as the last one returns
+        end = time.perf_counter() + duration
+        def worker():
+            while time.perf_counter() < end: self._send()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+
+    def open_loop(self, rps, duration, max_workers=256):
+        # poisson arrivals at a fixed target rate regardless of how fast the server answers
+        rng = random.Random(7)
+        st = time.perf_counter()
+        nxt = st
+        with ThreadPoolExecutor(max_workers) as ex:
+            while nxt < st + duration:
+                delay = nxt - time.perf_counter()
+                if delay > 0: time.sleep(delay)
+                ex.submit(self._send, nxt)
+                nxt += rng.expovariate(rps)
+
+    def report(self, wall):
+        every = sorted(self.lat["recommend"] + self.lat["feedback"])
+        total = len(every)
+        res = {"requests": total, "errors": self.errors,
+               "error_rate": round(self.errors / total, 4) if total else 0.0,
+               "throughput_rps": round(total / wall, 2) if wall else 0.0}
+        for name, vals in [("all", every)] + [(k, sorted(v)) for k, v in self.lat.items()]:
+            res[name] = {"count": len(vals), "p50": round(percentile(vals, 0.5), 2), "p90": round(percentile(vals, 0.9), 2),
+                         "p99": round(percentile(vals, 0.99), 2), "max": round(vals[-1], 2) if vals else 0.0}
+        return res
+
+def run(base_url="http://127.0.0.1:5000", mode="closed", concurrency=10, rps=50, duration=10,
+        feedback_ratio=0.1, zipf_s=1.1, users=None, items=None):
+    if users is None or items is None:
+        from data.repositories import MainRepo
+        repo = MainRepo()
+        users = users or sorted(repo.get_all_user_ids())
+        items = items or sorted(repo.get_all_content())
+    lt = LoadTest(base_url, users, items, feedback_ratio, zipf_s)
+
+    st = time.perf_counter()
+    if mode == "closed":
+        lt.closed_loop(concurrency, duration)
+    else:
+        lt.open_loop(rps, duration)
+    res = lt.report(time.perf_counter() - st)
+    res.update({"mode": mode, "concurrency": concurrency if mode == "closed" else None,
+                "target_rps": rps if mode == "open" else None, "duration_sec": duration,
+                "feedback_ratio": feedback_ratio, "zipf_s": zipf_s, "users": len(users)})
+    return res
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="load generator for the rec api")
+    ap.add_argument("--url", default="http://127.0.0.1:5000")
+    ap.add_argument("--mode", choices=["closed", "open"], default="closed")
+    ap.add_argument("--concurrency", type=int, default=10)
+    ap.add_argument("--rps", type=float, default=50)
+    ap.add_argument("--duration", type=float, default=10)
+    ap.add_argument("--feedback-ratio", type=float, default=0.1)
+    ap.add_argument("--zipf", type=float, default=1.1)
+    a = ap.parse_args()
+    print(json.dumps(run(a.url, a.mode, a.concurrency, a.rps, a.duration, a.feedback_ratio, a.zipf), indent=2))
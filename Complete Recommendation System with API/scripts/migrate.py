@@ -0,0 +1,17 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from data.database import get_conn
+from data.migrations import migrate, current_version, LATEST
+
+def run():
+    c = get_conn()
+    before = current_version(c)
+    for ver, name in migrate(c):
+        print(f"[+] applied {ver}: {name}")
+    print(f"[+] schema at version {current_version(c)} (was {before}, latest {LATEST})")
+    c.close()
+
+if __name__ == "__main__":
+    run()
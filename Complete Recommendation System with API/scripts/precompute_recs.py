@@ -0,0 +1,71 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import data.database as database
+from data.repositories import MainRepo
+
+_orch = None
+
+def _init_worker(db_file):
+    # each worker process builds its own orchestrator (own catalog snapshot + db connection)
+    global _orch
+    database.DB_FILE = db_file
+    from engine.orchestrator import RecOrchestrator
+    _orch = RecOrchestrator(async_writes=False)
+
+def _compute(uids, top_n):
+    rows = [(r["user_id"], r["ab_group"], r["recommendations"]) for r in _orch.get_recs_batch(uids, top_n) if "err" not in r]
+    return _orch.model_version, rows
+
+def _serving_config():
+    # what the api will check rows against, read from a worker so the main process never builds an orchestrator
+    return _orch.model_version, _orch.precompute_max_age
+
+def run(top_n=20, workers=None, chunk=1000, full=False):
+    repo = MainRepo()
+    st = time.time()
+    
+    # stamp before computing so anything logged while we run makes those rows stale
+    max_rowid = repo.get_max_interaction_id()
+    content_ver = repo.get_content_version()
+    skill_ver = repo.get_skill_version()
+    version = repo.get_meta("precompute_version", 0) + 1
+    
+    done = 0
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(database.DB_FILE,)) as ex:
+        model_ver, max_age = ex.submit(_serving_config).result()
+        # catalog, skill graph or model changes invalidate everything. otherwise users with new interactions,
+        # users whose row was dropped (e.g. after an interest edit) and rows the api would reject anyway:
+        # past half their max age (so a daily run redoes them before they expire) or built for another
+        # skill graph / model
+        full = (full or content_ver != repo.get_meta("precompute_content_version")
+                or skill_ver != repo.get_meta("precompute_skill_version")
+                or f"m{model_ver}" != repo.get_meta("precompute_model_version"))
+        uids = repo.get_all_user_ids() if full else repo.get_users_changed_since(
+            repo.get_meta("precompute_rowid", 0), computed_before=time.time() - max_age / 2, model_version=model_ver)
+        
+        chunks = [uids[n:n + chunk] for n in range(0, len(uids), chunk)]
+        for model_ver, rows in ex.map(_compute, chunks, [top_n] * len(chunks)):
+            repo.save_precomputed(rows, version, content_ver, max_rowid, top_n, skill_ver, model_ver)
+            done += len(rows)
+    
+    repo.set_meta("precompute_version", version)
+    repo.set_meta("precompute_rowid", max_rowid)
+    repo.set_meta("precompute_content_version", content_ver)
+    repo.set_meta("precompute_skill_version", skill_ver)
+    # app_meta.value has integer affinity, the prefix keeps an all-digit hash from being stored as a number
+    repo.set_meta("precompute_model_version", f"m{model_ver}")
+    print(f"[+] precompute v{version}: {done} users ({'full' if full else 'incremental'}) in {time.time() - st:.2f}s")
+    return {"version": version, "users": done, "full": full}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="materialize top-N recommendations per user")
+    ap.add_argument("--top-n", type=int, default=20)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--full", action="store_true", help="recompute every user, not just changed ones")
+    args = ap.parse_args()
+    run(args.top_n, args.workers, full=args.full)
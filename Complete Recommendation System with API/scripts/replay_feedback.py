@@ -0,0 +1,17 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+import argparse
+from data.repositories import MainRepo
+from data.feedback_writer import DEAD_LETTER_FILE, replay_dead_letters
+
+def run(path=None):
+    n = replay_dead_letters(MainRepo(), path)
+    print(f"[+] replayed {n} interactions from {path or DEAD_LETTER_FILE}")
+    return n
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="write feedback batches the background writer gave up on back to the db")
+    ap.add_argument("--path", default=None)
+    run(ap.parse_args().path)
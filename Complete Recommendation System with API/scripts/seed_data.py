@@ -11,7 +11,7 @@ def seed():
     c = get_conn()
     
     # wipe slate clean
-    c.executescript("DELETE FROM users; DELETE FROM content; DELETE FROM interactions;")
+    c.executescript("DELETE FROM users; DELETE FROM content; DELETE FROM interactions; DELETE FROM skills; DELETE FROM user_skills; DELETE FROM content_skills;")
     
     users = [
         ("u1", "alice", "ai,ml"), ("u2", "bob", "web,js"), ("u3", "charlie", "data,python"),
@@ -45,6 +45,27 @@ def seed():
     ]
     c.executemany("INSERT INTO content (id, title, category, difficulty, popularity) VALUES (?, ?, ?, ?, ?)", content)
     
+    # skills feed the knowledge graph (engine/knowledge_graph.py), relations come from which skills show up together
+    skills = ["ml", "deep learning", "vision", "mlops", "data", "python", "pandas", "sql", "js", "css", "frontend",
+              "backend", "apis", "docker", "kubernetes", "ci/cd", "networking", "malware", "pc", "gpu"]
+    sid = {s: f"s{n}" for n, s in enumerate(skills, 1)}
+    c.executemany("INSERT INTO skills (id, name) VALUES (?, ?)", [(v, k) for k, v in sid.items()])
+    content_skills = {
+        "c1": ["ml", "deep learning"], "c2": ["js", "frontend"], "c3": ["python", "pandas", "data"], "c4": ["docker", "backend"],
+        "c5": ["vision", "ml"], "c6": ["apis", "backend"], "c7": ["css", "frontend"], "c8": ["networking"],
+        "c9": ["mlops", "ml", "data"], "c10": ["pc", "gpu"], "c11": ["python", "backend"], "c12": ["kubernetes", "docker"],
+        "c13": ["sql", "data"], "c14": ["malware", "networking"], "c15": ["js", "frontend"], "c16": ["deep learning", "ml"],
+        "c17": ["python", "apis", "backend"], "c18": ["ci/cd", "docker"], "c19": ["gpu", "deep learning"], "c20": ["pandas", "data"]
+    }
+    c.executemany("INSERT INTO content_skills (content_id, skill_id) VALUES (?, ?)", [(cid, sid[s]) for cid, ss in content_skills.items() for s in ss])
+    user_skills = [
+        ("u1", "ml", 0.8), ("u1", "python", 0.6), ("u2", "js", 0.9), ("u2", "css", 0.5), ("u3", "python", 0.9), ("u3", "sql", 0.7),
+        ("u4", "docker", 0.7), ("u4", "kubernetes", 0.5), ("u5", "vision", 0.6), ("u5", "ml", 0.5), ("u6", "python", 0.8),
+        ("u6", "apis", 0.7), ("u7", "css", 0.8), ("u7", "js", 0.6), ("u8", "networking", 0.7), ("u9", "ml", 0.6),
+        ("u9", "docker", 0.6), ("u10", "gpu", 0.8), ("u10", "pc", 0.9)
+    ]
+    c.executemany("INSERT INTO user_skills (user_id, skill_id, proficiency) VALUES (?, ?, ?)", [(u, sid[s], p) for u, s, p in user_skills])
+    
     interactions = [
         ("u1", "c1", "view", 5.0), ("u1", "c16", "view", 4.5), ("u1", "c9", "view", 4.0),
         ("u2", "c2", "view", 4.0), ("u2", "c7", "view", 5.0),
@@ -55,7 +76,11 @@ def seed():
     c.executemany("INSERT INTO interactions (user_id, content_id, type, rating) VALUES (?, ?, ?, ?)", interactions)
     
     c.commit()
-    print("[+] DB seeded: 10 users, 20 items, and sample interactions ready.")
+    c.close()
+    
+    # offline item-item model, kept fresh incrementally by log_interaction afterwards
+    repo.rebuild_cooc()
+    print("[+] DB seeded: 10 users, 20 items, 20 skills, and sample interactions ready.")
 
 if __name__ == "__main__":
     seed()
\ No newline at end of file
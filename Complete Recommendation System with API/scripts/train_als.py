@@ -0,0 +1,55 @@
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+# BLAS picks its thread count when numpy loads, so set OPENBLAS_NUM_THREADS / OMP_NUM_THREADS
+# in the environment (not here) to control training parallelism
+import time
+import argparse
+import numpy as np
+from data.repositories import MainRepo
+from engine.als import ALS_DIR, ALSModel, build_csr, train_als
+
+RATING_SCALE = 5.0
+
+def train(out=ALS_DIR, factors=32, reg=100.0, alpha=10.0, iters=10, cg_steps=3, seed=0, verbose=True):
+    repo = MainRepo()
+    st = time.perf_counter()
+    max_rowid = repo.get_max_interaction_id()
+
+    # intern ids as rows stream in, positives only (same rating >= 3 cut as the user histories)
+    users, items = {}, {}
+    rows, cols, vals = [], [], []
+    for uid, cid, rating in repo.iter_interactions():
+        rows.append(users.setdefault(uid, len(users)))
+        cols.append(items.setdefault(cid, len(items)))
+        vals.append(rating)
+    if not rows: raise ValueError("no interactions to train on")
+    indptr, indices, data = build_csr(rows, cols, vals, (len(users), len(items)))
+    load_s = time.perf_counter() - st
+    if verbose: print(f"loaded {len(data):,} interactions, {len(users):,} users x {len(items):,} items in {load_s:.1f}s")
+
+    st = time.perf_counter()
+    log = (lambda it, s: print(f"iter {it + 1}/{iters}: {s:.2f}s")) if verbose else None
+    X, Y = train_als(indptr, indices, data / RATING_SCALE, len(items), factors, reg, alpha, iters, cg_steps, seed, log)
+    train_s = time.perf_counter() - st
+
+    meta = {"factors": factors, "reg": reg, "alpha": alpha, "rating_scale": RATING_SCALE, "iters": iters, "cg_steps": cg_steps, "seed": seed,
+            "n_users": len(users), "n_items": len(items), "nnz": int(len(data)), "max_rowid": max_rowid,
+            "trained_at": time.time(), "load_seconds": round(load_s, 2), "train_seconds": round(train_s, 2)}
+    model = ALSModel(X, Y, np.array(list(users)), np.array(list(items)), meta)
+    model.save(out)
+    if verbose: print(f"[+] {factors} factors x {iters} iters in {train_s:.1f}s, saved to {out}")
+    return model
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="train implicit ALS factors from the interactions table")
+    ap.add_argument("--out", default=ALS_DIR)
+    ap.add_argument("--factors", type=int, default=32)
+    ap.add_argument("--reg", type=float, default=100.0, help="l2 penalty, high because most users have only a handful of positives")
+    ap.add_argument("--alpha", type=float, default=10.0, help="confidence = 1 + alpha * rating / 5")
+    ap.add_argument("--iters", type=int, default=10)
+    ap.add_argument("--cg-steps", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    a = ap.parse_args()
+    train(a.out, a.factors, a.reg, a.alpha, a.iters, a.cg_steps, a.seed)
@@ -1,5 +1,6 @@
 import unittest
-from api.app import app
+import json
+from api.app import app, orch
 
 class TestRecAPI(unittest.TestCase):
     def setUp(self):
@@ -12,16 +13,69 @@ class TestRecAPI(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(res.json['status'], 'ok')
         
+    def test_metrics_cache_stats(self):
+        self.client.get('/recommend/u1')
+        res = self.client.get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        for k in ("hits", "misses", "evictions", "size"):
+            self.assertIn(k, res.json['cache'])
+        
+    def test_metrics_latency_and_stages(self):
+        orch.invalidate(['u2'])
+        self.client.get('/recommend/u2')
+        m = self.client.get('/metrics').json
+        self.assertIn("GET /recommend/<uid> 200", m['latency_ms'])
+        for k in ("p50", "p95", "p99"):
+            self.assertIn(k, m['latency_ms']["GET /recommend/<uid> 200"])
+        self.assertIn("catalog", m['stages_ms'])
+        v = m['experiment']['variants'][orch.get_ab_group('u2')]
+        self.assertGreaterEqual(v['requests'], 1)
+        self.assertIn("p99", v['latency_ms'])
+        
+        res = self.client.get('/metrics/prometheus')
+        self.assertEqual(res.status_code, 200)
+        body = res.get_data(as_text=True)
+        self.assertIn('http_request_duration_ms_bucket{method="GET",route="/recommend/<uid>",status="200",le="+Inf"}', body)
+        self.assertIn('rec_stage_duration_ms_count{stage="scoring"}', body)
+
     def test_recommend_known_user(self):
         res = self.client.get('/recommend/u1')
         self.assertEqual(res.status_code, 200)
         self.assertIn('recommendations', res.json)
         self.assertTrue(len(res.json['recommendations']) > 0)
         
+    def test_recommend_bad_limit(self):
+        for bad in ("0", "-1", "x"):
+            res = self.client.get(f'/recommend/u1?limit={bad}')
+            self.assertEqual(res.status_code, 400)
+            self.assertIn('err', res.json)
+        one = self.client.get('/recommend/u1?limit=1').json['recommendations']
+        self.assertEqual(len(one), 1)
+        self.assertGreater(len(self.client.get('/recommend/u1').json['recommendations']), 1)
+        
     def test_recommend_unknown_user(self):
         res = self.client.get('/recommend/ghost_user')
         self.assertEqual(res.status_code, 404)
         
+    def test_recommend_batch(self):
+        res = self.client.post('/recommend/batch', json={"user_ids": ["u1", "ghost_user", "u2"], "limit": 3})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, "application/x-ndjson")
+        
+        rows = [json.loads(l) for l in res.get_data(as_text=True).splitlines()]
+        self.assertEqual([r["user_id"] for r in rows], ["u1", "ghost_user", "u2"])
+        self.assertEqual(rows[1]["err"], "user not found")
+        self.assertTrue(0 < len(rows[0]["recommendations"]) <= 3)
+
+    def test_recommend_batch_bad_payload(self):
+        self.assertEqual(self.client.post('/recommend/batch', json={}).status_code, 400)
+        self.assertEqual(self.client.post('/recommend/batch', json={"user_ids": "u1"}).status_code, 400)
+        for body in ({"user_ids": ["u1"], "limit": "x"}, {"user_ids": ["u1"], "limit": 0}, {"user_ids": ["u1"], "limit": True},
+                     {"user_ids": [["u1"]]}, {"user_ids": ["u1", ""]}, {"user_ids": [7]}):
+            res = self.client.post('/recommend/batch', json=body)
+            self.assertEqual(res.status_code, 400, body)
+            self.assertIn('err', res.json)
+
     def test_missing_feedback_data(self):
         res = self.client.post('/feedback', json={"uid": "u1"}) # missing cid/rating
         self.assertEqual(res.status_code, 400)
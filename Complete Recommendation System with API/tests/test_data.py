@@ -0,0 +1,757 @@
+import unittest
+import numpy as np
+import os
+import tempfile
+import threading
+import time
+import sys
+import subprocess
+import data.database as database
+from data.repositories import MainRepo
+from engine.catalog import CatalogStore
+from engine.knowledge_graph import KnowledgeGraphStore
+from engine.artifact import ServingArtifact, ContentView, _codes
+import json
+from data.migrations import migrate, current_version, LATEST
+from engine.orchestrator import RecOrchestrator
+from engine.experiments import Experiment
+from data.feedback_writer import FeedbackWriter, replay_dead_letters
+from scripts import precompute_recs, gen_synthetic
+
+class DBTestCase(unittest.TestCase):
+    def setUp(self):
+        # run every test against a throwaway db file
+        self.tmp = tempfile.mkdtemp()
+        self.old_db = database.DB_FILE
+        database.DB_FILE = os.path.join(self.tmp, "test.db")
+        self.repo = MainRepo()
+
+    def tearDown(self):
+        database.DB_FILE = self.old_db
+
+class TestRepo(DBTestCase):
+    def test_rebuild_cooc(self):
+        for uid, cid in [("u1", "a"), ("u1", "b"), ("u2", "a"), ("u2", "b"), ("u2", "c")]:
+            self.repo.log_interaction(uid, cid, "view", 5.0)
+        self.repo.log_interaction("u3", "c", "view", 1.0) # negative, ignored
+        
+        incremental = self.repo.get_item_neighbors(["a", "b", "c"])
+        self.repo.rebuild_cooc()
+        rebuilt = self.repo.get_item_neighbors(["a", "b", "c"])
+        
+        self.assertEqual(incremental, rebuilt)
+        self.assertEqual(rebuilt["a"], [("b", 2.0), ("c", 1.0)])
+
+    def test_cooc_top_n_trim(self):
+        self.repo.log_interaction("u1", "a", "view", 5.0)
+        for cid in ["b", "c", "d"]:
+            self.repo.log_interaction("u1", cid, "view", 5.0)
+        self.repo.log_interaction("u2", "a", "view", 5.0)
+        self.repo.log_interaction("u2", "d", "view", 5.0)
+        
+        self.repo.rebuild_cooc(top_n=1)
+        self.assertEqual(self.repo.get_item_neighbors(["a"]), {"a": [("d", 2.0)]})
+
+    def test_repeat_interaction_not_double_counted(self):
+        self.repo.log_interaction("u1", "a", "view", 5.0)
+        self.repo.log_interaction("u1", "b", "view", 5.0)
+        self.repo.log_interaction("u1", "b", "view", 4.0)
+        self.assertEqual(self.repo.get_item_neighbors(["a"])["a"], [("b", 1.0)])
+
+    def test_batch_with_repeats_matches_rebuild(self):
+        self.repo.log_interactions([("u1", f"i{n}", "view", 5.0) for n in range(300)])
+        # repeats inside one batch and against the stored history are both skipped
+        self.repo.log_interactions([("u1", c, "view", 5.0) for c in ("i0", "new", "new", "i299")] + [("u2", "new", "view", 5.0), ("u2", "i0", "view", 4.0)])
+        incremental = self.repo.get_item_neighbors(["new", "i0"])
+        self.repo.rebuild_cooc()
+        self.assertEqual(incremental, self.repo.get_item_neighbors(["new", "i0"]))
+
+class TestBatchRecs(DBTestCase):
+    def seed(self):
+        c = database.get_conn()
+        c.executemany("INSERT INTO users (id, name, interests) VALUES (?, ?, ?)", [("u1", "a", "ai"), ("u2", "b", "web"), ("u3", "c", "")])
+        c.executemany("INSERT INTO content (id, title, category, difficulty, popularity) VALUES (?, ?, ?, ?, ?)",
+                      [(f"c{n}", f"t{n}", ["ai", "web", "data"][n % 3], "beginner", n / 10) for n in range(10)])
+        c.executemany("INSERT INTO interactions (user_id, content_id, type, rating) VALUES (?, ?, ?, ?)",
+                      [("u1", "c0", "view", 5.0), ("u1", "c1", "view", 4.0), ("u2", "c1", "view", 5.0), ("u2", "c4", "view", 5.0)])
+        c.commit()
+        c.close()
+        self.repo.rebuild_cooc()
+
+    def test_batch_matches_single(self):
+        self.seed()
+        orch = RecOrchestrator(async_writes=False)
+        batch = {r["user_id"]: r for r in orch.get_recs_batch(["u1", "u2", "u3", "nobody"], limit=4)}
+        self.assertEqual(batch["nobody"], {"user_id": "nobody", "err": "user not found"})
+        self.assertEqual(len(orch.cache), 0) # batch doesnt fill the cache
+        orch.get_recs("u1", limit=4)
+        before = orch.cache.stats()
+        again = {r["user_id"]: r for r in orch.get_recs_batch(["u1", "u2"], limit=4)}
+        self.assertIs(again["u1"]["cached"], True)
+        self.assertEqual(orch.cache.stats(), before) # and doesnt show up in its hit / miss counts
+        for u in ["u1", "u2", "u3"]:
+            single = orch.get_recs(u, limit=4)
+            self.assertEqual(batch[u]["recommendations"], single["data"])
+            self.assertEqual(batch[u]["ab_group"], single["ab_group"])
+
+    def test_cached_top_n_independent_of_first_limit(self):
+        self.seed()
+        orch = RecOrchestrator(async_writes=False)
+        self.assertEqual(len(orch.get_recs("u1", limit=1)["data"]), 1)
+        res = orch.get_recs("u1", limit=5)
+        self.assertIs(res["cached"], True)
+        self.assertEqual(res["data"], RecOrchestrator(async_writes=False).compute_recs("u1", 5)["data"][:5])
+        self.assertEqual(len(res["data"]), 5)
+        # more than the cached entry was ranked for is a miss, not a short list
+        self.assertIs(orch.get_recs("u1", limit=orch.cache_top_n + 1)["cached"], False)
+        self.assertIs(orch.get_recs("u1", limit=orch.cache_top_n + 1)["cached"], True)
+
+    def test_precompute_served_until_user_changes(self):
+        self.seed()
+        res = precompute_recs.run(top_n=5, workers=1)
+        self.assertEqual((res["users"], res["full"]), (3, True))
+        
+        orch = RecOrchestrator()
+        self.addCleanup(orch.close)
+        first = orch.get_recs("u1", limit=3)
+        self.assertEqual(first["cached"], "precomputed")
+        self.assertEqual(len(first["data"]), 3)
+        
+        # new interaction makes u1 stale, the next run only redoes u1
+        orch.add_feedback("u1", "c7", 5.0)
+        orch.writer.flush()
+        self.assertIsNone(self.repo.get_precomputed("u1", max_age=3600))
+        self.assertFalse(orch.get_recs("u1")["cached"])
+        self.assertIsNotNone(self.repo.get_precomputed("u2", max_age=3600))
+        
+        res = precompute_recs.run(top_n=5, workers=1)
+        self.assertEqual((res["users"], res["full"], res["version"]), (1, False, 2))
+        self.assertEqual(self.repo.get_precomputed("u1", max_age=3600)["version"], 2)
+
+    def test_precompute_dropped_on_interest_skill_or_model_change(self):
+        self.seed()
+        precompute_recs.run(top_n=5, workers=1)
+        orch = RecOrchestrator(async_writes=False)
+        for u in ("u1", "u2", "u3"): self.assertIsNotNone(self.repo.get_precomputed(u, 3600, orch.model_version))
+        
+        c = database.get_conn()
+        c.execute("UPDATE users SET interests='data' WHERE id='u1'")
+        c.commit()
+        self.assertIsNone(self.repo.get_precomputed("u1", 3600))
+        self.assertIsNotNone(self.repo.get_precomputed("u2", 3600))
+        self.assertIsNone(self.repo.get_precomputed("u2", 3600, "other-model"))
+        
+        # skills feed the graph everyone is ranked against
+        c.execute("INSERT INTO user_skills (user_id, skill_id, proficiency) VALUES ('u3', 's1', 1.0)")
+        c.commit()
+        c.close()
+        self.assertIsNone(self.repo.get_precomputed("u2", 3600))
+        self.assertFalse(orch.get_recs("u2")["cached"])
+        self.assertEqual(precompute_recs.run(top_n=5, workers=1)["full"], True)
+        self.assertIsNotNone(self.repo.get_precomputed("u2", 3600, orch.model_version))
+
+    def test_precompute_redoes_aging_and_stale_model_rows(self):
+        self.seed()
+        precompute_recs.run(top_n=5, workers=1)
+        self.assertEqual(precompute_recs.run(top_n=5, workers=1)["users"], 0)
+        
+        # an inactive user's row is rebuilt before it expires, not left to fall back to live compute
+        c = database.get_conn()
+        c.execute("UPDATE precomputed_recs SET computed_at = computed_at - 13 * 3600 WHERE user_id='u2'")
+        c.commit()
+        c.close()
+        res = precompute_recs.run(top_n=5, workers=1)
+        self.assertEqual((res["users"], res["full"]), (1, False))
+        self.assertIsNotNone(self.repo.get_precomputed("u2", 3600))
+        
+        # a retrained model / new experiment config redoes everyone
+        self.repo.set_meta("precompute_model_version", "m-old")
+        self.assertEqual(precompute_recs.run(top_n=5, workers=1)["full"], True)
+        self.assertEqual(sorted(self.repo.get_users_changed_since(self.repo.get_max_interaction_id(), model_version="other")),
+                         sorted(self.repo.get_all_user_ids()))
+
+class TestFeedbackWriter(DBTestCase):
+    def count(self):
+        with database.pooled_conn() as c:
+            return c.execute("SELECT COUNT(*) FROM interactions").fetchone()[0]
+
+    def test_batches_writes(self):
+        flushed = set()
+        w = FeedbackWriter(self.repo, batch_size=500, flush_every=0.5, on_flush=flushed.update)
+        for n in range(1200):
+            w.submit(f"u{n % 7}", f"c{n % 40}", "rating", 5.0)
+        w.flush()
+        st = w.stats()
+        self.assertEqual(self.count(), 1200)
+        self.assertEqual((st["written"], st["failed"], st["queued"]), (1200, 0, 0))
+        self.assertLess(st["batches"], 1200 / 100)
+        self.assertEqual(flushed, {f"u{n}" for n in range(7)})
+        # batch path keeps co-occurrence identical to a full rebuild
+        before = self.repo.get_item_neighbors(["c0", "c1"])
+        self.repo.rebuild_cooc()
+        self.assertEqual(before, self.repo.get_item_neighbors(["c0", "c1"]))
+        w.close()
+
+    def test_no_writes_lost_on_clean_exit(self):
+        # child process queues writes and just exits, atexit has to drain the queue
+        script = (
+            "import data.database as database; database.DB_FILE = %r\n"
+            "from data.repositories import MainRepo\n"
+            "from data.feedback_writer import FeedbackWriter\n"
+            "w = FeedbackWriter(MainRepo(), flush_every=5)\n"
+            "for n in range(2000): w.submit('u%%d' %% (n %% 50), 'c%%d' %% n, 'rating', 4.0)\n"
+        ) % database.DB_FILE
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        subprocess.run([sys.executable, "-c", script], cwd=root, check=True, timeout=60)
+        self.assertEqual(self.count(), 2000)
+
+    def test_failed_batch_retried_then_dead_lettered(self):
+        dead = os.path.join(self.tmp, "dead.jsonl")
+        calls = []
+        real = self.repo.log_interactions
+        def flaky(rows):
+            calls.append(len(rows))
+            if len(calls) <= 2: raise database.sqlite3.OperationalError("database is locked")
+            return real(rows)
+        self.repo.log_interactions = flaky
+        w = FeedbackWriter(self.repo, flush_every=0.01, retries=1, backoff=0.01, dead_letter=dead)
+        w.submit("u1", "c1", "rating", 5.0)
+        w.flush()
+        # first attempt + one retry both fail, so the batch goes to the dead letter file instead of vanishing
+        self.assertEqual((self.count(), w.stats()["failed"], w.stats()["dead_lettered"]), (0, 1, 1))
+        w.submit("u2", "c2", "rating", 5.0)
+        w.flush()
+        self.assertEqual((self.count(), w.stats()["written"]), (1, 1))
+        w.close()
+
+        self.repo.log_interactions = real
+        self.assertEqual(replay_dead_letters(self.repo, dead), 1)
+        self.assertEqual(self.count(), 2)
+        self.assertFalse(os.path.exists(dead))
+
+    def test_submit_racing_close_is_written_or_rejected(self):
+        # every submit that returned (the api answered 201) has to be committed, none may land behind the sentinel
+        w = FeedbackWriter(self.repo, flush_every=0.01)
+        accepted = []
+        def spam(t):
+            n = 0
+            while True:
+                try:
+                    w.submit(f"u{t}", f"c{t}_{n}", "view", 1.0) # below the co-occurrence cutoff, keeps the writer fast
+                except RuntimeError:
+                    return
+                accepted.append(1)
+                n += 1
+        threads = [threading.Thread(target=spam, args=(t,)) for t in range(8)]
+        for t in threads: t.start()
+        time.sleep(0.05)
+        w.close()
+        for t in threads: t.join()
+        self.assertGreater(len(accepted), 0)
+        self.assertEqual(self.count(), len(accepted))
+
+    def test_close_releases_exit_hook(self):
+        import gc, weakref
+        w = FeedbackWriter(self.repo)
+        ref = weakref.ref(w)
+        w.close()
+        self.assertFalse(w.thread.is_alive())
+        del w
+        gc.collect()
+        self.assertIsNone(ref()) # atexit no longer holds it
+
+class TestPooledConn(DBTestCase):
+    def test_reused_across_threads_and_tuned(self):
+        with database.pooled_conn() as a, database.pooled_conn() as b:
+            self.assertIs(a, b) # nested blocks share the connection
+            self.assertEqual(a.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            self.assertEqual(a.execute("PRAGMA synchronous").fetchone()[0], 1) # NORMAL
+        
+        # short lived threads one after another all get the same returned connection
+        opened = database.POOL.stats()["opened"]
+        seen = []
+        def use():
+            with database.pooled_conn() as c: seen.append(c)
+        for _ in range(20):
+            t = threading.Thread(target=use)
+            t.start(); t.join()
+        self.assertTrue(all(c is a for c in seen))
+        self.assertEqual(database.POOL.stats()["opened"], opened)
+
+    def test_idle_connections_bounded(self):
+        barrier = threading.Barrier(12)
+        def use():
+            with database.pooled_conn() as c:
+                c.execute("SELECT 1")
+                barrier.wait()
+        threads = [threading.Thread(target=use) for _ in range(12)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        st = database.POOL.stats()
+        self.assertEqual(st["idle"], database.POOL.max_idle)
+        self.assertGreaterEqual(st["closed"], 12 - database.POOL.max_idle)
+
+    def test_failed_write_rolls_back(self):
+        with self.assertRaises(ValueError):
+            with database.pooled_conn() as c:
+                c.execute("INSERT INTO users (id, name, interests) VALUES ('x', 'x', '')")
+                raise ValueError("boom")
+        with database.pooled_conn() as c:
+            self.assertFalse(c.in_transaction)
+            self.assertIsNone(c.execute("SELECT id FROM users WHERE id='x'").fetchone())
+
+class TestMigrations(DBTestCase):
+    def plan(self, sql, args=()):
+        with database.pooled_conn() as c:
+            return " | ".join(r['detail'] for r in c.execute("EXPLAIN QUERY PLAN " + sql, args))
+
+    def test_fresh_db_at_latest(self):
+        with database.pooled_conn() as c:
+            self.assertEqual(current_version(c), LATEST)
+            self.assertEqual(migrate(c), [])
+
+    def test_upgrades_legacy_file_in_place(self):
+        # a db created by the original init_db: tables + data but no version stamp
+        database.DB_FILE = os.path.join(self.tmp, "legacy.db")
+        c = database.get_conn()
+        c.executescript('''
+            CREATE TABLE users (id TEXT PRIMARY KEY, name TEXT, interests TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+            CREATE TABLE interactions (user_id TEXT, content_id TEXT, type TEXT, rating REAL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+            INSERT INTO interactions (user_id, content_id, type, rating) VALUES ('u1', 'c1', 'view', 5.0);
+        ''')
+        self.assertEqual(current_version(c), 0)
+        applied = migrate(c)
+        self.assertEqual([v for v, _ in applied], list(range(1, LATEST + 1)))
+        self.assertEqual(current_version(c), LATEST)
+        c.close()
+        self.assertEqual(MainRepo().get_user_hist("u1"), ["c1"])
+
+    def test_interaction_ids_never_reused(self):
+        # legacy rows keep their rowids as ids, and deleting the newest row doesnt hand its id out again
+        database.DB_FILE = os.path.join(self.tmp, "legacy_ids.db")
+        c = database.get_conn()
+        c.executescript('''
+            CREATE TABLE interactions (user_id TEXT, content_id TEXT, type TEXT, rating REAL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+            INSERT INTO interactions (user_id, content_id, type, rating) VALUES ('u1', 'c1', 'view', 5.0), ('u1', 'c2', 'view', 5.0), ('u2', 'c3', 'view', 5.0);
+            DELETE FROM interactions WHERE rowid = 2;
+        ''')
+        migrate(c)
+        self.assertEqual([tuple(r) for r in c.execute("SELECT id, content_id FROM interactions ORDER BY id")], [(1, "c1"), (3, "c3")])
+        c.execute("DELETE FROM interactions WHERE id = 3")
+        c.commit()
+        c.close()
+        repo = MainRepo()
+        repo.log_interaction("u3", "c4", "view", 5.0)
+        self.assertEqual(repo.get_max_interaction_id(), 4)
+        self.assertEqual(repo.get_users_changed_since(3, model_version=None), ["u3"])
+        self.assertEqual(repo.get_user_hist("u3", after_id=3), ["c4"])
+
+    def test_hot_queries_use_indexes(self):
+        self.assertIn("COVERING INDEX idx_interactions_user",
+                      self.plan("SELECT content_id FROM interactions WHERE user_id=? AND rating >= 3", ("u1",)))
+        self.assertIn("COVERING INDEX idx_interactions_user",
+                      self.plan("SELECT DISTINCT content_id FROM interactions WHERE user_id=? AND rating >= 3", ("u1",)))
+        self.assertIn("idx_content_popularity", self.plan("SELECT id FROM content ORDER BY popularity DESC LIMIT 10"))
+        self.assertIn("COVERING INDEX idx_user_skills_user",
+                      self.plan("SELECT skill_id, proficiency FROM user_skills WHERE user_id=?", ("u1",)))
+        self.assertIn("COVERING INDEX idx_content_skills_skill",
+                      self.plan("SELECT content_id FROM content_skills WHERE skill_id=?", ("s1",)))
+        self.assertNotIn("SCAN interactions",
+                         self.plan("SELECT content_id FROM interactions WHERE user_id=? AND rating >= 3", ("u1",)))
+
+class TestCatalog(DBTestCase):
+    def add_content(self, cid, cat, pop):
+        c = database.get_conn()
+        c.execute("INSERT INTO content (id, title, category, difficulty, popularity) VALUES (?, ?, ?, ?, ?)", (cid, cid, cat, "beginner", pop))
+        c.commit()
+        c.close()
+
+    def test_snapshot_reused_until_content_changes(self):
+        self.add_content("c1", "ai", 0.5)
+        self.add_content("c2", "web", 0.9)
+        store = CatalogStore(self.repo, check_every=0)
+        
+        snap = store.get()
+        self.assertIs(store.get(), snap)
+        self.assertEqual(snap.popular, ("c2", "c1"))
+        self.assertEqual(snap.tag_index["ai"], ("c1",))
+        
+        self.add_content("c3", "ai", 0.99)
+        new = store.get()
+        self.assertIsNot(new, snap)
+        self.assertGreater(new.version, snap.version)
+        self.assertEqual(new.popular[0], "c3")
+        self.assertEqual(store.reloads, 2)
+
+    def test_version_check_is_throttled(self):
+        store = CatalogStore(self.repo, check_every=60)
+        snap = store.get()
+        self.add_content("c1", "ai", 0.5)
+        self.assertIs(store.get(), snap)
+        store.invalidate()
+        self.assertEqual(list(store.get().content), ["c1"])
+
+class TestKnowledgeGraphStore(DBTestCase):
+    def test_graph_rebuilt_only_when_skills_change(self):
+        c = database.get_conn()
+        c.executemany("INSERT INTO content (id, title, category, difficulty, popularity) VALUES (?, ?, ?, ?, ?)",
+                      [("c1", "t", "ai", "beginner", 0.5), ("c2", "t", "web", "beginner", 0.5)])
+        c.executemany("INSERT INTO skills (id, name) VALUES (?, ?)", [("s1", "ML"), ("s2", "js")])
+        c.executemany("INSERT INTO content_skills (content_id, skill_id) VALUES (?, ?)", [("c1", "s1"), ("c2", "s2")])
+        c.commit()
+        store = KnowledgeGraphStore(self.repo, check_every=0)
+        g = store.get()
+        self.assertEqual([t for t, _ in g.related("ai")], ["ml"])
+        g.user_interests("u1", "ai")
+        self.assertIs(store.get(), g)
+
+        # a user holding both skills links ai and web through ml - js
+        c.executemany("INSERT INTO user_skills (user_id, skill_id, proficiency) VALUES (?, ?, ?)", [("u1", "s1", 1.0), ("u1", "s2", 1.0)])
+        c.commit()
+        c.close()
+        # the rebuild runs in the background, readers keep the old graph until it is swapped in
+        self.assertIs(store.get(), g)
+        store.wait()
+        new = store.get()
+        self.assertIsNot(new, g)
+        self.assertEqual(store.reloads, 2)
+        self.assertEqual(new.stats()["cached_users"], 0)
+        self.assertIn("web", new.user_interests("u1", "ai"))
+        self.assertEqual(self.repo.get_user_skills(["u1", "u2"]), {"u1": [("ML", 1.0), ("js", 1.0)]})
+
+    def test_popularity_updates_dont_rebuild(self):
+        c = database.get_conn()
+        c.execute("INSERT INTO content (id, title, category, difficulty, popularity) VALUES ('c1', 't', 'ai', 'beginner', 0.5)")
+        c.execute("INSERT INTO skills (id, name) VALUES ('s1', 'ML')")
+        c.execute("INSERT INTO content_skills (content_id, skill_id) VALUES ('c1', 's1')")
+        c.commit()
+        store = KnowledgeGraphStore(self.repo, check_every=0)
+        g = store.get()
+        ver = self.repo.get_content_version()
+        c.execute("UPDATE content SET popularity = 0.9 WHERE id = 'c1'")
+        c.commit()
+        self.assertGreater(self.repo.get_content_version(), ver)
+        self.assertIs(store.get(), g)
+        self.assertIsNone(store.builder)
+        
+        # a category edit does
+        c.execute("UPDATE content SET category = 'data' WHERE id = 'c1'")
+        c.commit()
+        c.close()
+        store.get()
+        store.wait()
+        self.assertEqual([t for t, _ in store.get().related("data")], ["ml"])
+
+class TestCoalescing(DBTestCase):
+    seed = TestBatchRecs.seed
+
+    def test_burst_computes_once_per_key(self):
+        self.seed()
+        orch = RecOrchestrator(async_writes=False)
+        calls = {}
+        real = orch.rank_user
+        def rank_user(uid, *a, **kw):
+            calls[uid] = calls.get(uid, 0) + 1
+            time.sleep(0.2) # keep the flight open while the burst piles up
+            return real(uid, *a, **kw)
+        orch.rank_user = rank_user
+
+        users = ["u1", "u2", "u3"]
+        start = threading.Barrier(100)
+        out = [None] * 100
+        def req(i):
+            start.wait()
+            out[i] = orch.get_recs(users[i % 3])
+        threads = [threading.Thread(target=req, args=(i,)) for i in range(100)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+
+        self.assertEqual(calls, {"u1": 1, "u2": 1, "u3": 1})
+        for i, r in enumerate(out):
+            self.assertEqual(r["data"], out[i % 3]["data"])
+        kinds = [r["cached"] for r in out]
+        self.assertEqual(kinds.count(False), 3)
+        self.assertEqual(kinds.count(False) + kinds.count("coalesced") + kinds.count(True), 100)
+        self.assertEqual(orch.flights.stats()["in_flight"], 0)
+
+        # feedback drops both the cache entry and any flight, the next miss recomputes
+        orch.add_feedback("u1", "c5", 5.0)
+        self.assertFalse(orch.get_recs("u1")["cached"])
+        self.assertEqual(calls["u1"], 2)
+
+    def test_waiter_never_gets_fewer_than_its_limit(self):
+        self.seed()
+        orch = RecOrchestrator(async_writes=False)
+        real = orch.rank_user
+        orch.rank_user = lambda *a, **kw: time.sleep(0.2) or real(*a, **kw)
+        big = orch.cache_top_n + 5
+        out = {}
+        t = threading.Thread(target=lambda: out.setdefault("leader", orch.get_recs("u1", limit=1)))
+        t.start()
+        time.sleep(0.05)
+        out["waiter"] = orch.get_recs("u1", limit=big)
+        t.join()
+        self.assertEqual(len(out["leader"]["data"]), 1)
+        # the leaders top-n is too short for the waiter, so it ranks its own instead of sharing
+        self.assertIs(out["waiter"]["cached"], False)
+        self.assertEqual(out["waiter"]["data"], RecOrchestrator(async_writes=False).compute_recs("u1", big)["data"])
+
+    def test_feedback_during_computation_not_cached(self):
+        self.seed()
+        orch = RecOrchestrator(async_writes=False)
+        started, release = threading.Event(), threading.Event()
+        real = orch.rank_user
+        hists = []
+        def rank_user(uid, hist, *a, **kw):
+            hists.append(list(hist))
+            if len(hists) == 1:
+                started.set()
+                release.wait(5)
+            return real(uid, hist, *a, **kw)
+        orch.rank_user = rank_user
+
+        t = threading.Thread(target=orch.get_recs, args=("u3",))
+        t.start()
+        started.wait(5)
+        orch.add_feedback("u3", "c1", 5.0) # lands while the leader is ranking from the empty history
+        release.set()
+        t.join()
+
+        res = orch.get_recs("u3")
+        self.assertIs(res["cached"], False)
+        self.assertEqual(hists, [[], ["c1"]])
+        self.assertNotIn("c1", [r["id"] for r in res["data"]])
+        self.assertEqual(orch.cache.stats()["stale_sets"], 1)
+
+class TestStaleWhileRevalidate(DBTestCase):
+    seed = TestBatchRecs.seed
+
+    def setUp(self):
+        super().setUp()
+        self.seed()
+        self.orch = RecOrchestrator(async_writes=False)
+        self.calls = []
+        real = self.orch.compute_recs
+        self.orch.compute_recs = lambda uid, limit=5, variant=None, gen=None: self.calls.append(uid) or real(uid, limit, variant, gen)
+
+    def age(self, uid, secs):
+        self.orch.cache.data[self.orch.cache_key(uid)][0] -= secs
+
+    def settle(self):
+        for _ in range(200):
+            if not self.orch.refreshing: return
+            time.sleep(0.01)
+        self.fail("refresh never finished")
+
+    def test_stale_served_then_refreshed(self):
+        first = self.orch.get_recs("u1")
+        self.age("u1", self.orch.cache_ttl + 1)
+        stale = self.orch.get_recs("u1")
+        self.assertEqual(stale["cached"], "stale")
+        self.assertEqual(stale["data"], first["data"])
+        self.settle()
+        self.assertEqual(self.calls, ["u1", "u1"])
+        self.assertEqual(self.orch.cache.lookup(self.orch.cache_key("u1"))[1], "fresh")
+        self.assertIs(self.orch.get_recs("u1")["cached"], True)
+
+    def test_past_grace_is_a_miss(self):
+        self.orch.get_recs("u1")
+        self.age("u1", self.orch.cache_ttl + self.orch.cache_grace)
+        self.assertIs(self.orch.get_recs("u1")["cached"], False)
+        self.assertEqual(self.calls, ["u1", "u1"])
+
+    def test_hot_user_refreshed_before_expiry(self):
+        self.orch.get_recs("u2")
+        for _ in range(self.orch.cache.hot_hits): self.orch.get_recs("u2")
+        self.age("u2", self.orch.cache_ttl * 0.9)
+        self.assertIs(self.orch.get_recs("u2")["cached"], True)
+        self.settle()
+        self.assertEqual(self.calls, ["u2", "u2"])
+        self.assertGreater(self.orch.telemetry.counter("rec_refresh_total", {"reason": "expiring"}), 0)
+
+    def test_feedback_drops_stale_entry(self):
+        self.orch.get_recs("u1")
+        self.age("u1", self.orch.cache_ttl + 1)
+        self.orch.add_feedback("u1", "c5", 5.0)
+        self.assertIs(self.orch.get_recs("u1")["cached"], False)
+
+    def test_refresh_overlapping_feedback_not_cached(self):
+        self.orch.get_recs("u3")
+        self.age("u3", self.orch.cache_ttl + 1)
+        started, release = threading.Event(), threading.Event()
+        real = self.orch.rank_user
+        def rank_user(uid, hist, *a, **kw):
+            started.set()
+            release.wait(5)
+            return real(uid, hist, *a, **kw)
+        self.orch.rank_user = rank_user
+        self.assertEqual(self.orch.get_recs("u3")["cached"], "stale")
+        started.wait(5)
+        self.orch.add_feedback("u3", "c1", 5.0) # while the refresh ranks from the old history
+        release.set()
+        self.orch.refresher.shutdown(wait=True)
+        self.orch.rank_user = real
+        self.assertEqual(self.orch.cache.lookup(self.orch.cache_key("u3")), (None, None))
+        self.assertNotIn("c1", [r["id"] for r in self.orch.get_recs("u3")["data"]])
+
+    def test_queued_refresh_cancelled_by_feedback(self):
+        self.orch.get_recs("u1")
+        key = self.orch.cache_key("u1")
+        gen = self.orch.cache.generation(key)
+        self.orch.add_feedback("u1", "c5", 5.0)
+        before = self.orch.telemetry.counter("rec_refresh_cancelled_total")
+        self.orch._refresh(key, 5, gen) # what a refresh queued before the feedback runs as
+        self.assertEqual(self.orch.telemetry.counter("rec_refresh_cancelled_total"), before + 1)
+        self.assertEqual(self.calls, ["u1"])
+
+class TestExperimentServing(DBTestCase):
+    seed = TestBatchRecs.seed
+
+    def setUp(self):
+        super().setUp()
+        self.seed()
+        self.orch = RecOrchestrator(async_writes=False)
+
+    def test_pipelines_built_once(self):
+        pipes = dict(self.orch.pipelines)
+        self.assertEqual(set(pipes), {"A", "B"})
+        for u in ("u1", "u2", "u3"):
+            self.orch.get_recs(u)
+        self.assertTrue(all(self.orch.pipelines[k] is p for k, p in pipes.items()))
+
+    def test_cache_key_has_variant(self):
+        v = self.orch.get_ab_group("u1")
+        self.orch.get_recs("u1")
+        self.assertIsNotNone(self.orch.cache.get((v, "u1")))
+        self.assertTrue(self.orch.get_recs("u1")["cached"])
+
+        # moving u1 to the other variant must not hand it the cached list of the old one
+        other = "B" if v == "A" else "A"
+        self.orch.experiment = Experiment("t", "t", [{"name": other, "share": 1.0, "weights": {"popular": 1.0}}])
+        # telemetry is process wide, compare against what earlier tests already counted
+        before = self.orch.experiment_stats()["variants"][other]
+        res = self.orch.get_recs("u1")
+        self.assertEqual((res["cached"], res["ab_group"]), (False, other))
+
+        st = self.orch.experiment_stats()["variants"][other]
+        self.assertEqual((st["requests"] - before["requests"], st["answered"]["miss"] - before["answered"]["miss"]), (1, 1))
+
+    def test_unknown_signal_rejected(self):
+        with self.assertRaises(ValueError):
+            self.orch.build_scorer(Experiment("t", "t", [{"name": "x", "share": 1.0, "weights": {"nope": 1.0}}]).variants[0])
+
+class TestServingArtifact(DBTestCase):
+    seed = TestBatchRecs.seed
+
+    def build(self):
+        self.seed()
+        c = database.get_conn()
+        c.executemany("INSERT INTO skills (id, name) VALUES (?, ?)", [("s1", "ml"), ("s2", "js")])
+        c.executemany("INSERT INTO content_skills (content_id, skill_id) VALUES (?, ?)", [("c0", "s1"), ("c1", "s2")])
+        c.commit()
+        c.close()
+        path = os.path.join(self.tmp, "serving")
+        ServingArtifact.build(self.repo).save(path)
+        return path, ServingArtifact.load(path)
+
+    def test_codes_never_wrap(self):
+        vals = [f"cat{n}" for n in range(40_000)]
+        table, codes = _codes(vals + ["cat39999"])
+        self.assertEqual([str(table[c]) for c in codes[-2:]], ["cat39999", "cat39999"])
+        self.assertEqual(codes.dtype, np.uint16)
+        self.assertEqual(_codes([f"c{n}" for n in range(70_000)])[1].dtype, np.int32)
+
+    def test_matches_db(self):
+        path, art = self.build()
+        self.assertIsInstance(art.hist_items, np.memmap)
+        for u in ["u1", "u2", "u3", "nobody"]:
+            self.assertEqual(art.user_hist(u), self.repo.get_user_hist(u))
+        items = [f"c{n}" for n in range(10)] + ["missing"]
+        self.assertEqual(art.item_neighbors(items), self.repo.get_item_neighbors(items))
+        self.assertEqual(art.item_record(art.item_row("c3")), self.repo.get_all_content()["c3"])
+        self.assertEqual(art.knowledge_graph().related("ai"), KnowledgeGraphStore(self.repo).get().related("ai"))
+
+        plain = RecOrchestrator(async_writes=False)
+        mapped = RecOrchestrator(async_writes=False)
+        mapped.artifact = mapped.catalog.artifact = mapped.kg.artifact = art
+        for u in ["u1", "u2", "u3"]:
+            self.assertEqual(mapped.get_recs(u, limit=4)["data"], plain.get_recs(u, limit=4)["data"])
+        self.assertEqual(list(mapped.catalog.get().popular[:3]), list(plain.catalog.get().popular[:3]))
+        self.assertIs(mapped.kg.get().indices, art.kg_indices)
+
+    def test_newer_rows_come_from_db(self):
+        path, art = self.build()
+        orch = RecOrchestrator(async_writes=False)
+        orch.artifact = orch.catalog.artifact = art
+        orch.add_feedback("u3", "c2", 5.0)
+        self.assertEqual(orch.user_hist("u3"), ["c2"])
+        self.assertEqual(orch.user_hists(["u1", "u3", "nobody"]), {"u1": ["c1", "c0"], "u3": ["c2"]})
+        self.assertIsInstance(orch.catalog.get().content, ContentView)
+        
+        # popularity edits are overlaid, the snapshot stays on the mmapped arrays
+        c = database.get_conn()
+        c.execute("UPDATE content SET popularity = 0.99 WHERE id = 'c0'")
+        c.commit()
+        orch.catalog.invalidate()
+        snap = orch.catalog.get()
+        self.assertIsInstance(snap.content, ContentView)
+        self.assertEqual(snap.popular[0], "c0")
+        self.assertEqual(snap.content["c0"]["popularity"], 0.99)
+        self.assertEqual(art.item_record(art.item_row("c0"))["popularity"], 0.0) # the shared arrays are untouched
+        plain = RecOrchestrator(async_writes=False)
+        self.assertEqual(list(snap.popular), list(plain.catalog.get().popular))
+        for u in ["u1", "u2"]:
+            self.assertEqual(orch.get_recs(u, limit=4)["data"], plain.get_recs(u, limit=4)["data"])
+        
+        # anything else in the catalog changing -> falls back to the dict catalog
+        c.execute("UPDATE content SET title = 'new' WHERE id = 'c1'")
+        c.commit()
+        c.close()
+        orch.catalog.invalidate()
+        self.assertNotIsInstance(orch.catalog.get().content, ContentView)
+        self.assertEqual(orch.catalog.get().content["c1"]["title"], "new")
+
+    def test_rejects_other_format(self):
+        path, _ = self.build()
+        with open(os.path.join(path, "meta.json")) as f: meta = json.load(f)
+        meta["format"] = 0
+        with open(os.path.join(path, "meta.json"), "w") as f: json.dump(meta, f)
+        with self.assertRaises(ValueError):
+            ServingArtifact.load(path)
+
+class TestSyntheticData(DBTestCase):
+    def test_reproducible(self):
+        a = gen_synthetic.make_dataset(users=50, items=30, interactions=400, seed=7)
+        b = gen_synthetic.make_dataset(users=50, items=30, interactions=400, seed=7)
+        c = gen_synthetic.make_dataset(users=50, items=30, interactions=400, seed=8)
+        rows = list(a.pop("interactions"))
+        self.assertEqual(rows, list(b.pop("interactions")))
+        self.assertEqual(a, b)
+        self.assertNotEqual(rows, list(c["interactions"]))
+
+    def test_load(self):
+        gen_synthetic.generate(users=300, items=100, interactions=3000, seed=1)
+        with database.pooled_conn() as c:
+            self.assertEqual(c.execute("SELECT COUNT(*) FROM interactions").fetchone()[0], 3000)
+            self.assertEqual(c.execute("SELECT COUNT(*) FROM (SELECT DISTINCT user_id, content_id FROM interactions)").fetchone()[0], 3000)
+            counts = [r[0] for r in c.execute("SELECT COUNT(*) n FROM interactions GROUP BY content_id ORDER BY n DESC")]
+            self.assertGreater(c.execute("SELECT COUNT(*) FROM content_skills").fetchone()[0], 0)
+            # power law: the top 10% of items carry far more than 10% of the traffic
+            self.assertGreater(sum(counts[:10]), 0.3 * 3000)
+            # indexes dropped for the load are back
+            self.assertIn("idx_interactions_user", [r[0] for r in c.execute("SELECT name FROM sqlite_master WHERE type='index'")])
+        self.assertEqual(len(self.repo.get_all_user_ids()), 300)
+        self.assertTrue(self.repo.get_item_neighbors(["c1", "c2", "c3"]))
+
+    def test_fixture_is_reused(self):
+        size = dict(users=40, items=20, interactions=200)
+        with gen_synthetic.fixture(size, cache_dir=self.tmp) as path:
+            self.assertEqual(database.DB_FILE, path)
+            first = os.path.getmtime(path)
+        self.assertEqual(database.DB_FILE, os.path.join(self.tmp, "test.db"))
+        with gen_synthetic.fixture(size, cache_dir=self.tmp) as again:
+            self.assertEqual((again, os.path.getmtime(again)), (path, first))
+            self.assertEqual(self.repo.get_max_interaction_id(), 200)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,586 @@
+import unittest
+import os
+import random
+import numpy as np
+from engine.candidate_gen import CandidateGenerator
+import time
+from engine.similarity import SimilarityCalculator
+from engine.lsh import MinHashLSH
+from engine.scorer import RecommendationScorer
+from engine.cache import RecCache, SingleFlight
+from engine.telemetry import Telemetry, Histogram
+from engine.evaluator import RecommendationEvaluator
+from engine.als import ALSModel, build_csr, train_als
+from engine.knowledge_graph import KnowledgeGraph, closure
+from engine.experiments import Experiment, DEFAULT_EXPERIMENT, BUCKETS
+import json
+import sys
+import subprocess
+import tempfile
+from scripts.load_test import zipf_sampler, percentile, LoadTest
+from scripts.bench_scaling import compare, measure
+import threading
+
+class TestCandidateGen(unittest.TestCase):
+    def setUp(self):
+        self.hist = {
+            "u1": ["i1", "i2", "i3"],
+            "u2": ["i2", "i3", "i4"],
+            "u3": ["i3", "i5"],
+            "u4": ["i6"]
+        }
+        self.tags = {"i1": ["ai"], "i2": ["ai"], "i3": ["data"], "i4": ["data"], "i5": ["web"], "i6": ["web"]}
+        self.gen = CandidateGenerator(self.hist, self.tags, ["i6", "i5", "i4"])
+
+    def test_collab_weighted_by_overlap(self):
+        # u2 shares 2 items with u1, u3 only 1, so i4 ranks above i5
+        self.assertEqual(self.gen.collaborative_candidates("u1"), ["i4", "i5"])
+
+    def test_collab_skips_users_without_overlap(self):
+        self.assertNotIn("i6", self.gen.collaborative_candidates("u1"))
+        self.assertEqual(self.gen.collaborative_candidates("ghost"), [])
+
+    def test_add_interaction_updates_index(self):
+        self.gen.add_interaction("u4", "i1")
+        self.gen.add_interaction("u4", "i1") # dupes are ignored
+        self.assertEqual(self.hist["u4"], ["i6", "i1"])
+        self.assertIn("i6", self.gen.collaborative_candidates("u1"))
+
+    def test_collab_caps_hub_fan_out(self):
+        # i0 is a hub every user touched, only max_item_users of its fans and max_neighbors users get scanned
+        hist = {f"u{n}": ["i0", f"x{n}"] for n in range(50)}
+        hist["me"] = ["i0"]
+        gen = CandidateGenerator(hist, {}, [], max_item_users=10, max_neighbors=3)
+        self.assertEqual(len(gen.collaborative_candidates("me")), 3)
+        self.assertEqual(len(CandidateGenerator(hist, {}, []).collaborative_candidates("me", 100)), 50)
+
+    def test_neighbor_candidates(self):
+        nbrs = {"i1": [("i4", 3.0), ("i2", 1.0)], "i2": [("i5", 1.0), ("i4", 1.0)]}
+        gen = CandidateGenerator(self.hist, self.tags, [], item_neighbors=nbrs)
+        self.assertEqual(gen.neighbor_candidates("u1"), ["i4", "i5"])
+        self.assertIn("i4", gen.hybrid_candidates("u1", limit=4))
+
+    def test_content_ranked_by_shared_tags(self):
+        tags = {"i1": ["ai", "data"], "i2": ["web"], "i3": ["data"], "i4": ["ai", "data"], "i5": ["ai"]}
+        gen = CandidateGenerator({"u1": ["i1"]}, tags, [])
+        self.assertEqual(gen.content_based_candidates("u1"), ["i4", "i5", "i3"])
+        self.assertEqual(gen.content_based_candidates("u1", limit=1), ["i4"])
+        self.assertEqual(gen.tag_items["data"], ["i1", "i3", "i4"])
+
+    def test_content_skips_seen_items(self):
+        cands = self.gen.content_based_candidates("u1")
+        self.assertEqual(cands, ["i4"])
+
+class TestCandidateSources(unittest.TestCase):
+    def setUp(self):
+        self.gen = CandidateGenerator({"u1": ["x"]}, {}, ["p1", "p2", "a1", "p3"])
+        self.gen.sources = {}
+
+    def add(self, name, items, **kw):
+        self.gen.register_source(name, lambda uid, n: items[:n], **kw)
+
+    def test_weighted_merge(self):
+        self.add("a", ["a1", "a2", "a3", "a4"], weight=2.0, quota=1.0)
+        self.add("b", ["b1", "b2", "b3"], weight=1.0, quota=1.0)
+        self.assertEqual(self.gen.hybrid_candidates("u1", limit=6), ["a1", "b1", "a2", "a3", "b2", "a4"])
+
+    def test_round_robin_dedupes_and_pads(self):
+        self.gen.merge = "round_robin"
+        self.add("a", ["a1", "a2"], weight=5.0, quota=1.0)
+        self.add("b", ["a1", "b1"], quota=1.0)
+        self.add("popular", ["p1", "a2", "p2"], weight=0.0, quota=1.0)
+        self.assertEqual(self.gen.hybrid_candidates("u1", limit=5), ["a1", "b1", "a2", "p1", "p2"])
+        self.assertEqual({k: v["used"] for k, v in self.gen.last_stats.items()}, {"a": 2, "b": 1, "popular": 2})
+
+    def test_quota_caps_a_source(self):
+        self.add("a", [f"a{n}" for n in range(10)], quota=0.3)
+        self.assertEqual(self.gen.hybrid_candidates("u1", limit=10), ["a0", "a1", "a2"])
+
+    def test_slow_and_broken_sources_are_skipped(self):
+        def slow(uid, n):
+            time.sleep(0.3)
+            return ["s1"]
+        def broken(uid, n):
+            raise RuntimeError("boom")
+        self.gen.register_source("slow", slow, timeout=0.05)
+        self.gen.register_source("broken", broken)
+        self.add("ok", ["o1", "o2"])
+        t = Telemetry()
+        self.gen.telemetry = t
+        st = time.perf_counter()
+        self.assertEqual(self.gen.hybrid_candidates("u1", limit=4), ["o1", "o2"])
+        self.assertLess(time.perf_counter() - st, 0.25)
+        self.assertEqual({k: v["status"] for k, v in self.gen.last_stats.items()}, {"slow": "timeout", "broken": "error", "ok": "ok"})
+        self.assertEqual(t.counts("candidate_source_failures_total", by=("source",)), {"broken": 1, "slow": 1})
+        self.assertEqual(t.counter("candidate_source_items_total", {"source": "ok", "kind": "used"}), 2)
+
+    def test_busy_pool_runs_sources_inline(self):
+        # every worker held by other requests: queue wait must not count against the deadlines, so the
+        # sources run inline and still answer instead of all timing out to popularity
+        import engine.candidate_gen as cg
+        pool, block = cg.source_pool(), threading.Event()
+        for _ in range(cg._pool_size):
+            self.assertTrue(cg._reserve(1))
+            pool.submit(block.wait).add_done_callback(cg._release)
+        self.addCleanup(block.set)
+        self.add("a", ["a1", "a2"], timeout=0.01)
+        self.add("b", ["b1"], timeout=0.01)
+        t = Telemetry()
+        self.gen.telemetry = t
+        self.assertEqual(self.gen.hybrid_candidates("u1", limit=3), ["a1", "b1", "a2"])
+        self.assertEqual({v["status"] for v in self.gen.last_stats.values()}, {"ok"})
+        self.assertEqual(t.counter("candidate_sources_inline_total"), 1)
+        
+        block.set()
+        deadline = time.time() + 2
+        while cg._pool_busy and time.time() < deadline: time.sleep(0.01)
+        self.assertEqual(cg._pool_busy, 0)
+        self.gen.hybrid_candidates("u1", limit=3)
+        self.assertEqual(t.counter("candidate_sources_inline_total"), 1)
+
+    def test_sequential_matches_parallel(self):
+        hist = {"u1": ["i1", "i2"], "u2": ["i1", "i3", "i4"], "u3": ["i2", "i5"]}
+        tags = {"i1": ["ai"], "i3": ["ai"], "i5": ["web"], "i6": ["ai"]}
+        par = CandidateGenerator(hist, tags, ["i9", "i8"]).hybrid_candidates("u1", limit=6)
+        seq = CandidateGenerator(hist, tags, ["i9", "i8"], parallel=False).hybrid_candidates("u1", limit=6)
+        self.assertEqual(par, seq)
+        self.assertEqual(len(par), len(set(par)))
+
+class TestBatchSimilarity(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(3)
+        self.sim = SimilarityCalculator()
+        self.vecs = {f"u{u}": {f"i{rng.randrange(30)}": rng.randint(1, 5) for _ in range(rng.randint(0, 8))} for u in range(40)}
+        self.mat = self.sim.build_matrix(self.vecs)
+        self.query = {"i1": 4.0, "i2": 1.0, "i3": 5.0, "i7": 2.0, "i99": 3.0}
+
+    def test_one_vs_many_matches_scalar(self):
+        cos = self.sim.cosine_many(self.query, self.mat)
+        pear = self.sim.pearson_many(self.query, self.mat)
+        jac = self.sim.jaccard_many(set(self.query), self.mat)
+        for n, k in enumerate(self.mat.keys):
+            self.assertAlmostEqual(cos[n], self.sim.cosine_similarity(self.query, self.vecs[k]))
+            self.assertAlmostEqual(pear[n], self.sim.pearson_correlation(self.query, self.vecs[k]))
+            self.assertAlmostEqual(jac[n], self.sim.jaccard_similarity(set(self.query), set(self.vecs[k])))
+
+    def test_pairwise_blocks_match_scalar(self):
+        scalar = {"cosine": self.sim.cosine_similarity, "pearson": self.sim.pearson_correlation,
+                  "jaccard": lambda a, b: self.sim.jaccard_similarity(set(a), set(b))}
+        for metric, fn in scalar.items():
+            for start, block in self.sim.pairwise(self.mat, metric, block=7):
+                for j, row in enumerate(block):
+                    a = self.vecs[self.mat.keys[start + j]]
+                    for n, k in enumerate(self.mat.keys):
+                        self.assertAlmostEqual(row[n], fn(a, self.vecs[k]))
+
+class TestMinHashLSH(unittest.TestCase):
+    def setUp(self):
+        self.lsh = MinHashLSH(bands=20, rows=3)
+        self.sets = {
+            "a": set(range(0, 40)),
+            "b": set(range(2, 42)),  # near duplicate of a
+            "c": set(range(100, 140))
+        }
+        for k, v in self.sets.items(): self.lsh.add(k, v)
+
+    def test_finds_near_duplicates(self):
+        res = self.lsh.query(self.sets["a"], k=5, exclude="a")
+        self.assertEqual([k for k, _ in res], ["b"])
+        est = res[0][1]
+        exact = SimilarityCalculator().jaccard_similarity(self.sets["a"], self.sets["b"])
+        self.assertLess(abs(est - exact), 0.2)
+
+    def test_remove_and_readd(self):
+        self.lsh.remove("b")
+        self.assertEqual(self.lsh.query(self.sets["a"], exclude="a"), [])
+        self.lsh.add("b", self.sets["b"])
+        self.assertEqual(len(self.lsh), 3)
+        self.assertEqual(self.lsh.query(self.sets["a"], exclude="a")[0][0], "b")
+
+    def test_empty_sets_never_match(self):
+        self.lsh.add("e1", set())
+        self.lsh.add("e2", set())
+        self.assertEqual(len(self.lsh), 3)
+        self.assertEqual(self.lsh.query(set()), [])
+        # re-adding a key as empty drops its old entry
+        self.lsh.add("b", set())
+        self.assertEqual(self.lsh.query(self.sets["a"], exclude="a"), [])
+
+class TestBatchScorer(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(11)
+        self.cands = [f"i{n}" for n in range(60)]
+        self.pop = {i: rng.choice([0.2, 0.5, 0.9]) for i in self.cands}
+        self.scorer = RecommendationScorer()
+        # one per-item signal and one batch signal, mixed
+        self.scorer.add_scorer("even", lambda u, i, ctx: 1.0 if int(i[1:]) % 2 == 0 else 0.0, 1.0)
+        self.scorer.add_batch_scorer("popular", lambda u, iids, ctx: np.array([self.pop[i] for i in iids]), 0.5)
+
+    def test_rank_batch_matches_heap(self):
+        for limit in (1, 5, 60, 100):
+            heap = self.scorer.rank_candidates("u1", self.cands, limit=limit)
+            batch = self.scorer.rank_batch("u1", self.cands, limit=limit)
+            self.assertEqual([r["item"] for r in batch], [r["item"] for r in heap])
+            self.assertEqual([r["reason"] for r in batch], [r["reason"] for r in heap])
+            for b, h in zip(batch, heap):
+                self.assertAlmostEqual(b["score"], h["score"])
+
+    def test_rank_batch_edge_cases(self):
+        self.assertEqual(self.scorer.rank_batch("u1", [], limit=5), [])
+        empty = RecommendationScorer().rank_batch("u1", ["b", "a"], limit=1)
+        self.assertEqual(empty, [{"item": "a", "score": 0.0, "reason": "no scorers found"}])
+
+class TestRecCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = RecCache(max_entries=2, ttl=100)
+        cache.set("a", [1]); cache.set("b", [2])
+        cache.get("a")  # a is now most recent
+        cache.set("c", [3])
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.get("a"), [1])
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_ttl_expiry(self):
+        cache = RecCache(ttl=10)
+        cache.set("a", [1], now=100)
+        self.assertEqual(cache.get("a", now=105), [1])
+        self.assertIsNone(cache.get("a", now=111))
+        st = cache.stats()
+        self.assertEqual((st["hits"], st["misses"], st["expirations"], st["size"]), (1, 1, 1, 0))
+
+    def test_set_dropped_after_delete(self):
+        cache = RecCache()
+        gen = cache.generation("a")
+        cache.delete("a") # invalidated while the value was being computed
+        self.assertFalse(cache.set("a", [1], gen=gen))
+        self.assertIsNone(cache.get("a"))
+        self.assertTrue(cache.set("a", [2], gen=cache.generation("a")))
+        self.assertEqual((cache.get("a"), cache.stats()["stale_sets"]), ([2], 1))
+
+    def test_stale_window_and_refresh_ahead(self):
+        cache = RecCache(ttl=10, grace=20, refresh_ahead=0.8, hot_hits=2)
+        cache.set("a", [1], now=100)
+        self.assertEqual(cache.lookup("a", now=101), ([1], "fresh"))
+        self.assertEqual(cache.lookup("a", now=109), ([1], "expiring")) # 2nd hit, past 80% of ttl
+        self.assertEqual(cache.lookup("a", now=115), ([1], "stale"))
+        self.assertIsNone(cache.get("a", now=115)) # get() never hands out stale values
+        self.assertIn("a", cache)
+        self.assertEqual(cache.lookup("a", now=130), (None, None))
+        self.assertNotIn("a", cache)
+        st = cache.stats()
+        self.assertEqual((st["hits"], st["stale_hits"], st["misses"], st["expirations"]), (2, 1, 2, 1))
+        # cold entries are never reported as expiring
+        cache.set("b", [2], now=100)
+        self.assertEqual(cache.lookup("b", now=109), ([2], "fresh"))
+
+    def test_byte_cap(self):
+        cache = RecCache(max_bytes=2000)
+        for n in range(50):
+            cache.set(n, [{"id": f"c{n}", "title": "x" * 50}])
+        self.assertLessEqual(cache.stats()["bytes"], 2000)
+        self.assertIn(49, cache)
+        self.assertNotIn(0, cache)
+
+    def test_concurrent_access(self):
+        cache = RecCache(max_entries=50)
+        def worker(n):
+            for i in range(500):
+                cache.set(f"{n}-{i % 80}", [i])
+                cache.get(f"{n}-{(i * 7) % 80}")
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        st = cache.stats()
+        self.assertEqual(st["size"], 50)
+        self.assertEqual(st["hits"] + st["misses"], 8 * 500)
+        self.assertEqual(st["bytes"], sum(e[1] for e in cache.data.values()))
+
+class TestSingleFlight(unittest.TestCase):
+    def burst(self, sf, n, fn, key="k", timeout=None):
+        start = threading.Barrier(n)
+        out = [None] * n
+        def run(i):
+            start.wait()
+            try:
+                out[i] = sf.do(key, fn, timeout)
+            except Exception as e:
+                out[i] = e
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        return out
+
+    def test_one_call_per_key(self):
+        sf, calls = SingleFlight(), []
+        def fn():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"v": 1}
+        out = self.burst(sf, 50, fn)
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(r is out[0][0] for r, _ in out))
+        self.assertEqual(sum(shared for _, shared in out), 49)
+        self.assertEqual(sf.stats(), {"in_flight": 0, "leaders": 1, "shared": 49, "timeouts": 0})
+        # finished flights arent remembered
+        self.assertEqual(sf.do("k", lambda: 2), (2, False))
+
+    def test_error_is_shared(self):
+        sf = SingleFlight()
+        def fn():
+            time.sleep(0.1)
+            raise ValueError("boom")
+        out = self.burst(sf, 10, fn)
+        self.assertTrue(all(isinstance(e, ValueError) for e in out))
+        self.assertEqual(sf.stats()["leaders"], 1)
+
+    def test_waiter_times_out_and_computes_itself(self):
+        sf = SingleFlight()
+        slow = threading.Event()
+        t = threading.Thread(target=sf.do, args=("k", lambda: slow.wait(1) or "slow"))
+        t.start()
+        time.sleep(0.02)
+        self.assertEqual(sf.do("k", lambda: "own", timeout=0.05), ("own", False))
+        sf.forget("k")
+        self.assertEqual(sf.do("k", lambda: "fresh"), ("fresh", False))
+        slow.set()
+        t.join()
+        self.assertEqual(sf.stats()["timeouts"], 1)
+
+class TestExperiment(unittest.TestCase):
+    def test_assignment_stable_across_processes(self):
+        exp = Experiment.from_dict(DEFAULT_EXPERIMENT)
+        uids = [f"u{n}" for n in range(200)]
+        code = ("import json, sys; from engine.experiments import Experiment, DEFAULT_EXPERIMENT; "
+                "e = Experiment.from_dict(DEFAULT_EXPERIMENT); print(json.dumps([e.assign(u) for u in sys.argv[1:]]))")
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        # a different hash seed is what made hash(uid) % 2 disagree between workers
+        out = subprocess.run([sys.executable, "-c", code, *uids], cwd=root, capture_output=True, text=True, check=True,
+                             env=dict(os.environ, PYTHONHASHSEED="12345", PYTHONPATH=root)).stdout
+        self.assertEqual(json.loads(out), [exp.assign(u) for u in uids])
+
+    def test_shares_respected(self):
+        exp = Experiment("t", "s", [{"name": "ctl", "share": 0.9}, {"name": "new", "share": 0.1}])
+        self.assertEqual(exp.bounds, [9000, BUCKETS])
+        got = [exp.assign(f"user{n}") for n in range(20000)]
+        self.assertAlmostEqual(got.count("new") / len(got), 0.1, delta=0.01)
+        # new salt, new split
+        other = Experiment("t", "s2", exp.variants)
+        self.assertNotEqual(got[:200], [other.assign(f"user{n}") for n in range(200)])
+
+    def test_invalid_config(self):
+        with self.assertRaises(ValueError): Experiment("t", "s", [{"name": "a", "share": 0.5}, {"name": "b", "share": 0.4}])
+        with self.assertRaises(ValueError): Experiment("t", "s", [{"name": "a", "share": 0.5}, {"name": "a", "share": 0.5}])
+        with self.assertRaises(ValueError): Experiment("t", "s", [])
+
+    def test_load_from_file(self):
+        self.assertEqual(Experiment.load("/nonexistent.json").name, DEFAULT_EXPERIMENT["name"])
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "experiment.json")
+            with open(path, "w") as f: json.dump({"name": "x", "variants": [{"name": "only", "share": 1.0, "weights": {"popular": 1.0}}]}, f)
+            exp = Experiment.load(path)
+        self.assertEqual((exp.salt, exp.assign("u1")), ("x", "only"))
+
+class TestTelemetry(unittest.TestCase):
+    def test_histogram_quantiles(self):
+        h = Histogram(buckets=(10, 20, 50, 100))
+        for v in range(1, 101): h.observe(v)
+        self.assertEqual(h.count, 100)
+        self.assertAlmostEqual(h.quantile(0.5), 50.0)
+        self.assertAlmostEqual(h.quantile(0.95), 95.0)
+        self.assertEqual(h.summary()["max"], 100)
+
+    def test_concurrent_counters(self):
+        t = Telemetry()
+        def worker():
+            for _ in range(1000):
+                t.inc("reqs", {"route": "/x"})
+                t.observe("lat", 1.0, {"route": "/x"})
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for th in threads: th.start()
+        for th in threads: th.join()
+        self.assertEqual(t.counter("reqs", {"route": "/x"}), 8000)
+        self.assertEqual(t.summaries("lat", by=("route",))["/x"]["count"], 8000)
+        self.assertIn('reqs{route="/x"} 8000', t.to_prometheus())
+
+class TestALS(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # two groups of users with disjoint tastes, each user has seen 8 of their group's 20 items
+        rng = np.random.default_rng(0)
+        cls.seen = {}
+        rows, cols = [], []
+        for u in range(200):
+            picks = rng.choice(20, 8, replace=False) + 20 * (u % 2)
+            cls.seen[f"u{u}"] = [f"i{i}" for i in picks]
+            rows += [u] * 8
+            cols += picks.tolist()
+        indptr, indices, data = build_csr(rows, cols, np.ones(len(rows)), (200, 40))
+        X, Y = train_als(indptr, indices, data, 40, factors=8, reg=0.1, iters=10)
+        cls.model = ALSModel(X, Y, np.array(list(cls.seen)), np.array([f"i{i}" for i in range(40)]), reg=0.1)
+
+    def group(self, items):
+        return {int(i[1:]) // 20 for i in items}
+
+    def test_recommends_own_group(self):
+        recs = self.model.recommend("u0", 5, exclude=self.seen["u0"])
+        self.assertEqual(len(recs), 5)
+        self.assertEqual(self.group(i for i, _ in recs), {0})
+        self.assertFalse({i for i, _ in recs} & set(self.seen["u0"]))
+        self.assertEqual([s for _, s in recs], sorted((s for _, s in recs), reverse=True))
+
+    def test_fold_in_unknown_user(self):
+        hist = ["i21", "i22", "i23", "i24"]
+        recs = self.model.recommend("new", 5, exclude=hist, hist=hist)
+        self.assertEqual(self.group(i for i, _ in recs), {1})
+        self.assertEqual(self.model.recommend("new", 5), [])
+
+    def test_save_load_mmap(self):
+        path = os.path.join(tempfile.mkdtemp(), "als")
+        self.model.save(path)
+        loaded = ALSModel.load(path)
+        self.assertIsInstance(loaded.item_factors, np.memmap)
+        self.assertEqual(loaded.recommend("u1", 5, exclude=self.seen["u1"]), self.model.recommend("u1", 5, exclude=self.seen["u1"]))
+
+    def test_candidate_source(self):
+        gen = CandidateGenerator(dict(self.seen), {}, ["i39"], als=self.model)
+        cands = gen.hybrid_candidates("u0", limit=10)
+        self.assertEqual(self.group(gen.als_candidates("u0", 5)), {0})
+        self.assertTrue(set(gen.als_candidates("u0", 5)) <= set(cands))
+
+class TestKnowledgeGraph(unittest.TestCase):
+    def setUp(self):
+        # chain a - b - c - d through shared content items, no categories
+        rows = [("c1", None, "a"), ("c1", None, "b"), ("c2", None, "b"), ("c2", None, "c"), ("c3", None, "c"), ("c3", None, "d")]
+        self.g = KnowledgeGraph.build(rows, [], decay=0.5, max_hops=3, min_weight=0.05)
+
+    def test_empty_tables_fall_back_to_static_relations(self):
+        # no skills / content_skills rows (the shipped db): the old hard-coded expansions still apply
+        g = KnowledgeGraph.build([], [], version=(1, 1))
+        self.assertEqual(g.version, (1, 1))
+        self.assertEqual([t for t, _ in g.related("AI")], ["ml", "data", "vision"])
+        self.assertEqual(g.expand({"ai": 1.0, "rust": 1.0}), {"ai": 1.0, "ml": 1.0, "data": 1.0, "vision": 1.0, "rust": 1.0})
+        self.assertEqual(g.related("ml"), [])
+        # any real edge replaces the fallback entirely
+        self.assertNotIn("ml", dict(self.g.related("a")))
+        self.assertEqual(self.g.related("ai"), [])
+
+    def test_weights_decay_per_hop(self):
+        rel = dict(self.g.related("A"))
+        self.assertAlmostEqual(rel["b"], 1 / 2 ** 0.5, places=6) # C=1, N(a)=1, N(b)=2
+        self.assertAlmostEqual(rel["c"], rel["b"] * 0.5 * 0.5, places=6)
+        self.assertAlmostEqual(rel["d"], rel["b"] * 0.5 * rel["b"] * 0.25, places=6)
+        self.assertNotIn("a", rel)
+        self.assertEqual([t for t, _ in self.g.related("a")], ["b", "c", "d"])
+        short = KnowledgeGraph.build([("c1", None, "a"), ("c1", None, "b"), ("c2", None, "b"), ("c2", None, "c")], [], max_hops=1)
+        self.assertEqual([t for t, _ in short.related("a")], ["b"])
+
+    def test_closure_matches_brute_force(self):
+        rng = np.random.default_rng(3)
+        n = 40
+        src, dst = rng.integers(0, n, 120), rng.integers(0, n, 120)
+        keep = src != dst
+        src, dst = src[keep], dst[keep]
+        w = rng.uniform(0.1, 1.0, src.size)
+        adj = {}
+        for a, b, x in zip(src.tolist(), dst.tolist(), w.tolist()): adj.setdefault(a, {})[b] = max(adj.get(a, {}).get(b, 0), x)
+        rows = [(a, b, x) for a, nb in adj.items() for b, x in nb.items()]
+        order = sorted(range(len(rows)), key=lambda k: (rows[k][0], -rows[k][2]))
+        indptr = np.zeros(n + 1, np.int64)
+        np.cumsum(np.bincount([r[0] for r in rows], minlength=n), out=indptr[1:])
+        indices = np.array([rows[k][1] for k in order], np.int32)
+        weights = np.array([rows[k][2] for k in order], np.float32)
+        ip, ix, iw = closure(indptr, indices, weights, decay=0.7, max_hops=3, top_k=n, min_weight=0.01, block=7)
+
+        def best(s):
+            res = {}
+            def walk(node, val, hops):
+                for t, x in adj.get(node, {}).items():
+                    v = val * x * (0.7 if hops else 1.0)
+                    if t != s and v >= 0.01:
+                        res[t] = max(res.get(t, 0), v)
+                        if hops < 2: walk(t, v, hops + 1)
+            walk(s, 1.0, 0)
+            return res
+        for s in range(n):
+            got = dict(zip(ix[ip[s]:ip[s + 1]].tolist(), iw[ip[s]:ip[s + 1]].tolist()))
+            exp = best(s)
+            self.assertEqual(set(got), set(exp), s)
+            for t in exp: self.assertAlmostEqual(got[t], exp[t], places=5)
+
+    def test_user_interests_cached_until_they_change(self):
+        first = self.g.user_interests("u1", "a")
+        self.assertEqual(first["a"], 1.0)
+        self.assertIn("c", first)
+        self.assertIs(self.g.user_interests("u1", "a"), first)
+        self.assertEqual((self.g.hits, self.g.misses), (1, 1))
+        # new interests or skills -> recomputed
+        self.assertAlmostEqual(self.g.user_interests("u1", "d")["c"], 1 / 2 ** 0.5, places=6)
+        with_skill = self.g.user_interests("u1", "d", [("b", 0.5)])
+        self.assertEqual(with_skill["b"], 0.5)
+        self.assertAlmostEqual(with_skill["a"], 0.5 / 2 ** 0.5, places=6)
+        self.assertEqual(self.g.misses, 3)
+        self.assertEqual(self.g.user_interests("u2", ""), {})
+
+class TestBatchEvaluator(unittest.TestCase):
+    def setUp(self):
+        self.ev = RecommendationEvaluator()
+        rng = random.Random(5)
+        items = [f"i{n}" for n in range(40)]
+        # small catalog so there are plenty of hits, repeats inside a list and empty lists
+        self.recs = {f"u{n}": [rng.choice(items) for _ in range(rng.randint(0, 12))] for n in range(300)}
+        self.truth = {f"u{n}": [rng.choice(items) for _ in range(rng.randint(0, 6))] for n in range(0, 300, 2)}
+
+    def test_per_user_matches_scalar_methods(self):
+        uids = [u for u in self.recs if self.truth.get(u)]
+        got = self.ev.per_user_batch([self.recs[u] for u in uids], [self.truth[u] for u in uids], k=5)
+        for name, fn in [("p_at_k", self.ev.precision_at_k), ("r_at_k", self.ev.recall_at_k), ("ndcg", self.ev.ndcg_at_k),
+                         ("map", self.ev.map_at_k), ("mrr", self.ev.mrr_at_k)]:
+            for n, u in enumerate(uids):
+                self.assertAlmostEqual(got[name][n], fn(self.recs[u], self.truth[u], 5), places=12, msg=f"{name} {u}")
+
+    def test_batch_matches_evaluate_all(self):
+        want = self.ev.evaluate_all(self.recs, self.truth, k=10)
+        self.assertEqual(self.ev.evaluate_batch(self.recs, self.truth, k=10), want)
+        # chunked across a process pool gives the same numbers
+        self.assertEqual(self.ev.evaluate_batch(self.recs, self.truth, k=10, workers=2, chunk=40), want)
+
+    def test_no_valid_users(self):
+        self.assertIn("error", self.ev.evaluate_batch({"u1": ["i1"]}, {}))
+
+class TestLoadTest(unittest.TestCase):
+    def test_zipf_is_skewed_and_reproducible(self):
+        users = [f"u{i}" for i in range(100)]
+        sa, sb = zipf_sampler(users, 1.1, seed=3), zipf_sampler(users, 1.1, seed=3)
+        a = [sa() for _ in range(2000)]
+        b = [sb() for _ in range(2000)]
+        self.assertEqual(a, b)
+        # rank 1 should get far more than an even 1% share
+        self.assertGreater(a.count("u0"), 10 * a.count("u50") + 100)
+
+    def test_report_percentiles(self):
+        lt = LoadTest("http://x", ["u1"], ["c1"])
+        lt.lat["recommend"] = [float(v) for v in range(1, 101)]
+        lt.errors = 2
+        res = lt.report(wall=2.0)
+        self.assertEqual(res["requests"], 100)
+        self.assertEqual(res["throughput_rps"], 50.0)
+        self.assertEqual(res["error_rate"], 0.02)
+        self.assertEqual((res["all"]["p50"], res["all"]["p99"], res["all"]["max"]), (51.0, 100.0, 100.0))
+        self.assertEqual(percentile([], 0.5), 0.0)
+
+class TestBenchCompare(unittest.TestCase):
+    def test_flags_only_real_regressions(self):
+        base = {"1k": {"a": {"ms": 100.0, "peak_kb": 10_000}, "b": {"ms": 1.0, "peak_kb": 100}}}
+        ok = {"1k": {"a": {"ms": 125.0, "peak_kb": 11_000}, "b": {"ms": 3.0, "peak_kb": 400}, "new": {"ms": 9.0}}}
+        self.assertEqual(compare(ok, base), [])
+        bad = compare({"1k": {"a": {"ms": 150.0, "peak_kb": 20_000}}}, base)
+        self.assertEqual(len(bad), 2)
+        self.assertIn("+50%", bad[0])
+
+    def test_measure(self):
+        r = measure(lambda: bytearray(2 * 1024 * 1024), repeat=2)
+        self.assertGreaterEqual(r["peak_kb"], 2048)
+        self.assertIn("ms", measure(lambda: None, mem=False))
+
+if __name__ == '__main__':
+    unittest.main()